@@ -13,12 +13,12 @@ import streamlit as st
 import os
 import sys
 import time
-import traceback
-import base64
+import json
+import uuid
 import logging
 import streamlit.components.v1 as components
 from pathlib import Path
-from config.config import LOG_LEVEL, LOG_DIR, SUPPORTED_AUDIO_FORMATS, FFMPEG_BIN_DIR
+from config.config import LOG_LEVEL, LOG_DIR, SUPPORTED_AUDIO_FORMATS, FFMPEG_BIN_DIR, JOB_POLL_INTERVAL_SEC
 
 logging.basicConfig(level=getattr(logging, LOG_LEVEL, logging.INFO),
     format="%(asctime)s [%(levelname)-5s] %(name)s — %(message)s")
@@ -26,7 +26,7 @@ log = logging.getLogger(__name__)
 
 # --- BOOTSTRAP: FFmpeg & Environment ---
 # We inject the local 'bin' folder (containing ffmpeg.exe) into the PATH 
-# variable so that libraries like 'pydub' and 'demucs' can find it.
+# variable so that the preview encoder and 'demucs' can find it.
 if getattr(sys, 'frozen', False):
     # Running as a PyInstaller bundle
     base_path = Path(sys.executable).parent
@@ -92,17 +92,31 @@ st.markdown("""
 # --- INTERNAL IMPORTS ---
 # Imports are done after PATH setup to ensure sub-dependencies find FFmpeg
 import src.audio_processor
-from src.audio_processor import separate_audio, mix_stems, transcribe_audio
+from src.audio_processor import get_custom_mix, transcribe_audio, get_derived_stem_status, materialize_derived_stem
+import src.jobs
+from src.jobs import submit_separation, get_job, collect_job, DONE, FAILED
 import src.music_theory
 from src.music_theory import (
-    estimate_key, identify_raga, detect_chords_over_time, 
+    estimate_key, identify_raga, detect_chord_segments, 
     note_to_swaras, midi_to_western, format_swara_sequence
 )
 import src.utils
-from src.utils import UPLOAD_DIR, setup_dirs, save_uploaded_file, get_output_path, create_preview_audio
+from src.utils import UPLOAD_DIR, setup_dirs, save_uploaded_file, create_preview_audio, submit_previews
+from src.cache import get_cache_stats, CACHE_ROOT
+from src import media_server
+from src.stem_matrix import get_stem_matrix
+from src.stem_mixer import stem_mixer
+from src.decode import get_decode_stats
+from src.features import get_feature_stats
+from src.analysis_cache import get_analysis_cache_stats
+from src.peaks import get_peaks
 
 # Initialize directory structure (uploads, outputs, etc.)
 setup_dirs()
+# Where the deployment exposes it, stems, previews and downloads are fetched by per-session URL from
+# this server (once per process); otherwise they go through Streamlit
+if media_server.is_enabled():
+    media_server.ensure_started({"outputs": CACHE_ROOT, "uploads": UPLOAD_DIR})
 
 # --- SESSION STATE INITIALIZATION ---
 # Streamlit keeps the state in 'st.session_state'. 
@@ -113,18 +127,47 @@ if "original_audio" not in st.session_state:
     st.session_state.original_audio = None # Path to uploaded file
 if "analysis_results" not in st.session_state:
     st.session_state.analysis_results = None
+if "separation_job" not in st.session_state:
+    st.session_state.separation_job = None  # Job id of the running background separation
+if "media_session" not in st.session_state:
+    st.session_state.media_session = uuid.uuid4().hex  # Owner of this browser session's media URLs
+if "separation_error" not in st.session_state:
+    st.session_state.separation_error = None  # {error, traceback} of a failed separation until dismissed
+if "stems_expired" not in st.session_state:
+    st.session_state.stems_expired = False  # The cache evicted this session's stems
 
 def reset_session_state():
     """Callback fired when a new file is uploaded to prevent old stems from showing."""
     st.session_state.stems = {}
     st.session_state.analyze_target = None
     st.session_state.analysis_results = None
+    st.session_state.separation_job = None
+    st.session_state.separation_error = None
+    st.session_state.separation_summary = None
+    st.session_state.stems_expired = False
+    # URLs handed out for the previous track stop working
+    media_server.revoke_session(st.session_state.media_session)
+
+def drop_expired_stems():
+    """
+    Forgets this session's stems once the cache has evicted any of them (LRU budget), so nothing
+    tries to read them. Returns True if they were dropped.
+    """
+    stems = st.session_state.get("stems") or {}
+    if any(not os.path.exists(path) for name, path in stems.items() if name != "Custom Mix"):
+        st.session_state.stems = {}
+        st.session_state.separation_summary = None
+        st.session_state.stems_expired = True
+        return True
+    return False
 
 def render_wavesurfer(audio_path, key):
-    preview_path = create_preview_audio(audio_path)
+    # The waveform is drawn from precomputed peaks (a few KB); the audio is only attached on first play.
+    # With the media server it is a URL, so reruns send nothing but the peaks; without it the preview
+    # is inlined into the player (the stem mixer below doesn't send it again).
     try:
-        with open(preview_path, "rb") as f:
-            b64_audio = base64.b64encode(f.read()).decode()
+        peaks, duration = get_peaks(audio_path)
+        audio_url = media_server.media_src(create_preview_audio(audio_path), st.session_state.media_session)
     except Exception as e:
         st.error(f"Failed to load audio for preview: {e}")
         return
@@ -151,6 +194,8 @@ def render_wavesurfer(audio_path, key):
         </div>
         
         <script>
+            const peaks = PEAKS_DATA;
+            const duration = DURATION_SEC;
             const wavesurfer = WaveSurfer.create({
                 container: '#waveform-KEY',
                 waveColor: '#ff7b93',
@@ -160,14 +205,22 @@ def render_wavesurfer(audio_path, key):
                 cursorColor: '#FF4B2B',
                 height: 80,
                 normalize: true,
-                url: 'data:audio/mp3;base64,B64_AUDIO_DATA'
+                peaks: [peaks],
+                duration: duration
             });
 
             const btn = document.getElementById('play-KEY');
             const timeEl = document.getElementById('time-KEY');
 
-            wavesurfer.on('interaction', () => wavesurfer.play());
-            btn.addEventListener('click', () => wavesurfer.playPause());
+            // Attach the audio on first play; passing the peaks again skips wavesurfer's own decode
+            let loading = null;
+            const ensureAudio = () => loading || (loading = wavesurfer.load(AUDIO_URL, [peaks], duration));
+
+            wavesurfer.on('interaction', (newTime) => ensureAudio().then(() => {
+                wavesurfer.setTime(newTime);
+                wavesurfer.play();
+            }));
+            btn.addEventListener('click', () => ensureAudio().then(() => wavesurfer.playPause()));
             
             const formatTime = (seconds) => {
                 const mins = Math.floor(seconds / 60);
@@ -176,19 +229,41 @@ def render_wavesurfer(audio_path, key):
             };
 
             wavesurfer.on('audioprocess', () => {
-                timeEl.textContent = formatTime(wavesurfer.getCurrentTime()) + ' / ' + formatTime(wavesurfer.getDuration());
+                timeEl.textContent = formatTime(wavesurfer.getCurrentTime()) + ' / ' + formatTime(duration);
             });
             
-            wavesurfer.on('ready', () => {
-                timeEl.textContent = '0:00 / ' + formatTime(wavesurfer.getDuration());
-            });
+            timeEl.textContent = '0:00 / ' + formatTime(duration);
         </script>
     </body>
     </html>
     """
-    html = html_template.replace("KEY", key).replace("B64_AUDIO_DATA", b64_audio)
+    html = (html_template.replace("KEY", key).replace("PEAKS_DATA", json.dumps(peaks))
+            .replace("DURATION_SEC", f"{duration:.3f}").replace("AUDIO_URL", json.dumps(audio_url)))
     components.html(html, height=130)
 
+def render_download(audio_path, label, file_name, key):
+    if media_server.is_enabled():
+        # A link: the WAV only travels when clicked, straight from the media server
+        st.link_button(
+            label,
+            media_server.media_url(audio_path, st.session_state.media_session, download_name=file_name),
+            use_container_width=True
+        )
+    else:
+        try:
+            with open(audio_path, "rb") as f:
+                st.download_button(
+                    label=label,
+                    data=f,
+                    file_name=file_name,
+                    mime="audio/wav",
+                    key=key,
+                    use_container_width=True
+                )
+        except FileNotFoundError:
+            # Evicted from the cache since the page was last drawn
+            st.caption("Expired")
+
 # --- UI HEADER ---
 st.title("🎵 AI Music Separator & Raga Identifier")
 st.markdown("""
@@ -205,9 +280,13 @@ uploaded_file = st.file_uploader(
 )
 
 if uploaded_file is not None:
-    # Persistent storage of the uploaded file
-    file_path = save_uploaded_file(uploaded_file)
-    st.session_state.original_audio = file_path
+    # Persistent storage of the uploaded file (once per upload, not on every rerun)
+    if st.session_state.get("uploaded_file_id") != uploaded_file.file_id or not st.session_state.original_audio:
+        st.session_state.original_audio = save_uploaded_file(uploaded_file)
+        # Encode the player preview in the background while the page renders
+        submit_previews([st.session_state.original_audio])
+        st.session_state.uploaded_file_id = uploaded_file.file_id
+    file_path = st.session_state.original_audio
     
     render_wavesurfer(str(file_path), key="original")
     st.success(f"File ready: {uploaded_file.name}")
@@ -224,9 +303,22 @@ if uploaded_file is not None:
         st.markdown("**System Status**")
         if st.session_state.get("stems"):
             st.success("Stems Separated")
+        elif st.session_state.get("separation_job"):
+            st.info("Separation running in background...")
         else:
             st.info("Waiting for Separation...")
 
+        cache_stats = get_cache_stats()
+        with st.expander("Stem Cache"):
+            st.caption(
+                f"{cache_stats['entries']} entries · {cache_stats['size_bytes'] / 1e9:.2f} / "
+                f"{cache_stats['max_bytes'] / 1e9:.0f} GB"
+            )
+            st.caption(
+                f"Hits {cache_stats['hits']} · Misses {cache_stats['misses']} · "
+                f"Evictions {cache_stats['evictions']}"
+            )
+
     # --- MAIN ACTION AREA ---
     tab_sep, tab_ana = st.tabs(["🎛️ Separate Tracks", "🎼 Analyze Music"])
     
@@ -239,28 +331,86 @@ if uploaded_file is not None:
             run_separator = st.button("Run AI Separator (Demucs 6s + DSP)", use_container_width=True, type="primary")
             
         if run_separator:
-            with st.spinner("Processing audio... This uses MD5 caching for speed."):
-                try:
-                    start_time = time.time()
-                    stem_paths = separate_audio(file_path)
-                    elapsed = time.time() - start_time
-                    st.session_state.stems = stem_paths
-                    
-                    if elapsed < 2.0:
-                        st.success(f"Restored from Cache ({elapsed:.2f}s)!")
-                    else:
-                        st.success(f"Separation Complete ({elapsed:.2f}s)!")
-                except Exception as e:
-                    st.error(f"Separation failed: {e}")
-                    st.code(traceback.format_exc())
+            # Queue the work on the shared worker pool; this script run returns immediately
+            st.session_state.separation_error = None
+            st.session_state.stems_expired = False
+            st.session_state.separation_job = submit_separation(file_path)
+
+        # Polls only while a job is pending; the fragment reruns the page when it finishes
+        @st.fragment(run_every=JOB_POLL_INTERVAL_SEC if st.session_state.get("separation_job") else None)
+        def poll_separation_job():
+            job_id = st.session_state.get("separation_job")
+            job = get_job(job_id) if job_id else None
+            if job is None:
+                return
+
+            if job["status"] in (DONE, FAILED):
+                # Releases the job record; everything the UI needs is kept in the session
+                job = collect_job(job_id) or job
+                st.session_state.separation_job = None
+                if job["status"] == DONE:
+                    st.session_state.stems = job["result"]
+                    st.session_state.separation_summary = job
+                else:
+                    st.session_state.separation_error = {"error": job["error"], "traceback": job["traceback"]}
+                st.rerun()
+            else:
+                waited = time.time() - job["submitted_at"]
+                st.progress(job["progress"], text=f"{job['stage']} ({waited:.0f}s) — you can keep using the app.")
+
+        poll_separation_job()
+
+        drop_expired_stems()
+        if st.session_state.stems_expired:
+            st.warning("This track's stems have expired from the cache. Run the separator again to restore them.")
+
+        failure = st.session_state.get("separation_error")
+        if failure:
+            st.error(f"Separation failed: {failure['error']}")
+            if failure["traceback"]:
+                with st.expander("Error details"):
+                    st.code(failure["traceback"], language="text")
+            if st.button("Dismiss", key="dismiss_separation_error"):
+                st.session_state.separation_error = None
+                st.rerun()
+
+        summary = st.session_state.get("separation_summary")
+        if summary and st.session_state.stems:
+            elapsed = summary["finished_at"] - summary["submitted_at"]
+            sep_stats = summary["stats"] or {}
+            if sep_stats.get("cache_hit"):
+                st.success(f"Restored from Cache ({elapsed:.2f}s)!")
+            else:
+                st.success(f"Separation Complete ({elapsed:.2f}s)!")
+                if "inference_sec" in sep_stats:
+                    st.caption(
+                        f"Model {sep_stats['model']} ({sep_stats['model_state']}, {sep_stats.get('device', 'cpu')}): "
+                        f"load {sep_stats['model_load_sec']:.2f}s · decode {sep_stats['decode_sec']:.2f}s · "
+                        f"inference {sep_stats['inference_sec']:.2f}s · write {sep_stats['write_sec']:.2f}s"
+                    )
+                if sep_stats.get("dsp_stage_sec"):
+                    stage_times = " · ".join(
+                        f"{name.replace('_', ' ')} {sec:.2f}s" for name, sec in sep_stats["dsp_stage_sec"].items()
+                    )
+                    st.caption(f"Derived stems: {sep_stats['dsp_sec']:.2f}s wall ({stage_times})")
 
         if st.session_state.stems:
             st.divider()
             st.subheader("🎚️ Separated Tracks")
-            st.info("Adjust which tracks to include in your custom mix (e.g., for Karaoke). Download individual tracks via the buttons.")
+            st.info("Build your custom mix (e.g., for Karaoke) in the mixer below. Download individual tracks via the buttons.")
+            live_remix = st.toggle(
+                "Live remix", key="live_remix",
+                help="Mixes on the server instead of in the browser: keeps this track's stems in one memory-mapped array so the mix updates as soon as a track setting changes."
+            )
+
+            def mark_remix():
+                st.session_state.remix_dirty = True
             
             @st.fragment
             def render_stem_row(stem_name, stem_path):
+                # Mix settings live in this fragment; in live mode a change re-renders the mix below
+                if (st.session_state.get("live_remix") and st.session_state.pop("remix_dirty", False)) or drop_expired_stems():
+                    st.rerun()
                 with st.container(border=True):
                     # Responsive columns for each track row
                     row_col1, row_col2, row_col3 = st.columns([1.5, 4, 1])
@@ -268,59 +418,120 @@ if uploaded_file is not None:
                     with row_col1:
                         display_name = stem_name.replace("_", " ").title()
                         st.markdown(f"**{display_name}**")
-                        st.checkbox("Include in Mix", value=True, key=f"mix_{stem_name}")
+                        if st.session_state.get("live_remix"):
+                            st.checkbox("Include in Mix", value=True, key=f"mix_{stem_name}", on_change=mark_remix)
+                            st.slider("Gain (dB)", -24, 12, 0, key=f"gain_{stem_name}", on_change=mark_remix)
+                            st.slider("Pan", -1.0, 1.0, 0.0, step=0.1, key=f"pan_{stem_name}", on_change=mark_remix)
                         
                     with row_col2:
                         render_wavesurfer(str(stem_path), key=f"stem_{stem_name}")
                         
                     with row_col3:
-                        with open(stem_path, "rb") as f:
-                            st.download_button(
-                                label="⬇️ Download",
-                                data=f,
-                                file_name=f"{stem_name}.wav",
-                                mime="audio/wav",
-                                key=f"dl_{stem_name}",
-                                use_container_width=True
-                            )
+                        render_download(stem_path, "⬇️ Download", f"{stem_name}.wav", key=f"dl_{stem_name}")
+
+            # DSP-derived stems are only computed when asked for; finished ones join the list
+            derived_status = get_derived_stem_status(st.session_state.original_audio)
+            for stem_name, (status, stem_path) in derived_status.items():
+                if status == "ready" and stem_name not in st.session_state.stems:
+                    st.session_state.stems[stem_name] = str(stem_path)
 
             for stem_name, stem_path in list(st.session_state.stems.items()):
                 if stem_name == "Custom Mix": continue
                 render_stem_row(stem_name, stem_path)
+
+            for stem_name, (status, _) in derived_status.items():
+                if status != "on_demand":
+                    continue
+                with st.container(border=True):
+                    row_col1, row_col2 = st.columns([1.5, 5])
+                    with row_col1:
+                        st.markdown(f"**{stem_name.replace('_', ' ').title()}**")
+                        st.caption("Available on demand")
+                    with row_col2:
+                        if st.button("Extract", key=f"derive_{stem_name}", help="Runs the DSP extraction for this track once; the result is cached"):
+                            with st.spinner(f"Extracting {stem_name.replace('_', ' ')}..."):
+                                derived_path = materialize_derived_stem(st.session_state.original_audio, stem_name)
+                            if derived_path is not None:
+                                st.session_state.stems[stem_name] = str(derived_path)
+                                st.rerun()
+                            else:
+                                st.warning("The stems this track needs are no longer available.")
                             
             st.markdown("---")
-            if st.button("Generate & Play Custom Mix", use_container_width=True):
-                selected_paths = [
-                    st.session_state.stems[s] 
-                    for s in st.session_state.stems.keys() 
-                    if s != "Custom Mix" and st.session_state.get(f"mix_{s}", True)
-                ]
-                if selected_paths:
-                    output_mix = get_output_path("mixes") / "custom_mix.wav"
-                    mix_stems(selected_paths, output_mix)
-                    st.session_state.stems["Custom Mix"] = str(output_mix) 
-                else:
+            st.markdown("### 🎧 Your Custom Mix")
+
+            def render_live_remix():
+                # Server-side mixing on every change, from one memory-mapped matrix of the track's stems
+                mix_sources = {s: p for s, p in st.session_state.stems.items() if s != "Custom Mix"}
+                selected = [s for s in mix_sources if st.session_state.get(f"mix_{s}", True)]
+                if not selected:
                     st.warning("Please select at least one track to mix.")
-                    
-            if "Custom Mix" in st.session_state.stems:
-                st.markdown("### 🎧 Your Custom Mix")
-                custom_mix_path = st.session_state.stems["Custom Mix"]
+                    return
+                with st.spinner("Preparing live remix..."):
+                    matrix = get_stem_matrix(mix_sources)
+                mix_start = time.perf_counter()
+                # Content-addressed: identical selections reuse the cached mix, sessions never share a file
+                output_mix, mix_hit = get_custom_mix(
+                    [mix_sources[s] for s in selected],
+                    gains=[10 ** (st.session_state.get(f"gain_{s}", 0) / 20) for s in selected],
+                    pans=[st.session_state.get(f"pan_{s}", 0.0) for s in selected],
+                    matrix=matrix,
+                )
+                st.caption(f"Remixed in {(time.perf_counter() - mix_start) * 1000:.0f} ms" + (" (cached)" if mix_hit else ""))
+                if output_mix is None:
+                    st.warning("None of the selected tracks could be read.")
+                    return
+                st.session_state.stems["Custom Mix"] = str(output_mix)
                 with st.container(border=True):
                     row_col1, row_col2, row_col3 = st.columns([1.5, 4, 1])
                     with row_col1:
                         st.markdown("**Custom Mix**")
                     with row_col2:
-                        render_wavesurfer(str(custom_mix_path), key="custom_mix")
+                        render_wavesurfer(str(output_mix), key="custom_mix")
                     with row_col3:
-                        with open(custom_mix_path, "rb") as f:
-                            st.download_button(
-                                label="⬇️ Download Mix",
-                                data=f,
-                                file_name="Custom-Mix.wav",
-                                mime="audio/wav",
-                                key="dl_custom_mix",
-                                use_container_width=True
+                        render_download(output_mix, "⬇️ Download Mix", "Custom-Mix.wav", key="dl_custom_mix")
+
+            @st.fragment
+            def render_mixer():
+                # Reruns on its own, so the stems may have been evicted since the page was drawn
+                if drop_expired_stems():
+                    st.rerun()
+                mix_sources = {s: p for s, p in st.session_state.stems.items() if s != "Custom Mix"}
+                # Mute / gain / pan are applied in the browser; the server only hears about a download
+                request = stem_mixer(mix_sources, st.session_state.media_session, key="stem_mixer")
+                if request and request.get("nonce") != st.session_state.get("mix_request_nonce"):
+                    st.session_state.mix_request_nonce = request["nonce"]
+                    selected = [
+                        s for s, cfg in request["settings"].items()
+                        if s in mix_sources and not cfg["muted"]
+                    ]
+                    if selected:
+                        with st.spinner("Rendering full-quality mix..."):
+                            # Content-addressed: identical settings reuse the cached mix, sessions never share a file.
+                            # Streamed block by block: one download never holds all stems in memory.
+                            output_mix, _ = get_custom_mix(
+                                [mix_sources[s] for s in selected],
+                                gains=[10 ** (request["settings"][s]["gain_db"] / 20) for s in selected],
+                                pans=[request["settings"][s]["pan"] for s in selected],
                             )
+                        if output_mix is not None:
+                            st.session_state.stems["Custom Mix"] = str(output_mix)
+                        else:
+                            st.warning("None of the selected tracks could be read.")
+                    else:
+                        st.warning("Please include at least one track in the mix.")
+
+                # The cache may have evicted an old mix; it is rendered again on the next request
+                custom_mix_path = st.session_state.stems.get("Custom Mix")
+                if custom_mix_path and os.path.exists(custom_mix_path):
+                    render_download(custom_mix_path, "⬇️ Save Full-Quality Mix (WAV)", "Custom-Mix.wav", key="dl_custom_mix")
+                elif custom_mix_path:
+                    del st.session_state.stems["Custom Mix"]
+
+            if live_remix:
+                render_live_remix()
+            else:
+                render_mixer()
 
     with tab_ana:
         # --- SECTION 3: MUSIC THEORY ANALYSIS ---
@@ -337,14 +548,27 @@ if uploaded_file is not None:
                 if k not in ["Original", "Custom Mix"]
             ])
             
-        col_opt, col_go = st.columns([3, 1])
+        # Melody tracker: None keeps transcribe_audio's default (Basic Pitch, else RAGAM_PITCH_TRACKER)
+        pitch_modes = {"Melody: Default": None, "Melody: Fast (YIN)": "yin", "Melody: Accurate (pYIN)": "pyin"}
+        col_opt, col_mode, col_go = st.columns([2, 1, 1])
         with col_opt:
             target_stem = st.selectbox(
                 "Track to Analyze", analysis_options, 
                 index=0, label_visibility="collapsed"
             )
+        with col_mode:
+            pitch_mode_label = st.selectbox(
+                "Melody Tracker", list(pitch_modes),
+                index=0, label_visibility="collapsed",
+                help="Fast (YIN) transcribes in well under a second but makes more octave errors; "
+                     "Accurate (pYIN) smooths the pitch track and takes several seconds per minute of audio.",
+            )
         with col_go:
             analyze_clicked = st.button("Run Analysis", type="primary", use_container_width=True)
+        full_track = st.checkbox(
+            "Transcribe the full track",
+            help="Tracks the melody of the whole recording in parallel windows instead of its first minute.",
+        )
         
         if analyze_clicked:
             target_path = (
@@ -354,6 +578,15 @@ if uploaded_file is not None:
             )
             
             with st.status(f"Processing '{target_stem}'...", expanded=True) as status:
+                analysis_start = time.perf_counter()
+                decode_before = get_decode_stats()["decode_sec"]
+                features_before = get_feature_stats()
+                stored_before = get_analysis_cache_stats()["hits"]
+                # The chord timeline covers the longest range (up to CHORD_TIMELINE_MAX_SEC), so it goes
+                # first: the key's first minute of chroma is then a slice of it, not a second CQT
+                st.write("Analyzing Harmony / Chords...")
+                chord_segments = detect_chord_segments(target_path)
+                
                 st.write("Detecting Tonic / Key...")
                 tonic_idx, tonic_name, chroma_mean = estimate_key(target_path)
                 
@@ -361,18 +594,31 @@ if uploaded_file is not None:
                 raga_info, scale_indices = identify_raga(chroma_mean, tonic_idx)
                 
                 st.write("Transcribing Melodic Line...")
-                mid_path, note_events = transcribe_audio(target_path)
-                
-                st.write("Analyzing Harmony / Chords...")
-                times, chords = detect_chords_over_time(target_path, duration=30)
+                mid_path, note_events = transcribe_audio(
+                    target_path, pitch_mode=pitch_modes[pitch_mode_label], full_track=full_track
+                )
                 
                 st.session_state.analysis_results = {
                     "tonic_name": tonic_name,
                     "tonic_idx": tonic_idx,
                     "raga_info": raga_info,
-                    "chords": chords,
+                    "chord_segments": chord_segments,
                     "note_events": note_events,
-                    "target_stem": target_stem
+                    "target_stem": target_stem,
+                }
+                # Decoding is shared across the steps above, so report it apart from compute
+                decode_sec = get_decode_stats()["decode_sec"] - decode_before
+                features_after = get_feature_stats()
+                feature_sec = {
+                    name: features_after[f"{name}_sec"] - features_before[f"{name}_sec"] for name in ("cqt", "chroma")
+                }
+                st.session_state.analysis_results["timings"] = {
+                    "decode_sec": decode_sec,
+                    "feature_sec": feature_sec,
+                    "feature_reuses": features_after["hits"] - features_before["hits"],
+                    # Results loaded from the on-disk analysis cache instead of computed
+                    "stored_hits": get_analysis_cache_stats()["hits"] - stored_before,
+                    "compute_sec": time.perf_counter() - analysis_start - decode_sec - sum(feature_sec.values()),
                 }
                 
                 status.update(label="Analysis Done!", state="complete", expanded=True)
@@ -381,6 +627,15 @@ if uploaded_file is not None:
         if results:
             st.markdown("---")
             st.markdown(f"**Analysis Results for Track:** `{results['target_stem']}`")
+            if results.get("timings"):
+                timings = results["timings"]
+                st.caption(
+                    f"Decode {timings['decode_sec']:.1f}s · "
+                    f"CQT {timings['feature_sec']['cqt']:.1f}s · chroma {timings['feature_sec']['chroma']:.2f}s "
+                    f"(reused {timings['feature_reuses']}x) · "
+                    f"Other analysis {timings['compute_sec']:.1f}s · "
+                    f"{timings.get('stored_hits', 0)} result(s) from cache"
+                )
             
             # --- RESULTS LAYOUT ---
             st.info(f"**Detected Tonic (Sa)**: {results['tonic_name']}")
@@ -395,13 +650,18 @@ if uploaded_file is not None:
             else:
                 st.warning("**Raga**: No confident match found in current database.")
 
-            chord_seq = " ➔ ".join([
-                c for i, c in enumerate(results['chords']) 
-                if i == 0 or c != results['chords'][i-1]
-            ])
+            # Results from before the chord timeline have no segments
+            chord_segments = results.get("chord_segments", [])
+            chord_seq = " ➔ ".join(chord for _, _, chord in chord_segments)
             st.markdown("### 🎹 Harmonic Core")
             st.markdown("**Core Chord Progression**")
-            st.info(chord_seq)
+            st.info(chord_seq or "No chords detected.")
+            if chord_segments:
+                with st.expander("Chord Timeline"):
+                    st.dataframe([
+                        {"Time (s)": f"{start:.2f}-{end:.2f}", "Chord": chord}
+                        for start, end, chord in chord_segments
+                    ], use_container_width=True)
 
             # Melodic Data Display
             if len(results['note_events']) > 0:
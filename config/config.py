@@ -3,15 +3,39 @@ Version: 1.1.0 | Updated: 2026-03-26
 Domain Agent: Music_Strategist_Agent reviewed
 """
 import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv()
 
+# Relative data paths resolve against the app folder (next to the executable in a PyInstaller
+# bundle), never the current working directory.
+PROJECT_ROOT: Path = (
+    Path(sys.executable).parent if getattr(sys, "frozen", False) else Path(__file__).resolve().parent.parent
+)
+
 # ── Audio Processing ──────────────────────────────────────────────────────────
 DEMUCS_MODEL: str = os.getenv("RAGAM_DEMUCS_MODEL", "htdemucs_6s")
+DEMUCS_SHIFTS: int = int(os.getenv("RAGAM_DEMUCS_SHIFTS", "1"))
+DEMUCS_OVERLAP: float = float(os.getenv("RAGAM_DEMUCS_OVERLAP", "0.25"))
 SUPPORTED_AUDIO_FORMATS: list[str] = ["mp3", "wav", "m4a", "flac", "ogg"]
 ANALYSIS_DURATION_SEC: int = int(os.getenv("RAGAM_ANALYSIS_DURATION", "30"))
 
 # ── Stem Separation ───────────────────────────────────────────────────────────
+# Recordings longer than CHUNKED_SEPARATION_MIN_SEC are separated window-by-window
+# so memory stays bounded (full kutcheris run 1–3 hours).
+SEPARATION_CHUNK_SEC: float = float(os.getenv("RAGAM_SEPARATION_CHUNK_SEC", "60"))
+SEPARATION_CHUNK_OVERLAP_SEC: float = float(os.getenv("RAGAM_SEPARATION_CHUNK_OVERLAP_SEC", "2"))
+CHUNKED_SEPARATION_MIN_SEC: float = float(os.getenv("RAGAM_CHUNKED_SEPARATION_MIN_SEC", "600"))
+
+# ── Separation Workers ────────────────────────────────────────────────────────
+# Worker processes shared by all sessions (0 = run jobs on one in-process thread).
+# Threads per worker of 0 splits the machine's cores evenly across workers.
+SEPARATION_WORKERS: int = int(os.getenv("RAGAM_SEPARATION_WORKERS", "1"))
+SEPARATION_THREADS_PER_WORKER: int = int(os.getenv("RAGAM_SEPARATION_THREADS_PER_WORKER", "0"))
+# A separation lock file not refreshed for this long is assumed orphaned by a crashed worker.
+SEPARATION_LOCK_STALE_SEC: float = float(os.getenv("RAGAM_SEPARATION_LOCK_STALE_SEC", "120"))
+JOB_POLL_INTERVAL_SEC: float = float(os.getenv("RAGAM_JOB_POLL_INTERVAL_SEC", "1.0"))
 STEM_NAMES: list[str] = ["vocals", "bass", "drums", "piano", "guitar", "other"]
 CUSTOM_STEMS: list[str] = ["flute", "percussion"]
 
@@ -19,12 +43,44 @@ CUSTOM_STEMS: list[str] = ["flute", "percussion"]
 FLUTE_BANDPASS_LOW_HZ: int = int(os.getenv("RAGAM_FLUTE_LOW_HZ", "250"))
 FLUTE_BANDPASS_HIGH_HZ: int = int(os.getenv("RAGAM_FLUTE_HIGH_HZ", "3500"))
 HARMONIC_MARGIN: float = float(os.getenv("RAGAM_HARMONIC_MARGIN", "1.2"))
+PERCUSSION_MARGIN: float = float(os.getenv("RAGAM_PERCUSSION_MARGIN", "2.0"))
+# Threads running the derived-stem extractors concurrently (0 = one per core, 1 = sequential).
+# Memory trade-off: the flute and percussion stages each hold the HPSS intermediates of the stem
+# they are reading (roughly 5x its decoded audio, freed right after its last use), so running them
+# in parallel can briefly hold two stems' worth. On multi-hour recordings with little RAM, use 1.
+DSP_WORKERS: int = int(os.getenv("RAGAM_DSP_WORKERS", "0"))
 CLAHE_TILE_GRID: tuple[int, int] = (8, 8)
 MORPHOLOGICAL_KERNEL: tuple[int, int] = (15, 15)
 
 # ── Caching ──────────────────────────────────────────────────────────────────
-CACHE_DIR: str = os.getenv("RAGAM_CACHE_DIR", "outputs/cache")
+# Root of the content-addressed cache (separated stems, mixes). Entries carry a manifest.json;
+# once the total exceeds the budget, least recently used entries are evicted.
+CACHE_DIR: str = str(PROJECT_ROOT / os.getenv("RAGAM_CACHE_DIR", "data/outputs"))
 USE_CACHE: bool = os.getenv("RAGAM_USE_CACHE", "true").lower() == "true"
+CACHE_MAX_BYTES: int = int(float(os.getenv("RAGAM_CACHE_MAX_GB", "20")) * 1024**3)
+# In-memory decoded PCM shared by analysis and DSP (see src/decode.py); LRU beyond this size.
+DECODE_CACHE_MAX_BYTES: int = int(float(os.getenv("RAGAM_DECODE_CACHE_MB", "512")) * 1024**2)
+
+# ── Media Server ──────────────────────────────────────────────────────────────
+# With MEDIA_BASE_URL set (the public URL routed to the server, e.g. a reverse-proxied path),
+# stems, previews and mixes are served to the browser by per-session URLs from a small HTTP
+# server (see src/media_server.py). Unset, audio is sent inline and downloads go through Streamlit.
+# MEDIA_ALLOW_ORIGIN: the app's origin, when the media URL is on another one (the mixer fetches).
+MEDIA_SERVER_HOST: str = os.getenv("RAGAM_MEDIA_HOST", "127.0.0.1")
+MEDIA_SERVER_PORT: int = int(os.getenv("RAGAM_MEDIA_PORT", "8502"))
+MEDIA_BASE_URL: str = os.getenv("RAGAM_MEDIA_BASE_URL", "")
+MEDIA_ALLOW_ORIGIN: str = os.getenv("RAGAM_MEDIA_ALLOW_ORIGIN", "").rstrip("/")
+
+# ── UI Previews ───────────────────────────────────────────────────────────────
+# Small mono previews the browser plays (see utils.create_preview_audio). "opus" is about half the
+# size of "mp3" at the same quality; older Safari versions can't play it.
+PREVIEW_FORMAT: str = os.getenv("RAGAM_PREVIEW_FORMAT", "mp3").lower()
+if PREVIEW_FORMAT not in ("mp3", "opus"):
+    # Fail at startup, not at the first encode
+    raise ValueError(f"RAGAM_PREVIEW_FORMAT must be 'mp3' or 'opus', got '{PREVIEW_FORMAT}'")
+PREVIEW_BITRATE_KBPS: int = int(os.getenv("RAGAM_PREVIEW_BITRATE_KBPS", "64" if PREVIEW_FORMAT == "mp3" else "32"))
+# ffmpeg encoder processes running at once (0 = one per core, at most 4).
+PREVIEW_WORKERS: int = int(os.getenv("RAGAM_PREVIEW_WORKERS", "0"))
 
 # ── Output ────────────────────────────────────────────────────────────────────
 OUTPUT_DIR: str = os.getenv("RAGAM_OUTPUT_DIR", "outputs")
@@ -36,6 +92,21 @@ FFMPEG_BIN_DIR: str = os.getenv("RAGAM_FFMPEG_DIR", "bin")
 
 # ── Raga Analysis ─────────────────────────────────────────────────────────────
 MIN_RAGA_CONFIDENCE: float = float(os.getenv("RAGAM_MIN_CONFIDENCE", "0.3"))
+# Chord set for chord detection: "majmin" (24 triads), "sevenths" (+ dom7/maj7/min7), "full" (+ sus, power).
+CHORD_VOCABULARY: str = os.getenv("RAGAM_CHORD_VOCABULARY", "majmin")
+# Pitch tracker used when Basic Pitch isn't installed: "pyin" (accurate, several seconds per
+# minute of audio) or "yin" (vectorized YIN, sub-second, more octave errors / voicing slips).
+PITCH_TRACKER: str = os.getenv("RAGAM_PITCH_TRACKER", "pyin")
+# Full-track transcription: windows tracked in parallel worker processes (0 = one per core), each
+# with this much audio on both sides as context for the tracker.
+TRANSCRIPTION_WINDOW_SEC: float = float(os.getenv("RAGAM_TRANSCRIPTION_WINDOW_SEC", "30"))
+TRANSCRIPTION_OVERLAP_SEC: float = float(os.getenv("RAGAM_TRANSCRIPTION_OVERLAP_SEC", "2"))
+TRANSCRIPTION_WORKERS: int = int(os.getenv("RAGAM_TRANSCRIPTION_WORKERS", "0"))
+# Pitch drift (cents beyond the half semitone) tolerated before a new note starts, so gamakas
+# don't split one swara into many short notes (0 = split at every semitone boundary).
+NOTE_HYSTERESIS_CENTS: float = float(os.getenv("RAGAM_NOTE_HYSTERESIS_CENTS", "30"))
+# Seconds of a track the chord timeline covers (0 = the whole track); its cost grows linearly.
+CHORD_TIMELINE_MAX_SEC: int = int(os.getenv("RAGAM_CHORD_TIMELINE_MAX_SEC", "600"))
 
 # ── Logging ──────────────────────────────────────────────────────────────────
 LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
@@ -0,0 +1,97 @@
+"""
+Ragam App: Persistent Analysis Cache
+Stores analysis features (chroma, f0/voicing tracks, note events, chord sequences) on disk, so
+repeat analyses of a track are loaded instead of recomputed.
+
+Layout: one cache entry (kind 'features') per analyzed audio content, sharing the LRU budget
+with stems and mixes:
+    <CACHE_DIR>/features/<hash16>/
+        <feature>-<params16>.npz   compressed NumPy arrays (no pickles)
+        manifest.json
+
+Files are named by a key over the feature name, its parameters and FEATURE_FORMAT_VERSION, and
+entries by the audio's content hash (see utils.get_file_hash), so the same audio under another
+name or path shares its results, and a parameter change never serves stale data.
+"""
+
+import os
+import threading
+import time
+import zipfile
+
+import numpy as np
+
+from src import cache as stem_cache
+from src.utils import get_file_hash
+
+FEATURES_DIR_NAME = "features"
+FEATURE_FORMAT_VERSION = 1  # bump when a feature's computation or stored layout changes
+
+ANALYSIS_CACHE_STATS = {"hits": 0, "misses": 0, "load_sec": 0.0}
+_lock = threading.Lock()
+
+
+def _entry(audio_path, feature, params):
+    """(entry_dir, file name, content hash) of `feature` computed with `params` on `audio_path`."""
+    content_hash = get_file_hash(audio_path)
+    entry_dir = stem_cache.CACHE_ROOT / FEATURES_DIR_NAME / content_hash[:16]
+    key = stem_cache.make_key({"feature": feature, "version": FEATURE_FORMAT_VERSION, "params": params})
+    return entry_dir, f"{feature}-{key[:16]}.npz", content_hash
+
+
+def load(audio_path, feature, params):
+    """
+    Returns the cached arrays of `feature` ({name: np.ndarray}), or None on a miss.
+
+    Args:
+        audio_path: The analyzed audio file.
+        feature: Feature name (e.g. 'chroma', 'pyin_f0', 'chords').
+        params: JSON-serializable parameters the feature was computed with.
+    """
+    start = time.perf_counter()
+    entry_dir, file_name, _ = _entry(audio_path, feature, params)
+    arrays = None
+    if stem_cache.lookup(entry_dir, required_files=[file_name]):
+        try:
+            with np.load(entry_dir / file_name, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # Evicted or damaged under us: recompute
+            arrays = None
+    with _lock:
+        ANALYSIS_CACHE_STATS["hits" if arrays is not None else "misses"] += 1
+        ANALYSIS_CACHE_STATS["load_sec"] += time.perf_counter() - start
+    return arrays
+
+
+def store(audio_path, feature, params, arrays):
+    """Writes `arrays` ({name: array-like}) as the cached `feature` of `audio_path`."""
+    entry_dir, file_name, content_hash = _entry(audio_path, feature, params)
+    entry_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = entry_dir / f".{file_name}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+    try:
+        np.savez_compressed(tmp_path, **{name: np.asarray(a) for name, a in arrays.items()})
+        os.replace(tmp_path, entry_dir / file_name)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    # One writer at a time keeps the manifest's file list complete
+    with _lock:
+        stem_cache.commit(entry_dir, key=content_hash, kind="features", params={"format": FEATURE_FORMAT_VERSION})
+
+
+def cached(audio_path, feature, params, compute):
+    """
+    Returns the arrays of `feature` from the cache, or computes them with `compute()`
+    (returning {name: array-like}) and stores them first.
+    """
+    arrays = load(audio_path, feature, params)
+    if arrays is None:
+        arrays = {name: np.asarray(a) for name, a in compute().items()}
+        store(audio_path, feature, params, arrays)
+    return arrays
+
+
+def get_analysis_cache_stats():
+    """Returns a copy of the hit/miss counters and total seconds spent loading."""
+    with _lock:
+        return dict(ANALYSIS_CACHE_STATS)
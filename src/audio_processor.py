@@ -3,18 +3,24 @@ Ragam App: Audio Processing Module
 Handles source separation (Demucs), transcription (Basic Pitch/Librosa), and mixing.
 
 Key Techniques:
-1. Monkeypatching: We override demucs audio saving to use 'soundfile' for Windows stability.
-2. MD5 Caching: Avoids duplicate processing of the same audio content.
-3. Fallback Logic: Switches to Librosa if high-level AI models (Basic Pitch) are missing.
+1. Resident Models: Demucs models are loaded once per process and run in-process on decoded
+   tensors; stems are written with 'soundfile' for Windows stability.
+2. Content-Addressed Cache: Stem folders are keyed by the audio's content hash and tracked by src.cache
+   (manifest + LRU eviction), so the same content is never separated twice.
+   DSP-derived stems are produced lazily, the first time they are asked for.
+3. UI Assets: Each stem gets a waveform peak pyramid (src.peaks) and a compressed preview as soon
+   as it is written (previews encode on a background ffmpeg pool), so the page never waits on them.
+4. Fallback Logic: Switches to Librosa if high-level AI models (Basic Pitch) are missing.
 """
 
 import os
 import subprocess
-import hashlib
 import shutil
 import time
-import sys
+import threading
+import contextlib
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 import torch
 import numpy as np
@@ -34,7 +40,23 @@ except ImportError:
 
 
 # Internal imports
-from src.utils import OUTPUT_DIR
+from src.utils import PeakMemoryMonitor, get_file_hash, submit_previews, wait_for_previews, preview_path
+from src import cache as stem_cache
+from src.decode import load_audio
+from src import dsp
+from src import peaks
+from src import analysis_cache
+from src.notes import segment_notes, MIN_NOTE_SEC
+from src import pitch
+from src import transcription
+from src.stem_matrix import pan_gains
+from config.config import (
+    DEMUCS_MODEL, DEMUCS_SHIFTS, DEMUCS_OVERLAP,
+    SEPARATION_CHUNK_SEC, SEPARATION_CHUNK_OVERLAP_SEC, CHUNKED_SEPARATION_MIN_SEC,
+    SEPARATION_LOCK_STALE_SEC, USE_CACHE,
+    FLUTE_BANDPASS_LOW_HZ, FLUTE_BANDPASS_HIGH_HZ, HARMONIC_MARGIN, PERCUSSION_MARGIN, DSP_WORKERS,
+    NOTE_HYSTERESIS_CENTS, PITCH_TRACKER, TRANSCRIPTION_WINDOW_SEC, TRANSCRIPTION_OVERLAP_SEC
+)
 
 # --- FEATURE DETECTION: BASIC PITCH ---
 # Spotify's Basic Pitch is preferred for transcription but requires TensorFlow/heavy setup.
@@ -46,26 +68,134 @@ except ImportError:
     BASIC_PITCH_AVAILABLE = False
     print("Basic Pitch not available. Transcription will use Librosa fallback.")
 
-def get_file_hash(file_path):
+# --- DEMUCS MODEL REGISTRY ---
+# Building a Demucs model and loading its weights takes several seconds on CPU.
+# Each model is loaded once per process (keyed by name) and reused for every separation.
+_MODEL_REGISTRY = {}
+_MODEL_REGISTRY_LOCK = threading.Lock()
+
+# Timings of the most recent separate_audio() call in this process (see get_separation_stats).
+SEPARATION_STATS = {}
+
+def get_separation_device():
+    """The device Demucs runs on, picked as its CLI does: CUDA, then Apple MPS, then CPU."""
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+def get_separation_model(model_name=DEMUCS_MODEL):
+    """
+    Returns the resident Demucs model for `model_name`, loading it on first use and moving it
+    to get_separation_device() once (so apply_model never copies the weights per call).
+
+    Returns:
+        Tuple (model, load_seconds, cold). `cold` is True when this call loaded the weights;
+        on a warm hit `load_seconds` is 0.0.
+    """
+    with _MODEL_REGISTRY_LOCK:
+        model = _MODEL_REGISTRY.get(model_name)
+        if model is not None:
+            return model, 0.0, False
+
+        from demucs.pretrained import get_model
+        start = time.perf_counter()
+        model = get_model(model_name)
+        model.to(get_separation_device())
+        model.eval()
+        load_sec = time.perf_counter() - start
+        _MODEL_REGISTRY[model_name] = model
+        print(f"Demucs: Loaded model '{model_name}' on {get_separation_device()} in {load_sec:.2f}s (cold start)")
+        return model, load_sec, True
+
+def get_separation_stats():
+    """Returns a copy of the timings recorded by the last separate_audio() call."""
+    return dict(SEPARATION_STATS)
+
+# --- SINGLE-FLIGHT TRACK LOCKS ---
+# Two requests for the same content hash + model must not both run Demucs or race on the
+# output folder. A per-track lock (thread lock + lock file, so it also spans worker processes)
+# serializes them; whoever waited re-checks the cache and reuses the first run's stems.
+SINGLE_FLIGHT_STATS = {"lock_acquisitions": 0, "lock_wait_sec": 0.0, "dedup_hits": 0}
+_TRACK_LOCKS = {}
+_TRACK_LOCKS_GUARD = threading.Lock()
+
+@contextlib.contextmanager
+def _single_flight(track_dir):
     """
-    Generates a unique MD5 hash for a file.
-    Used for caching separation results to prevent redundant processing.
+    Holds the exclusive lock for `track_dir` for the duration of the block.
+    The lock file's mtime is refreshed while held; a file not refreshed for
+    SEPARATION_LOCK_STALE_SEC is treated as left behind by a crashed process.
+    
+    Yields:
+        float: Seconds spent waiting for the lock.
     """
-    hash_md5 = hashlib.md5()
-    with open(file_path, "rb") as f:
-        # Read in 4KB chunks to be memory efficient
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+    lock_path = track_dir.parent / f"{track_dir.name}.lock"
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with _TRACK_LOCKS_GUARD:
+        thread_lock = _TRACK_LOCKS.setdefault(str(track_dir), threading.Lock())
+
+    start = time.perf_counter()
+    with thread_lock:
+        while True:
+            try:
+                fd = os.open(str(lock_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - lock_path.stat().st_mtime > SEPARATION_LOCK_STALE_SEC:
+                        print(f"Single-flight: Breaking stale lock {lock_path.name}")
+                        lock_path.unlink()
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.25)
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        waited = time.perf_counter() - start
+        SINGLE_FLIGHT_STATS["lock_acquisitions"] += 1
+        SINGLE_FLIGHT_STATS["lock_wait_sec"] += waited
+
+        # Heartbeat so waiters can tell a long separation from a dead one
+        stop = threading.Event()
+        def heartbeat():
+            while not stop.wait(SEPARATION_LOCK_STALE_SEC / 4):
+                with contextlib.suppress(OSError):
+                    os.utime(lock_path)
+        beat = threading.Thread(target=heartbeat, daemon=True)
+        beat.start()
+        try:
+            yield waited
+        finally:
+            stop.set()
+            beat.join()
+            with contextlib.suppress(FileNotFoundError):
+                lock_path.unlink()
+
+def get_single_flight_stats():
+    """Returns a copy of this process's lock acquisition / wait / dedup counters."""
+    return dict(SINGLE_FLIGHT_STATS)
 
-def extract_flute_and_wind(other_path, out_path):
+# --- DERIVED STEMS ---
+# Stems computed by DSP from Demucs output: name -> Demucs stems it reads.
+DERIVED_STEM_INPUTS = {
+    "flute_and_wind": ["other"],
+    "indian_percussion": ["other", "drums"],
+    "acoustic_guitar": ["guitar"],
+}
+# The ones that read their inputs through the shared HPSS intermediates (src.dsp)
+HPSS_STEMS = {"flute_and_wind", "indian_percussion"}
+FLUTE_FILTER_ORDER = 10
+
+def extract_flute_and_wind(other_path, out_path, low_hz=FLUTE_BANDPASS_LOW_HZ, high_hz=FLUTE_BANDPASS_HIGH_HZ,
+                           margin=HARMONIC_MARGIN):
     if Path(out_path).exists(): return out_path
     try:
-        y, sr = librosa.load(other_path, sr=None)
-        # Harmonic extraction
-        y_harm, y_perc = librosa.effects.hpss(y, margin=1.2)
-        # Bandpass filter (250Hz - 3500Hz)
-        sos = scipy.signal.butter(10, [250, 3500], 'bandpass', fs=sr, output='sos')
+        # Harmonic extraction (STFT + median filters shared with the percussion stem)
+        y_harm, sr = dsp.hpss_component(other_path, "harmonic", margin=margin)
+        # Bandpass filter (default 250Hz - 3500Hz)
+        sos = scipy.signal.butter(FLUTE_FILTER_ORDER, [low_hz, high_hz], 'bandpass', fs=sr, output='sos')
         y_flute = scipy.signal.sosfilt(sos, y_harm)
         sf.write(out_path, y_flute, sr, subtype='PCM_16')
     except Exception as e:
@@ -73,22 +203,18 @@ def extract_flute_and_wind(other_path, out_path):
         shutil.copy2(other_path, out_path)
     return out_path
 
-def extract_indian_percussion(other_path, drums_path, out_path):
+def extract_indian_percussion(other_path, drums_path, out_path, margin=PERCUSSION_MARGIN):
     if Path(out_path).exists(): return out_path
     try:
-        y_other, sr = librosa.load(other_path, sr=None)
-        y_drums, _ = librosa.load(drums_path, sr=sr)
+        # Extract percussion from both. 'drums' goes first: when the flute stem runs concurrently
+        # it computes the shared 'other' intermediates meanwhile, and we reuse them afterwards.
+        y_perc_drums, sr = dsp.hpss_component(drums_path, "percussive", margin=margin)
+        y_perc_other, _ = dsp.hpss_component(other_path, "percussive", margin=margin, sr=sr)
         # Ensure same length
-        length = min(len(y_other), len(y_drums))
-        y_other = y_other[:length]
-        y_drums = y_drums[:length]
-        
-        # Extract percussion from both
-        _, y_perc_other = librosa.effects.hpss(y_other, margin=2.0)
-        _, y_perc_drums = librosa.effects.hpss(y_drums, margin=2.0)
+        length = min(len(y_perc_other), len(y_perc_drums))
         
         # Mix percussions
-        y_indian_perc = (y_perc_other + y_perc_drums) / 2.0
+        y_indian_perc = (y_perc_other[:length] + y_perc_drums[:length]) / 2.0
         sf.write(out_path, y_indian_perc, sr, subtype='PCM_16')
     except Exception as e:
         print(f"Percussion DSP error: {e}")
@@ -99,7 +225,7 @@ def extract_acoustic_guitar(guitar_path, out_acoustic):
     if Path(out_acoustic).exists():
         return out_acoustic
     try:
-        y, sr = librosa.load(guitar_path, sr=None, mono=False)
+        y, sr = load_audio(guitar_path, sr=None, mono=False)
         if y.ndim == 1 or y.shape[0] == 1:
             sf.write(out_acoustic, y.T if y.ndim > 1 else y, sr, subtype='PCM_16')
         else:
@@ -111,26 +237,239 @@ def extract_acoustic_guitar(guitar_path, out_acoustic):
         shutil.copy2(guitar_path, out_acoustic)
     return out_acoustic
 
+def _dsp_workers(n_tasks):
+    """Threads for the derived-stem stages: DSP_WORKERS (0 = one per core), never more than there are stages."""
+    workers = DSP_WORKERS if DSP_WORKERS > 0 else (os.cpu_count() or 1)
+    return max(1, min(workers, n_tasks))
 
-def separate_audio(file_path, model_name="htdemucs_6s"):
+def _run_dsp_stages(tasks):
     """
-    Splits an audio file into 6 base stems: Vocals, Drums, Bass, Piano, Guitar, Other.
-    Then applies DSP to extract: Flute/Wind, Indian Percussion, Acoustic Guitar.
-    
+    Runs the derived-stem extractors concurrently on a thread pool.
+    Threads (not processes) so the stages share the decoded inputs and HPSS intermediates;
+    the heavy numpy/scipy kernels release the GIL.
+
     Args:
-        file_path: Path to the input audio file.
-        model_name: The Demucs model to use (default: htdemucs_6s).
-        
+        tasks: Dict stem name -> (extractor, *args).
+
     Returns:
-        Dictionary mapping stem names to their absolute file paths.
+        Dict stem name -> wall seconds spent in that stage.
+    """
+    def timed(name):
+        func, *args = tasks[name]
+        start = time.perf_counter()
+        func(*args)
+        # The last argument is the output stem: its preview encodes while the other stages run
+        if Path(args[-1]).exists():
+            submit_previews([args[-1]])
+        return name, time.perf_counter() - start
+
+    if _dsp_workers(len(tasks)) == 1:
+        return dict(timed(name) for name in tasks)
+    with ThreadPoolExecutor(max_workers=_dsp_workers(len(tasks))) as pool:
+        return dict(pool.map(timed, tasks))
+
+def _decode_for_model(file_path, model, seek_time=None, duration=None):
+    """
+    Decodes `file_path` (optionally a window of it) to a (Channels, Time) tensor at the model's rate.
+    """
+    from demucs.audio import AudioFile, convert_audio
+    try:
+        return AudioFile(file_path).read(
+            seek_time=seek_time, duration=duration, streams=0,
+            samplerate=model.samplerate, channels=model.audio_channels
+        )
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        # ffprobe/ffmpeg could not read it; soundfile covers WAV/FLAC/OGG
+        with sf.SoundFile(str(file_path)) as f:
+            native_sr = f.samplerate
+            if seek_time:
+                f.seek(int(seek_time * native_sr))
+            frames = -1 if duration is None else int(duration * native_sr)
+            data = f.read(frames, dtype='float32', always_2d=True)
+        wav = convert_audio(torch.from_numpy(data.T), native_sr, model.samplerate, model.audio_channels)
+        if duration is not None:
+            wav = wav[..., :int(duration * model.samplerate)]
+        return wav
+
+def _probe_duration(file_path):
+    """Returns the duration of `file_path` in seconds (ffprobe first, soundfile as fallback)."""
+    from demucs.audio import AudioFile
+    try:
+        return AudioFile(file_path).duration
+    except (FileNotFoundError, subprocess.CalledProcessError, KeyError):
+        return sf.info(str(file_path)).duration
+
+def _separate_tensor(model, wav):
+    """
+    Runs the model on a decoded (Channels, Time) tensor, on the same device the Demucs CLI would
+    pick. Mirrors the normalization done by the Demucs CLI so results match its output.
+    
+    Returns:
+        float32 numpy array of shape (Sources, Channels, Time).
+    """
+    from demucs.apply import apply_model
+
+    ref = wav.mean(0)
+    ref_mean, ref_std = ref.mean(), ref.std() + 1e-8
+    wav = (wav - ref_mean) / ref_std
+    with torch.no_grad():
+        sources = apply_model(
+            model, wav[None],
+            shifts=DEMUCS_SHIFTS, split=True, overlap=DEMUCS_OVERLAP,
+            progress=False, device=get_separation_device()
+        )[0]
+    sources = sources * ref_std + ref_mean
+    return sources.cpu().numpy().astype(np.float32, copy=False)
+
+def _run_demucs(file_path, track_dir, model_name, progress_callback=None, on_stem_written=None):
+    """
+    Separates `file_path` in one pass with the resident model and writes one WAV per source
+    into `track_dir`, calling `on_stem_written(path)` after each one. Memory grows with track
+    length; see _run_demucs_chunked for long recordings.
+    
+    Returns:
+        Dictionary of timings for this run (model load, decode, inference, write).
+    """
+    model, load_sec, cold = get_separation_model(model_name)
+
+    start = time.perf_counter()
+    wav = _decode_for_model(file_path, model)
+    decode_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sources = _separate_tensor(model, wav)
+    inference_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    track_dir.mkdir(parents=True, exist_ok=True)
+    for name, source in zip(model.sources, sources):
+        # (Channels, Time) -> (Time, Channels) for soundfile
+        sf.write(str(track_dir / f"{name}.wav"), source.T, model.samplerate, subtype='PCM_16')
+        if on_stem_written:
+            on_stem_written(track_dir / f"{name}.wav")
+    write_sec = time.perf_counter() - start
+
+    print(f"Demucs: {model_name} ({'cold' if cold else 'warm'}, {get_separation_device()}) load={load_sec:.2f}s "
+          f"decode={decode_sec:.2f}s inference={inference_sec:.2f}s write={write_sec:.2f}s")
+    return {
+        "model": model_name,
+        "model_state": "cold" if cold else "warm",
+        "mode": "whole",
+        "device": get_separation_device(),
+        "model_load_sec": load_sec,
+        "decode_sec": decode_sec,
+        "inference_sec": inference_sec,
+        "write_sec": write_sec,
+    }
+
+def _run_demucs_chunked(file_path, track_dir, model_name, progress_callback=None,
+                        window_sec=SEPARATION_CHUNK_SEC, overlap_sec=SEPARATION_CHUNK_OVERLAP_SEC,
+                        on_stem_written=None):
+    """
+    Separates `file_path` window-by-window so peak memory depends on `window_sec`, not track length.
+    `on_stem_written(path)` is called for each stem WAV once it is complete.
+    
+    Each window is decoded, separated and appended to the stem WAVs straight away. Consecutive
+    windows share `overlap_sec` seconds which are blended with a linear crossfade (overlap-add),
+    hiding the seams Demucs would otherwise leave at window edges.
+    
+    Returns:
+        Dictionary of timings for this run (model load, decode, inference, write, windows).
+    """
+    model, load_sec, cold = get_separation_model(model_name)
+    sr = model.samplerate
+    window_len = int(window_sec * sr)
+    overlap_len = min(int(overlap_sec * sr), window_len // 2)
+    hop_len = window_len - overlap_len
+    total_len = int(_probe_duration(file_path) * sr)
+
+    fade_in = np.linspace(0.0, 1.0, overlap_len, dtype=np.float32)
+    fade_out = 1.0 - fade_in
+
+    decode_sec = inference_sec = write_sec = 0.0
+    n_windows = 0
+    tails = None  # (Sources, Channels, overlap) from the previous window, not yet written
+    track_dir.mkdir(parents=True, exist_ok=True)
+    writers = {
+        name: sf.SoundFile(str(track_dir / f"{name}.wav"), 'w', sr, model.audio_channels, subtype='PCM_16')
+        for name in model.sources
+    }
+    try:
+        start_len = 0
+        while start_len < total_len or tails is not None:
+            start = time.perf_counter()
+            wav = _decode_for_model(file_path, model, seek_time=start_len / sr, duration=window_sec)
+            decode_sec += time.perf_counter() - start
+            if wav.shape[-1] == 0:
+                # Probed duration overshot the real stream; flush what we held back
+                sources = tails
+                tails = None
+            else:
+                start = time.perf_counter()
+                sources = _separate_tensor(model, wav)
+                inference_sec += time.perf_counter() - start
+                n_windows += 1
+
+                if tails is not None and overlap_len > 0:
+                    n = min(overlap_len, sources.shape[-1])
+                    sources[..., :n] = sources[..., :n] * fade_in[:n] + tails[..., :n] * fade_out[:n]
+                    if n < overlap_len:
+                        # Window shorter than the overlap: keep the rest of the previous tail
+                        sources = np.concatenate([sources, tails[..., n:]], axis=-1)
+
+                is_last = start_len + window_len >= total_len or wav.shape[-1] < hop_len
+                if is_last:
+                    tails = None
+                elif overlap_len > 0:
+                    tails = sources[..., -overlap_len:].copy()
+                    sources = sources[..., :-overlap_len]
+                else:
+                    # No crossfade: the whole window is written now; an empty tail keeps the loop going
+                    tails = sources[..., :0]
+
+            start = time.perf_counter()
+            for name, source in zip(model.sources, sources):
+                writers[name].write(source.T)
+            write_sec += time.perf_counter() - start
+
+            if tails is None:
+                break
+            start_len += hop_len
+            if progress_callback:
+                progress_callback(f"Separating window {n_windows + 1}", min(start_len / max(total_len, 1), 1.0))
+    finally:
+        for writer in writers.values():
+            writer.close()
+    if on_stem_written:
+        for name in writers:
+            on_stem_written(track_dir / f"{name}.wav")
+
+    print(f"Demucs: {model_name} ({'cold' if cold else 'warm'}, {get_separation_device()}) chunked x{n_windows} load={load_sec:.2f}s "
+          f"decode={decode_sec:.2f}s inference={inference_sec:.2f}s write={write_sec:.2f}s")
+    return {
+        "model": model_name,
+        "model_state": "cold" if cold else "warm",
+        "mode": "chunked",
+        "device": get_separation_device(),
+        "windows": n_windows,
+        "model_load_sec": load_sec,
+        "decode_sec": decode_sec,
+        "inference_sec": inference_sec,
+        "write_sec": write_sec,
+    }
+
+def _track_layout(file_path, model_name):
+    """
+    Resolves where the stems of `file_path` live in the cache.
+    
+    Returns:
+        Tuple (file_hash, track_dir, demucs_stems, derived_stems); the stem dicts map names to paths.
     """
-    file_path = Path(file_path)
     file_hash = get_file_hash(file_path)
     
     # Define the unique directory for this specific file based on content hash
-    clean_name = file_path.stem.replace(" ", "_")
-    output_folder_name = f"{clean_name}_{file_hash[:8]}"
-    track_dir = OUTPUT_DIR / model_name / output_folder_name
+    clean_name = Path(file_path).stem.replace(" ", "_")
+    track_dir = stem_cache.CACHE_ROOT / model_name / f"{clean_name}_{file_hash[:8]}"
     
     # Base demucs stems
     demucs_stems = {
@@ -148,143 +487,474 @@ def separate_audio(file_path, model_name="htdemucs_6s"):
         "indian_percussion": track_dir / "indian_percussion.wav",
         "acoustic_guitar": track_dir / "acoustic_guitar.wav"
     }
-    
-    expected_stems = {**demucs_stems, **derived_stems}
-    
-    # --- CACHE CHECK ---
-    if all(p.exists() for p in expected_stems.values()):
-        print(f"Demucs & DSP: Cache hit for {output_folder_name}")
-        return expected_stems
+    return file_hash, track_dir, demucs_stems, derived_stems
 
-    print(f"Demucs: Cache miss. Processing {file_path}...")
+def _separation_params(model_name):
+    """Parameters recorded in the cache manifest of a stem folder."""
+    return {
+        "model": model_name,
+        "shifts": DEMUCS_SHIFTS,
+        "overlap": DEMUCS_OVERLAP,
+    }
 
-    # --- ENVIRONMENT VALIDATION ---
-    # Ensure FFmpeg is accessible. It's often the culprit for 'NoBackendError'.
-    ffmpeg_loc = shutil.which("ffmpeg")
-    if not ffmpeg_loc:
-        raise FileNotFoundError("FFmpeg not found. Ensure 'bin' folder exists and is in PATH.")
+def _derived_params():
+    """DSP parameters of each derived stem (part of its cache key)."""
+    return {
+        "flute_and_wind": {
+            "low_hz": FLUTE_BANDPASS_LOW_HZ, "high_hz": FLUTE_BANDPASS_HIGH_HZ,
+            "order": FLUTE_FILTER_ORDER, "margin": HARMONIC_MARGIN,
+        },
+        "indian_percussion": {"margin": PERCUSSION_MARGIN},
+        "acoustic_guitar": {"method": "side"},
+    }
 
-    # --- DYNAMIC MONKEYPATCHING ---
-    # Torchaudio can be finicky on Windows. We force Demucs to use 'soundfile' for IO.
-    import demucs.separate
-    import demucs.audio
+def _stage_plan(file_hash, model_name, demucs_stems, derived_stems):
+    """
+    Builds the per-stage cache keys of a track folder.
     
-    def robust_save_audio(wav, path, sample_rate=None, **kwargs):
-        sr = sample_rate if sample_rate is not None else kwargs.get("samplerate", 44100)
-        # Convert torch tensor to numpy array
-        if hasattr(wav, "detach"):
-            data = wav.detach().cpu().numpy()
-        else:
-            data = wav
-            
-        # Reshape (Channels, Time) -> (Time, Channels) for soundfile compatibility
-        if data.ndim == 2 and data.shape[0] < data.shape[1]:
-             data = data.T
-             
-        sf.write(str(path), data, sr, subtype='PCM_16')
-        
-    # Apply patches
-    demucs.audio.save_audio = robust_save_audio
-    if hasattr(demucs.separate, "save_audio"):
-        demucs.separate.save_audio = robust_save_audio
+    The 'demucs' stage is keyed on audio hash + model + inference parameters. Each derived stem is
+    keyed on the keys of its input stems + its own DSP parameters, so changing e.g.
+    RAGAM_FLUTE_LOW_HZ only invalidates flute_and_wind, never the Demucs output.
     
-    # --- EXECUTION ---
-    args = [
-        "--out", str(OUTPUT_DIR),
-        "-n", model_name,
-        str(file_path)
-    ]
+    Returns:
+        Dict stage -> {"key", "params", "files"} as stored in the manifest's "stages".
+    """
+    demucs_params = _separation_params(model_name)
+    demucs_key = stem_cache.make_key({"audio": file_hash, **demucs_params})
+    plan = {
+        "demucs": {
+            "key": demucs_key,
+            "params": demucs_params,
+            "files": [p.name for p in demucs_stems.values()],
+        }
+    }
+    for name, params in _derived_params().items():
+        plan[name] = {
+            # Every Demucs stem carries the Demucs stage key
+            "key": stem_cache.make_key({
+                "stage": name,
+                "inputs": {stem: demucs_key for stem in DERIVED_STEM_INPUTS[name]},
+                "params": params,
+            }),
+            "params": params,
+            "files": [derived_stems[name].name],
+        }
+    return plan
+
+def _track_plan(file_path, model_name):
+    """
+    _track_layout() plus the stage plan. A stem folder from before the cache kept manifests is
+    adopted here (recorded as produced with the current parameters) rather than separated again.
     
+    Returns:
+        Tuple (file_hash, track_dir, demucs_stems, derived_stems, plan).
+    """
+    file_hash, track_dir, demucs_stems, derived_stems = _track_layout(file_path, model_name)
+    plan = _stage_plan(file_hash, model_name, demucs_stems, derived_stems)
+    stem_cache.adopt_legacy(
+        track_dir, plan, key=file_hash, kind="stems", params=_separation_params(model_name),
+        model=model_name, source=Path(file_path).name
+    )
+    return file_hash, track_dir, demucs_stems, derived_stems, plan
+
+def find_cached_stems(file_path, model_name=DEMUCS_MODEL):
+    """
+    Returns the Demucs stem dict for `file_path` if it is cached with current parameters,
+    else None. Cheap enough to call before queueing a separation job (only hashes the file).
+    Derived stems are not included; see get_derived_stem_status().
+    """
+    file_hash, track_dir, demucs_stems, derived_stems, plan = _track_plan(file_path, model_name)
+    if stem_cache.lookup(track_dir, stages={"demucs": plan["demucs"]}):
+        return {k: v for k, v in demucs_stems.items() if v.exists() and v.stat().st_size > 0}
+    return None
+
+def _separate_into(file_path, track_dir, model_name, demucs_stems, chunked, report):
+    """
+    Runs Demucs on `file_path` and moves the stems into `track_dir`.
+    Caller holds the track lock.
+    """
     try:
         import socket
         # Set a default timeout for underlying socket operations (e.g. model downloads)
         socket.setdefaulttimeout(15.0)
         
-        # Only run demucs if base stems are missing
-        if not all(p.exists() for p in demucs_stems.values()):
-            demucs.separate.main(args)
-            
-            # Demucs creates a nested structure. We rename it to our hash-based folder.
-            default_output_dir = OUTPUT_DIR / model_name / file_path.stem
-            if default_output_dir.exists():
-                if track_dir.exists():
-                    shutil.rmtree(track_dir)
-                default_output_dir.rename(track_dir)
-                
-        # --- POST-PROCESSING DSP ---
-        # The guitar and other stems might be missing if Demucs failed or the model wasn't 6s
-        if (track_dir / "other.wav").exists():
-            extract_flute_and_wind(track_dir / "other.wav", track_dir / "flute_and_wind.wav")
-            if (track_dir / "drums.wav").exists():
-                extract_indian_percussion(track_dir / "other.wav", track_dir / "drums.wav", track_dir / "indian_percussion.wav")
-        else:
-             # Fallbacks if other is missing
-             (track_dir / "flute_and_wind.wav").touch()
-             (track_dir / "indian_percussion.wav").touch()
+        if chunked is None:
+            chunked = _probe_duration(file_path) > CHUNKED_SEPARATION_MIN_SEC
+        run_demucs = _run_demucs_chunked if chunked else _run_demucs
+        # Write into a private staging folder, then move the finished stems into place,
+        # so a crash never leaves half-written WAVs where the cache check would see them
+        staging_dir = track_dir.parent / f".{track_dir.name}.partial"
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        track_dir.mkdir(parents=True, exist_ok=True)
 
-        if (track_dir / "guitar.wav").exists():
-            extract_acoustic_guitar(track_dir / "guitar.wav", track_dir / "acoustic_guitar.wav")
-        else:
-             (track_dir / "acoustic_guitar.wav").touch()
+        def land(stem_file):
+            # A finished stem moves into place right away and its preview starts encoding while
+            # Demucs writes the next one
+            os.replace(stem_file, track_dir / stem_file.name)
+            submit_previews([track_dir / stem_file.name])
+
+        report("Separating stems (Demucs)", 0.05)
+        with PeakMemoryMonitor() as mem:
+            run_stats = run_demucs(
+                file_path, staging_dir, model_name,
+                # Demucs owns the 5%-85% band of the overall progress bar
+                progress_callback=lambda stage, fraction: report(stage, 0.05 + 0.8 * fraction),
+                on_stem_written=land
+            )
+        for stem_file in staging_dir.iterdir():
+            os.replace(stem_file, track_dir / stem_file.name)
+        staging_dir.rmdir()
+        _prepare_ui_assets(demucs_stems.values())
+        run_stats["peak_rss_mb"] = mem.peak_mb
+        SEPARATION_STATS.update(run_stats)
+        if mem.peak_mb is not None:
+            print(f"Demucs: Peak memory {mem.peak_mb:.0f} MB ({run_stats['mode']} mode)")
             
     except socket.timeout:
         raise RuntimeError(f"Connection timed out after 15s. The distant server or proxy failed to respond.")
     except urllib.error.URLError as e:
         raise RuntimeError(f"Network routing failed. The server cannot be reached: {str(e)}")
     except Exception as e:
-        raise RuntimeError(f"Demucs separation / DSP failed: {e}")
+        raise RuntimeError(f"Demucs separation failed: {e}")
+
+def _prepare_ui_assets(stem_paths):
+    """
+    Starts encoding the previews of freshly written stems and computes their waveform peaks meanwhile
+    (best effort: the UI produces missing ones on demand).
+    """
+    stem_paths = [Path(p) for p in stem_paths if Path(p).exists()]
+    submit_previews(stem_paths)
+    start = time.perf_counter()
+    for path in stem_paths:
+        try:
+            peaks.compute_peaks(path)
+        except Exception as e:
+            print(f"Peaks: Skipped {path.name}: {e}")
+    SEPARATION_STATS["peaks_sec"] = SEPARATION_STATS.get("peaks_sec", 0.0) + time.perf_counter() - start
+
+def _derived_task(track_dir, name):
+    """(extractor, *args) producing derived stem `name` in `track_dir`, or None if an input stem is missing."""
+    inputs = [track_dir / f"{stem}.wav" for stem in DERIVED_STEM_INPUTS[name]]
+    # The guitar and other stems might be missing if the model wasn't 6s
+    if not all(p.exists() for p in inputs):
+        return None
+    extractor = {
+        "flute_and_wind": extract_flute_and_wind,
+        "indian_percussion": extract_indian_percussion,
+        "acoustic_guitar": extract_acoustic_guitar,
+    }[name]
+    return (extractor, *inputs, track_dir / f"{name}.wav")
+
+def _materialize_into(track_dir, plan, names):
+    """
+    Computes the derived stems `names` in `track_dir` (stale outputs are replaced) and records
+    their stage keys in the manifest. Caller holds the track lock.
+    
+    Returns:
+        The subset of `names` that could be produced (inputs present).
+    """
+    tasks = {}
+    for name in names:
+        task = _derived_task(track_dir, name)
+        if task is not None:
+            # The extractors skip existing outputs, so a stale file has to go first
+            (track_dir / f"{name}.wav").unlink(missing_ok=True)
+            tasks[name] = task
+    if not tasks:
+        return []
+
+    # Each input's HPSS intermediates are freed once the last stage reading them is done with them
+    hpss_uses = {}
+    for name in tasks:
+        if name in HPSS_STEMS:
+            for stem in DERIVED_STEM_INPUTS[name]:
+                hpss_uses[track_dir / f"{stem}.wav"] = hpss_uses.get(track_dir / f"{stem}.wav", 0) + 1
+    dsp.expect_uses(hpss_uses)
+
+    dsp_start = time.perf_counter()
+    try:
+        stage_sec = _run_dsp_stages(tasks)
+    finally:
+        # The shared HPSS intermediates are only needed within one pass
+        dsp.clear()
+    dsp_sec = time.perf_counter() - dsp_start
+    SEPARATION_STATS.setdefault("dsp_stage_sec", {}).update(stage_sec)
+    SEPARATION_STATS["dsp_sec"] = SEPARATION_STATS.get("dsp_sec", 0.0) + dsp_sec
+    stage_times = ", ".join(f"{n} {s:.1f}s" for n, s in stage_sec.items())
+    print(f"DSP: {dsp_sec:.1f}s wall with {_dsp_workers(len(tasks))} worker(s) ({stage_times})")
+
+    _prepare_ui_assets(track_dir / f"{name}.wav" for name in tasks)
+    _record_stages(track_dir, {name: plan[name] for name in tasks})
+    return list(tasks)
+
+def _record_stages(track_dir, stages):
+    """Merges freshly written `stages` into the manifest's per-stage keys (other stages are kept)."""
+    manifest = stem_cache.read_manifest(track_dir) or {}
+    recorded = dict(manifest.get("stages") or {})
+    recorded.update({name: {"key": stage["key"], "params": stage["params"]} for name, stage in stages.items()})
+    stem_cache.commit(
+        track_dir, key=manifest.get("key"), kind=manifest.get("kind", "stems"),
+        params=manifest.get("params"), stages=recorded
+    )
+
+def get_derived_stem_status(file_path, model_name=DEMUCS_MODEL):
+    """
+    Reports the state of every declared derived stem of `file_path`.
+    
+    Returns:
+        Dict stem name -> (status, path) where status is 'ready' (cached with current parameters),
+        'on_demand' (can be produced by materialize_derived_stem) or 'unavailable'
+        (the model did not produce its input stems, or the track is not separated yet).
+    """
+    file_hash, track_dir, demucs_stems, derived_stems, plan = _track_plan(file_path, model_name)
+    if USE_CACHE:
+        stale = stem_cache.stale_stages(track_dir, plan)
+    else:
+        # Nothing is keyed without the cache: the files of this track's last separation are what exists
+        stale = {name for name, path in derived_stems.items() if not path.exists()}
+    status = {}
+    for name, path in derived_stems.items():
+        # Empty files are placeholders left by older versions, not results
+        if name not in stale and path.stat().st_size > 0:
+            status[name] = ("ready", path)
+        elif "demucs" in stale or _derived_task(track_dir, name) is None:
+            status[name] = ("unavailable", path)
+        else:
+            status[name] = ("on_demand", path)
+    return status
+
+def materialize_derived_stem(file_path, name, model_name=DEMUCS_MODEL):
+    """
+    Produces one derived stem (flute_and_wind, indian_percussion or acoustic_guitar) of an already
+    separated track, the first time it is asked for. Later calls are served from the cache.
+    
+    Args:
+        file_path: Path to the original audio file (its Demucs stems must be cached).
+        name: Derived stem name (see DERIVED_STEM_INPUTS).
+        model_name: The Demucs model the stems were separated with.
+        
+    Returns:
+        Path to the stem, or None if its input stems are not available.
+    """
+    if name not in DERIVED_STEM_INPUTS:
+        raise ValueError(f"Unknown derived stem: {name}")
+    file_hash, track_dir, demucs_stems, derived_stems, plan = _track_plan(file_path, model_name)
+    stages = {"demucs": plan["demucs"], name: plan[name]}
+    out_path = derived_stems[name]
+    # Empty files are placeholders left by older versions, not results
+    if stem_cache.lookup(track_dir, stages=stages) and out_path.stat().st_size > 0:
+        return out_path
+    # Without the cache the stems of the last separation are used as they are
+    if USE_CACHE and stem_cache.stale_stages(track_dir, {"demucs": plan["demucs"]}):
+        return None
+
+    with _single_flight(track_dir):
+        # Another request may have produced it while we waited
+        if stem_cache.lookup(track_dir, stages=stages, record=False) and out_path.stat().st_size > 0:
+            return out_path
+        print(f"DSP: Materializing {name} for {track_dir.name}")
+        if not _materialize_into(track_dir, plan, [name]):
+            return None
+        # The UI plays it next anyway; wait here so the manifest counts the preview
+        wait_for_previews([out_path])
+        stem_cache.record_files(track_dir)
+    return out_path
+
+def separate_audio(file_path, model_name=DEMUCS_MODEL, chunked=None, progress_callback=None, derived=()):
+    """
+    Splits an audio file into 6 base stems: Vocals, Drums, Bass, Piano, Guitar, Other.
+    The DSP stems (Flute/Wind, Indian Percussion, Acoustic Guitar) are declared but only produced
+    on request: pass them in `derived`, or call materialize_derived_stem() later.
+    
+    Args:
+        file_path: Path to the input audio file.
+        model_name: The Demucs model to use (default: config DEMUCS_MODEL, htdemucs_6s).
+        chunked: Separate window-by-window with bounded memory. None (default) enables it
+                 automatically for recordings longer than CHUNKED_SEPARATION_MIN_SEC.
+        progress_callback: Optional callable(stage: str, fraction: float) for job progress reporting.
+        derived: Derived stem names to materialize right away (default: none).
         
-    return {k: v for k, v in expected_stems.items() if v.exists() and v.stat().st_size > 0}
+    Returns:
+        Dictionary mapping stem names to their absolute file paths.
+        Timings for the run are available via get_separation_stats().
+    """
+    run_start = time.perf_counter()
+    report = progress_callback or (lambda stage, fraction: None)
+    SEPARATION_STATS.clear()
+    SEPARATION_STATS.update({"model": model_name, "cache_hit": False, "dedup_hit": False})
+
+    file_path = Path(file_path)
+    report("Hashing audio", 0.0)
+    file_hash, track_dir, demucs_stems, derived_stems, plan = _track_plan(file_path, model_name)
+    output_folder_name = track_dir.name
+    derived = [name for name in derived if name in derived_stems]
+    wanted = {name: plan[name] for name in ["demucs", *derived]}
+
+    def result():
+        stems = {**demucs_stems, **{name: derived_stems[name] for name in derived}}
+        return {k: v for k, v in stems.items() if v.exists() and v.stat().st_size > 0}
+    
+    # --- CACHE CHECK ---
+    if stem_cache.lookup(track_dir, stages=wanted):
+        print(f"Demucs: Cache hit for {output_folder_name}")
+        SEPARATION_STATS.update({"cache_hit": True, "total_sec": time.perf_counter() - run_start})
+        return result()
+
+    # --- ENVIRONMENT VALIDATION ---
+    # Ensure FFmpeg is accessible. It's often the culprit for 'NoBackendError'.
+    ffmpeg_loc = shutil.which("ffmpeg")
+    if not ffmpeg_loc:
+        raise FileNotFoundError("FFmpeg not found. Ensure 'bin' folder exists and is in PATH.")
+
+    report("Acquiring track lock", 0.0)
+    with _single_flight(track_dir) as lock_wait_sec:
+        SEPARATION_STATS["lock_wait_sec"] = lock_wait_sec
+        # Another request may have produced these stems while we waited
+        if stem_cache.lookup(track_dir, stages=wanted, record=False):
+            print(f"Demucs: Reusing in-flight result for {output_folder_name} (waited {lock_wait_sec:.2f}s)")
+            SINGLE_FLIGHT_STATS["dedup_hits"] += 1
+            SEPARATION_STATS.update({"cache_hit": True, "dedup_hit": True,
+                                     "total_sec": time.perf_counter() - run_start})
+            report("Done", 1.0)
+            return result()
+
+        stale = set(wanted) if not USE_CACHE else stem_cache.stale_stages(track_dir, wanted)
+        SEPARATION_STATS["recomputed_stages"] = sorted(stale)
+        print(f"Demucs: Cache miss. Processing {file_path} (stale stages: {', '.join(sorted(stale))})...")
+        if "demucs" in stale:
+            _separate_into(file_path, track_dir, model_name, demucs_stems, chunked, report)
+            # Derived stems of the previous Demucs output no longer match its stems
+            for path in derived_stems.values():
+                path.unlink(missing_ok=True)
+                peaks.peaks_path(path).unlink(missing_ok=True)
+                preview_path(path).unlink(missing_ok=True)
+            stem_cache.commit(
+                track_dir, key=file_hash, kind="stems", params=_separation_params(model_name),
+                model=model_name, source=file_path.name,
+                stages={"demucs": {"key": plan["demucs"]["key"], "params": plan["demucs"]["params"]}}
+            )
+
+        # --- POST-PROCESSING DSP (only what the caller asked for) ---
+        if stale - {"demucs"}:
+            report("Extracting derived stems", 0.9)
+            _materialize_into(track_dir, plan, sorted(stale - {"demucs"}))
+
+        # The job reports done once the UI can play every stem (the page may live in another process)
+        report("Encoding previews", 0.97)
+        SEPARATION_STATS["preview_wait_sec"] = wait_for_previews(result().values())
+        # The previews were written after the stages were committed
+        stem_cache.record_files(track_dir)
 
-def extract_pitch_librosa(file_path, duration=60):
+    SEPARATION_STATS["total_sec"] = time.perf_counter() - run_start
+    report("Done", 1.0)
+    return result()
+
+PYIN_FMIN_NOTE = "C2"    # ~65 Hz
+PYIN_FMAX_NOTE = "C7"    # ~2 kHz
+BASIC_PITCH_PARAMS = {"onset_threshold": 0.5, "frame_threshold": 0.3, "minimum_note_length": 58}  # length in ms
+
+def _events_array(note_events):
+    """(start, end, midi) note events as an (n, 3) float array, the analysis cache's storage form."""
+    return np.array([(s, e, p) for s, e, p, *_ in note_events], dtype=np.float64).reshape(-1, 3)
+
+def _events_list(events):
+    return [(float(s), float(e), int(p)) for s, e, p in events]
+
+def pyin_track(file_path, duration=60):
     """
-    Fallback transcription using Librosa's Probabilistic YIN (pYIN) algorithm.
-    Optimized for short segments to avoid performance bottleneck.
+    f0 / voicing of the first `duration` seconds (pYIN, 22050 Hz), from the analysis cache when
+    this content was tracked before.
+    
+    The audio is resampled to 22050 Hz rather than tracked at its native rate (before the shared
+    decode, pYIN ran at e.g. 44.1 kHz): frames are 2048 samples (93 ms) every 512 (23 ms), twice the
+    span of a native-rate pass, so the f0 track has half as many frames and note boundaries fall on
+    a 23 ms grid. The pitch range (C2-C7) sits well below the 11 kHz Nyquist limit and the
+    longer frames resolve the lowest notes better. All Librosa-side trackers, including the
+    windowed full-track one, share this rate.
+    
+    Returns:
+        Dict with 'f0' (Hz, NaN when unvoiced), 'voiced_flag', 'voiced_probs' and 'sr'.
     """
+    def compute():
+        # Load audio (mono, 22050Hz is usually sufficient for pitch); shares the analysis decode
+        y, sr = load_audio(file_path, sr=transcription.SR, duration=duration)
+        track = transcription.track_f0(
+            y, sr, "pyin",
+            fmin=librosa.note_to_hz(PYIN_FMIN_NOTE),
+            fmax=librosa.note_to_hz(PYIN_FMAX_NOTE)
+        )
+        return {**track, "sr": sr}
+    return analysis_cache.cached(file_path, "pyin_f0", _tracker_params("pyin", duration), compute)
+
+def yin_track(file_path, duration=60):
+    """
+    Fast f0 / voicing of the first `duration` seconds (vectorized YIN, see src.pitch), in the same
+    form as pyin_track(); 'voiced_probs' is 1 - aperiodicity.
+    """
+    def compute():
+        y, sr = load_audio(file_path, sr=transcription.SR, duration=duration)
+        track = transcription.track_f0(
+            y, sr, "yin",
+            fmin=librosa.note_to_hz(PYIN_FMIN_NOTE),
+            fmax=librosa.note_to_hz(PYIN_FMAX_NOTE)
+        )
+        return {**track, "sr": sr}
+    return analysis_cache.cached(file_path, "yin_f0", _tracker_params("yin", duration), compute)
+
+def windowed_pitch_track(file_path, mode=PITCH_TRACKER, duration=None):
+    """
+    f0 / voicing of the first `duration` seconds (None = the whole track) with the `mode` tracker,
+    computed in overlapping windows on the transcription worker pool (see src.transcription),
+    in the same form as pyin_track().
+    """
+    def compute():
+        return transcription.windowed_track(
+            file_path, mode, fmin=librosa.note_to_hz(PYIN_FMIN_NOTE), fmax=librosa.note_to_hz(PYIN_FMAX_NOTE),
+            duration=duration
+        )
+    params = {**_tracker_params(mode, duration), "window_sec": TRANSCRIPTION_WINDOW_SEC,
+              "overlap_sec": TRANSCRIPTION_OVERLAP_SEC}
+    return analysis_cache.cached(file_path, f"{mode}_f0_windowed", params, compute)
+
+def _tracker_params(mode, duration):
+    params = {"sr": transcription.SR, "duration": duration, "fmin": PYIN_FMIN_NOTE, "fmax": PYIN_FMAX_NOTE}
+    if mode == "yin":
+        params.update(threshold=pitch.YIN_THRESHOLD, silence_db=pitch.SILENCE_DB)
+    return params
+
+# Pitch trackers for extract_pitch_librosa: "pyin" is accurate, "yin" ~40x faster (see src.pitch)
+PITCH_TRACKERS = {"pyin": pyin_track, "yin": yin_track}
+
+def extract_pitch_librosa(file_path, duration=60, mode=PITCH_TRACKER, chunked=False):
+    """
+    Fallback transcription from a Librosa-side f0 track: Probabilistic YIN (mode 'pyin', accurate)
+    or vectorized YIN (mode 'yin', sub-second on a minute of audio, more octave slips).
+    Optimized for short segments to avoid performance bottleneck; with `chunked`, the track is
+    computed in parallel windows instead, so `duration` may be None (the whole track).
+    Both the f0 track and the note events are kept in the analysis cache.
+    """
+    if mode not in PITCH_TRACKERS:
+        raise ValueError(f"Unknown pitch tracker: {mode} (choose from {', '.join(PITCH_TRACKERS)})")
     try:
         import socket
         socket.setdefaulttimeout(15.0)
 
-        # Load audio (mono, 22050Hz is usually sufficient for pitch)
-        y, sr = librosa.load(str(file_path), sr=None, duration=duration)
-        
-        # Detect f0 (frequency) using pYIN
-        # Ranges: C2 (~65Hz) to C7 (~2000Hz)
-        f0, voiced_flag, voiced_probs = librosa.pyin(
-            y, 
-            fmin=librosa.note_to_hz('C2'), 
-            fmax=librosa.note_to_hz('C7')
-        )
-        
-        times = librosa.frames_to_time(np.arange(len(f0)), sr=sr)
-        note_events = []
-        current_note = None
-        start_time = 0
-        
-        # Aggregate consecutive frames of same pitch into 'note events'
-        for i, (pitch, voiced) in enumerate(zip(f0, voiced_flag)):
-            if not voiced or np.isnan(pitch):
-                if current_note is not None:
-                    note_events.append((start_time, times[i], current_note))
-                    current_note = None
-                continue
-                
-            midi_note = int(round(librosa.hz_to_midi(pitch)))
-            
-            if current_note is None:
-                current_note = midi_note
-                start_time = times[i]
-            elif midi_note != current_note:
-                note_events.append((start_time, times[i], current_note))
-                current_note = midi_note
-                start_time = times[i]
-                
-        # Handle trailing note
-        if current_note is not None:
-             note_events.append((start_time, times[-1], current_note))
-             
-        # Filter noise: increase threshold to 150ms instead of 100ms
-        return str(file_path), [n for n in note_events if (n[1] - n[0]) > 0.15]
+        def compute():
+            if chunked:
+                track = windowed_pitch_track(file_path, mode=mode, duration=duration)
+            else:
+                track = PITCH_TRACKERS[mode](file_path, duration=duration)
+            # One segmentation over the whole (stitched) track: notes across window seams stay whole
+            return {"events": segment_notes(track["f0"], track["voiced_flag"], int(track["sr"]),
+                                            hop_length=transcription.HOP_LENGTH,
+                                            hysteresis_cents=NOTE_HYSTERESIS_CENTS)}
+
+        params = {**_tracker_params(mode, duration), "min_note_sec": MIN_NOTE_SEC,
+                  "hysteresis_cents": NOTE_HYSTERESIS_CENTS}
+        if chunked:
+            params.update(window_sec=TRANSCRIPTION_WINDOW_SEC, overlap_sec=TRANSCRIPTION_OVERLAP_SEC)
+        events = analysis_cache.cached(file_path, f"notes_{mode}", params, compute)["events"]
+        return str(file_path), _events_list(events)
         
     except socket.timeout:
         print("Librosa Transcription Error: Connection timed out after 15s during external operation.")
@@ -296,12 +966,18 @@ def extract_pitch_librosa(file_path, duration=60):
         print(f"Librosa Transcription Error: {e}")
         return None, []
 
-def transcribe_audio(file_path):
+def transcribe_audio(file_path, pitch_mode=None, full_track=False):
     """
     Attempts high-quality transcription with Basic Pitch, or falls back to Librosa.
+    A `pitch_mode` ('pyin' or 'yin') selects that Librosa-side tracker directly instead.
+    With `full_track`, the Librosa trackers cover the whole track in parallel windows instead of
+    its first minute (Basic Pitch always transcribes the whole file).
     """
+    fallback = {"duration": None, "chunked": True} if full_track else {}
+    if pitch_mode is not None:
+        return extract_pitch_librosa(file_path, mode=pitch_mode, **fallback)
     if not BASIC_PITCH_AVAILABLE:
-        return extract_pitch_librosa(file_path)
+        return extract_pitch_librosa(file_path, **fallback)
 
     try:
         import socket
@@ -309,54 +985,179 @@ def transcribe_audio(file_path):
 
         # Basic Pitch prediction
         # Output: (model_output, note_data, note_events)
-        _, midi_data, note_events = predict(
-            str(file_path),
-            ICASSP_2022_MODEL_PATH,
-            onset_threshold=0.5,
-            frame_threshold=0.3,
-            minimum_note_length=58, # in ms
-        )
-        # Note: we don't save the MIDI to disk unless needed, we just pass the events
-        return file_path, note_events
+        def compute():
+            _, midi_data, note_events = predict(str(file_path), ICASSP_2022_MODEL_PATH, **BASIC_PITCH_PARAMS)
+            # Note: we don't save the MIDI to disk unless needed, we just keep the events
+            return {"events": _events_array(note_events)}
+
+        params = {**BASIC_PITCH_PARAMS, "model": Path(str(ICASSP_2022_MODEL_PATH)).name}
+        events = analysis_cache.cached(file_path, "notes_basic_pitch", params, compute)["events"]
+        return file_path, _events_list(events)
     except socket.timeout:
         print("Basic Pitch Error: Connection timed out. Falling back...")
-        return extract_pitch_librosa(file_path)
+        return extract_pitch_librosa(file_path, **fallback)
     except urllib.error.URLError as e:
         print(f"Basic Pitch Error: Network routing failed - {str(e)}. Falling back...")
-        return extract_pitch_librosa(file_path)
+        return extract_pitch_librosa(file_path, **fallback)
     except Exception as e:
         print(f"Basic Pitch Error: {e}. Falling back...")
-        return extract_pitch_librosa(file_path)
+        return extract_pitch_librosa(file_path, **fallback)
 
-def mix_stems(stem_paths, output_path):
+# --- MIXER ---
+MIX_BLOCK_FRAMES = 65536  # ~1.5 s at 44.1 kHz per read; memory use is independent of track length
+
+def _pan_matrix(in_channels, out_channels, gain, pan):
     """
-    Combines multiple stems into a single audio file with peak normalization.
+    (in_channels, out_channels) matrix applying `gain` and a constant-power `pan` (-1 left .. 1 right).
+    Scaled so pan 0 leaves both channels at `gain` (a centered mono stem plays at full level in each).
+    """
+    lr = pan_gains(gain, pan)
+    if out_channels == 1:
+        return np.full((in_channels, 1), gain / in_channels, dtype=np.float32)
+    if in_channels == 1:
+        return lr[None, :]
+    return np.diag(lr).astype(np.float32)
+
+def _mix_blocks(sources, frames, out_channels, block_frames):
+    """Yields mixed float32 blocks of shape (n, out_channels); rewinds the sources first."""
+    acc = np.empty((block_frames, out_channels), dtype=np.float32)
+    scratch = np.empty_like(acc)
+    bufs = [np.empty((block_frames, f.channels), dtype=np.float32) for f, _ in sources]
+    for f, _ in sources:
+        f.seek(0)
+    done = 0
+    while done < frames:
+        n = min(block_frames, frames - done)
+        acc[:n] = 0.0
+        for (f, matrix), buf in zip(sources, bufs):
+            f.read(n, dtype="float32", always_2d=True, out=buf[:n])
+            np.matmul(buf[:n], matrix, out=scratch[:n])
+            acc[:n] += scratch[:n]
+        done += n
+        yield acc[:n]
+
+def mix_stems(stem_paths, output_path, gains=None, pans=None, block_frames=MIX_BLOCK_FRAMES):
     """
-    master_audio = None
-    common_sr = None
+    Combines multiple stems into a single audio file with peak normalization.
+    Streams the stems block by block: a first pass finds the peak of the mix, a second pass writes
+    it scaled, so memory stays constant whatever the track length.
     
-    for path in stem_paths:
-        try:
-            data, sr = sf.read(str(path))
-            if master_audio is None:
-                master_audio = data
-                common_sr = sr
-            else:
-                # Synchronize lengths by trimming to the shortest track
-                length = min(len(master_audio), len(data))
-                master_audio = master_audio[:length] + data[:length]
-        except Exception as e:
-            print(f"Mixer: Skipped {path} due to error: {e}")
-                
-    if master_audio is not None:
-        # Prevent clipping by normalizing to 0dB peak
-        peak = np.max(np.abs(master_audio))
-        if peak > 1.0:
-            master_audio = master_audio / peak
-            
+    Args:
+        stem_paths: Stem files to mix (same sample rate; the mix is trimmed to the shortest).
+        output_path: Destination WAV file.
+        gains: Optional linear gain per stem (same order as stem_paths, default 1.0).
+        pans: Optional pan per stem, -1 (left) .. 1 (right) (default 0, centered).
+        block_frames: Frames read per stem per block.
+        
+    Returns:
+        Path of the written mix, or None if no stem could be read.
+    """
+    gains = list(gains) if gains is not None else [1.0] * len(stem_paths)
+    pans = list(pans) if pans is not None else [0.0] * len(stem_paths)
+
+    # Reading stems counts as cache use: keep frequently remixed tracks from being evicted
+    for entry_dir in {Path(p).parent for p in stem_paths}:
+        stem_cache.touch(entry_dir)
+
+    with contextlib.ExitStack() as stack:
+        opened = []
+        for path, gain, pan in zip(stem_paths, gains, pans):
+            try:
+                f = stack.enter_context(sf.SoundFile(str(path)))
+                if opened and f.samplerate != opened[0][0].samplerate:
+                    raise ValueError(f"sample rate {f.samplerate} Hz differs from {opened[0][0].samplerate} Hz")
+                if f.frames == 0:
+                    raise ValueError("empty file")
+                opened.append((f, gain, pan))
+            except Exception as e:
+                print(f"Mixer: Skipped {path} due to error: {e}")
+        if not opened:
+            return None
+
+        # Stereo as soon as one stem is stereo (mono stems are panned into it)
+        out_channels = min(2, max(f.channels for f, _, _ in opened))
+        sources = [(f, _pan_matrix(f.channels, out_channels, gain, pan)) for f, gain, pan in opened]
+        # Synchronize lengths by trimming to the shortest track
+        frames = min(f.frames for f, _ in sources)
+        sr = opened[0][0].samplerate
+
+        # Pass 1: peak of the mix. Prevent clipping by normalizing to 0dB peak
+        peak = 0.0
+        for block in _mix_blocks(sources, frames, out_channels, block_frames):
+            peak = max(peak, float(np.max(np.abs(block))))
+        scale = 1.0 / peak if peak > 1.0 else 1.0
+
+        # Pass 2: write
         out_file = Path(output_path)
         out_file.parent.mkdir(parents=True, exist_ok=True)
-        sf.write(str(out_file), master_audio, common_sr, subtype='PCM_16')
-        return out_file
+        with sf.SoundFile(str(out_file), "w", samplerate=sr, channels=out_channels, subtype="PCM_16") as out:
+            for block in _mix_blocks(sources, frames, out_channels, block_frames):
+                if scale != 1.0:
+                    block *= scale
+                out.write(block)
+    return out_file
+
+def get_custom_mix(stem_paths, gains=None, pans=None, matrix=None):
+    """
+    Returns a mix of `stem_paths`, reusing an earlier identical mix when there is one.
     
-    return None
+    Mixes are cache entries (kind 'mix', sharing the LRU budget with the stems) addressed by the
+    stems' content keys, the stem set and the gains/pans, so the path is distinct per mix: sessions
+    never overwrite each other's files and repeated selections are free.
+    
+    Args:
+        stem_paths, gains, pans: As for mix_stems().
+        matrix: Optional StemMatrix holding these stems (see src.stem_matrix); a new mix is then a
+                single vectorized sum instead of streaming the stem files.
+        
+    Returns:
+        Tuple (mix_path or None, cache_hit: bool).
+    """
+    gains = list(gains) if gains is not None else [1.0] * len(stem_paths)
+    pans = list(pans) if pans is not None else [0.0] * len(stem_paths)
+    # Sorted, so the same selection made in a different order maps to the same mix
+    entries = sorted(
+        (
+            {"stem": Path(p).stem, "source": stem_cache.source_key(p), "gain": round(float(g), 4), "pan": round(float(pn), 3)}
+            for p, g, pn in zip(stem_paths, gains, pans) if Path(p).exists()
+        ),
+        key=lambda e: (e["source"], e["stem"]),
+    )
+    if not entries:
+        return None, False
+    params = {"stems": entries, "normalize": "peak", "subtype": "PCM_16"}
+    key = stem_cache.make_key(params)
+    entry_dir = stem_cache.CACHE_ROOT / "mixes" / key[:16]
+    mix_path = entry_dir / "mix.wav"
+
+    # Reading stems counts as cache use, also when the mix itself is cached
+    for stem_dir in {Path(p).parent for p in stem_paths}:
+        stem_cache.touch(stem_dir)
+    if stem_cache.lookup(entry_dir, required_files=[mix_path.name]):
+        return mix_path, True
+
+    # Write under a private name, then move into place: a concurrent identical request
+    # never sees a half-written file
+    entry_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = entry_dir / f".mix.{os.getpid()}.{threading.get_ident()}.wav"
+    try:
+        if matrix is not None and all(
+            e["stem"] in matrix.names and matrix.sources[matrix.names.index(e["stem"])] == e["source"]
+            for e in entries
+        ):
+            mixed = matrix.mix({e["stem"]: e["gain"] for e in entries}, {e["stem"]: e["pan"] for e in entries})
+            sf.write(str(tmp_path), mixed, matrix.samplerate, subtype="PCM_16")
+        elif mix_stems(stem_paths, tmp_path, gains=gains, pans=pans) is None:
+            return None, False
+        os.replace(tmp_path, mix_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+        if not mix_path.exists():
+            # Failed render: drop the folder, unless a concurrent identical request still writes into it
+            try:
+                entry_dir.rmdir()
+            except OSError:
+                pass
+    stem_cache.commit(entry_dir, key=key, kind="mix", params=params)
+    return mix_path, False
+
@@ -0,0 +1,357 @@
+"""
+Ragam App: Content-Addressed Output Cache
+Tracks every cached output folder (separated stems, mixes, ...) with a manifest and keeps the
+total size under a byte budget by evicting the least recently used entries.
+
+Layout:
+    <CACHE_DIR>/<model>/<track>_<hash8>/
+        vocals.wav ... other.wav
+        manifest.json   <- full hash, model, parameters, per-stage keys, file sizes, last access
+
+An entry can be produced in stages (e.g. Demucs, then DSP-derived stems). Each stage has its own
+key in the manifest, so a parameter change only invalidates the stages it actually feeds.
+
+Manifests are only changed by read-modify-write under a short per-entry lock file (shared by
+threads and worker processes), so a last-access refresh never drops what a concurrent commit
+recorded.
+
+Anything that reads or writes cached files goes through this module:
+- adopt_legacy(): records folders written before manifests existed (no recomputation)
+- lookup()  : hit/miss check, refreshes last access on a hit
+- commit()  : records a freshly written entry, then enforces the budget
+- touch()   : refreshes last access when files are read (e.g. by the mixer)
+- record_files(): re-measures an entry after files were added to it (e.g. UI previews)
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from config.config import CACHE_DIR, USE_CACHE, CACHE_MAX_BYTES
+
+CACHE_ROOT = Path(CACHE_DIR)
+MANIFEST_NAME = "manifest.json"
+# A manifest lock is held for a read and a write; one this old was left by a crashed process
+MANIFEST_LOCK_STALE_SEC = 10.0
+
+# Counters for this process (the budget scan itself is always global, it reads the disk)
+CACHE_STATS = {"hits": 0, "misses": 0, "evictions": 0, "bytes_evicted": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        CACHE_STATS[name] += amount
+
+
+def make_key(parts):
+    """Stable cache key for a JSON-serializable description of an output (inputs + parameters)."""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def _write_manifest(entry_dir, manifest):
+    """Atomically replaces the entry's manifest (readers never see a half-written file)."""
+    tmp_path = entry_dir / f".{MANIFEST_NAME}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, entry_dir / MANIFEST_NAME)
+
+
+@contextlib.contextmanager
+def _manifest_lock(entry_dir):
+    """Holds the entry's manifest lock for a read-modify-write of its manifest."""
+    lock_path = Path(entry_dir) / f".{MANIFEST_NAME}.lock"
+    while True:
+        try:
+            os.close(os.open(str(lock_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - lock_path.stat().st_mtime > MANIFEST_LOCK_STALE_SEC:
+                    lock_path.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.005)
+    try:
+        yield
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            lock_path.unlink()
+
+
+def read_manifest(entry_dir):
+    """Returns the manifest dict of `entry_dir`, or None if it has none (or it is unreadable)."""
+    try:
+        with open(Path(entry_dir) / MANIFEST_NAME) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def source_key(file_path):
+    """
+    Cache key of the stage that produced a cached file (for stems: the track's content hash plus
+    separation / DSP parameters). Falls back to path + size + mtime for files outside the cache.
+    Used to key outputs derived from cached files (mixes, stem matrices).
+    """
+    file_path = Path(file_path)
+    stages = (read_manifest(file_path.parent) or {}).get("stages") or {}
+    stage = stages.get(file_path.stem) or stages.get("demucs")
+    if stage and stage.get("key"):
+        return stage["key"]
+    st = file_path.stat()
+    return f"{file_path.resolve()}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _file_sizes(entry_dir):
+    return {
+        p.name: p.stat().st_size
+        for p in Path(entry_dir).iterdir()
+        if p.is_file() and p.name != MANIFEST_NAME and not p.name.startswith(".")
+    }
+
+
+def _has_files(entry_dir, stage):
+    """True if every file of `stage` exists and is not an empty placeholder."""
+    paths = [Path(entry_dir) / f for f in stage.get("files", ())]
+    return all(p.exists() and p.stat().st_size > 0 for p in paths)
+
+
+def adopt_legacy(entry_dir, stages, key, kind, params=None, **extra):
+    """
+    Writes a manifest for a folder produced before manifests existed, so it is reused instead of
+    recomputed. Every stage in `stages` (see stale_stages) whose files are all present is recorded
+    under its current key, i.e. as produced with the current parameters; the others stay stale.
+
+    Returns:
+        True if the folder was adopted, False if it already has a manifest or holds no stage.
+    """
+    entry_dir = Path(entry_dir)
+    if (not USE_CACHE or not entry_dir.is_dir() or (entry_dir / MANIFEST_NAME).exists()
+            or _is_locked(entry_dir)):  # being written right now, not a leftover
+        return False
+    present = {
+        name: {"key": stage["key"], "params": stage.get("params", {})}
+        for name, stage in stages.items() if _has_files(entry_dir, stage)
+    }
+    if not present:
+        return False
+    print(f"Cache: Adopted {entry_dir.name} ({', '.join(sorted(present))})")
+    commit(entry_dir, key, kind, params=params, stages=present, **extra)
+    return True
+
+
+def stale_stages(entry_dir, stages):
+    """
+    Returns the set of stage names in `stages` that must be recomputed for `entry_dir`.
+
+    Args:
+        entry_dir: The entry folder.
+        stages: Dict stage name -> {"key": str, "params": dict, "files": [file names]}.
+
+    A stage is stale when one of its files is missing or its recorded key differs. Entries written
+    before per-stage keys existed only recorded the first stage's parameters under "params"; a
+    stage whose parameters match those is kept, everything else is recomputed. Folders without a
+    manifest predate the cache and were produced with the default parameters: only their files
+    count (see adopt_legacy).
+    """
+    entry_dir = Path(entry_dir)
+    manifest = read_manifest(entry_dir)
+    if manifest is None:
+        return {name for name, stage in stages.items() if not _has_files(entry_dir, stage)}
+    recorded = manifest.get("stages")
+    stale = set()
+    for name, stage in stages.items():
+        if not all((entry_dir / f).exists() for f in stage.get("files", ())):
+            stale.add(name)
+        elif recorded is not None:
+            if recorded.get(name, {}).get("key") != stage["key"]:
+                stale.add(name)
+        elif manifest.get("params") != stage.get("params"):
+            stale.add(name)
+    return stale
+
+
+def lookup(entry_dir, required_files=(), stages=None, record=True):
+    """
+    Checks whether `entry_dir` holds a complete cached result.
+
+    Args:
+        entry_dir: The entry folder.
+        required_files: File names that must all exist for a hit.
+        stages: Optional per-stage keys (see stale_stages); any stale stage makes it a miss.
+        record: Count the outcome in CACHE_STATS (False for internal re-checks).
+
+    Returns:
+        The entry manifest on a hit (last access refreshed), None on a miss. Folders written
+        before manifests existed are adopted on their first hit.
+    """
+    entry_dir = Path(entry_dir)
+    if (not USE_CACHE or not entry_dir.is_dir()
+            or not all((entry_dir / name).exists() for name in required_files)
+            or (stages and stale_stages(entry_dir, stages))):
+        if record:
+            _count("misses")
+        return None
+
+    try:
+        with _manifest_lock(entry_dir):
+            manifest = read_manifest(entry_dir)
+            if manifest is None:
+                manifest = {"key": None, "kind": "legacy", "params": {}, "created_at": time.time()}
+                if stages:
+                    manifest["stages"] = {name: {"key": s["key"], "params": s.get("params", {})}
+                                          for name, s in stages.items()}
+            manifest["last_access"] = time.time()
+            manifest.setdefault("files", _file_sizes(entry_dir))
+            manifest.setdefault("size_bytes", sum(manifest["files"].values()))
+            _write_manifest(entry_dir, manifest)
+    except FileNotFoundError:
+        # Evicted since the check above
+        if record:
+            _count("misses")
+        return None
+    if record:
+        _count("hits")
+    return manifest
+
+
+def commit(entry_dir, key, kind, params=None, **extra):
+    """
+    Records `entry_dir` as a cache entry after its files have been written, then evicts
+    least recently used entries if the cache is over budget. The new entry is never evicted here.
+
+    Args:
+        entry_dir: Folder holding the entry's files.
+        key: Full content hash / cache key of the entry.
+        kind: Entry type, e.g. 'stems' or 'mix'.
+        params: Parameters the entry was produced with (model, DSP settings, ...).
+        **extra: Additional manifest fields (e.g. model, source file name).
+
+    Returns:
+        The manifest that was written.
+    """
+    entry_dir = Path(entry_dir)
+    with _manifest_lock(entry_dir):
+        files = _file_sizes(entry_dir)
+        now = time.time()
+        previous = read_manifest(entry_dir) or {}
+        manifest = {
+            **previous,
+            **extra,
+            "key": key,
+            "kind": kind,
+            "params": params or {},
+            "files": files,
+            "size_bytes": sum(files.values()),
+            "created_at": previous.get("created_at", now),
+            "last_access": now,
+        }
+        _write_manifest(entry_dir, manifest)
+    enforce_budget(protect=[entry_dir])
+    return manifest
+
+
+def _update_manifest(entry_dir, update):
+    """Applies `update(manifest)` to the entry's manifest under its lock. No-op without a manifest."""
+    entry_dir = Path(entry_dir)
+    if not (entry_dir / MANIFEST_NAME).exists():
+        return
+    try:
+        with _manifest_lock(entry_dir):
+            manifest = read_manifest(entry_dir)
+            if manifest is not None:
+                update(manifest)
+                _write_manifest(entry_dir, manifest)
+    except FileNotFoundError:
+        pass  # evicted meanwhile
+
+
+def touch(entry_dir):
+    """Refreshes the last access time of a cache entry (no-op for folders without a manifest)."""
+    _update_manifest(entry_dir, lambda manifest: manifest.update(last_access=time.time()))
+
+
+def record_files(entry_dir):
+    """
+    Re-measures the files of an existing entry, so files added after its commit (UI previews
+    encoded in the background, peaks) count toward its size and the budget. No-op for folders
+    without a manifest.
+    """
+    def update(manifest):
+        manifest["files"] = _file_sizes(entry_dir)
+        manifest["size_bytes"] = sum(manifest["files"].values())
+    _update_manifest(entry_dir, update)
+
+
+def list_entries(root=None):
+    """
+    Returns [(entry_dir, manifest), ...] for every entry under `root` (default CACHE_ROOT),
+    least recently used first.
+    """
+    root = Path(root) if root is not None else CACHE_ROOT
+    if not root.is_dir():
+        return []
+    entries = []
+    for manifest_path in root.rglob(MANIFEST_NAME):
+        manifest = read_manifest(manifest_path.parent)
+        if manifest is not None:
+            entries.append((manifest_path.parent, manifest))
+    entries.sort(key=lambda e: e[1].get("last_access", 0))
+    return entries
+
+
+def _is_locked(entry_dir):
+    """An entry is in use while a single-flight lock file sits next to it."""
+    return (entry_dir.parent / f"{entry_dir.name}.lock").exists()
+
+
+def enforce_budget(max_bytes=None, root=None, protect=()):
+    """
+    Deletes least recently used entries until the cache fits in `max_bytes`
+    (default CACHE_MAX_BYTES). Entries in `protect` or currently locked are skipped.
+
+    Returns:
+        List of evicted entry folders.
+    """
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    protected = {Path(p).resolve() for p in protect}
+    entries = list_entries(root)
+    total = sum(m.get("size_bytes", 0) for _, m in entries)
+
+    evicted = []
+    for entry_dir, manifest in entries:
+        if total <= max_bytes:
+            break
+        if entry_dir.resolve() in protected or _is_locked(entry_dir):
+            continue
+        size = manifest.get("size_bytes", 0)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total -= size
+        evicted.append(entry_dir)
+        _count("evictions")
+        _count("bytes_evicted", size)
+        print(f"Cache: Evicted {entry_dir.name} ({size / 1e6:.1f} MB, LRU)")
+    return evicted
+
+
+def get_cache_stats(root=None):
+    """
+    Returns this process's hit/miss/eviction counters plus the current on-disk totals
+    (entries, bytes, budget).
+    """
+    entries = list_entries(root)
+    with _stats_lock:
+        stats = dict(CACHE_STATS)
+    stats.update({
+        "entries": len(entries),
+        "size_bytes": sum(m.get("size_bytes", 0) for _, m in entries),
+        "max_bytes": CACHE_MAX_BYTES,
+    })
+    return stats
@@ -0,0 +1,180 @@
+"""
+Ragam App: Chord Recognition Engine
+Template-matching chord recognition over chroma, vectorized: a vocabulary holds one
+(n_chords, 12) template matrix, built once, and all frames are scored with a single matrix product
+
+    scores[chord, frame] = templates[chord] . chroma[:, frame]
+
+Templates are binary pitch-class sets normalized to unit length, so chords with more notes (7ths)
+don't outscore their triads just by covering more pitch classes. Adding chord types to a
+vocabulary adds rows to the matrix; the per-frame cost stays one column of a matrix product.
+
+For a timeline, decode() smooths labels with an HMM: chords are states (plus a no-chord state),
+emissions come from the template scores, and a Viterbi pass over a "stay or switch" transition
+matrix picks the best label sequence. The pass is vectorized over states, so its cost grows
+linearly with the number of frames (or beats).
+
+NumPy only (no librosa), so it runs wherever the chroma comes from.
+"""
+
+import numpy as np
+
+NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+NO_CHORD = "N/A"
+
+# Quality -> semitone intervals above the root; labels are "<root> <quality>" (e.g. "A Min7")
+CHORD_QUALITIES = {
+    "Maj": (0, 4, 7),
+    "Min": (0, 3, 7),
+    "Dom7": (0, 4, 7, 10),
+    "Maj7": (0, 4, 7, 11),
+    "Min7": (0, 3, 7, 10),
+    "Sus2": (0, 2, 7),
+    "Sus4": (0, 5, 7),
+    "Power": (0, 7),
+}
+
+VOCABULARIES = {
+    "majmin": ("Maj", "Min"),
+    "sevenths": ("Maj", "Min", "Dom7", "Maj7", "Min7"),
+    "full": tuple(CHORD_QUALITIES),
+}
+
+
+def transition_matrix(n_states, self_prob):
+    """(n_states, n_states) transition probabilities: stay with `self_prob`, else switch uniformly."""
+    if n_states == 1:
+        return np.ones((1, 1))
+    trans = np.full((n_states, n_states), (1.0 - self_prob) / (n_states - 1))
+    np.fill_diagonal(trans, self_prob)
+    return trans
+
+
+def viterbi(log_emission, log_transition, log_initial=None):
+    """
+    Most likely state sequence of an HMM.
+
+    Args:
+        log_emission: (n_states, frames) log-likelihood of each frame under each state.
+        log_transition: (n_states, n_states) log-probability of moving from row to column state.
+        log_initial: (n_states,) log-probability of the first state (default uniform).
+
+    Returns:
+        np.ndarray of state indices, one per frame.
+    """
+    n_states, n_frames = log_emission.shape
+    if n_frames == 0:
+        return np.zeros(0, dtype=int)
+    if log_initial is None:
+        log_initial = np.full(n_states, -np.log(n_states))
+    backpointers = np.empty((n_frames, n_states), dtype=np.int32)
+    score = log_initial + log_emission[:, 0]
+    states = np.arange(n_states)
+    with np.errstate(invalid="ignore"):
+        for t in range(1, n_frames):
+            # candidates[i, j]: best path ending in i, then moving to j
+            candidates = score[:, None] + log_transition
+            backpointers[t] = np.argmax(candidates, axis=0)
+            score = candidates[backpointers[t], states] + log_emission[:, t]
+
+    path = np.empty(n_frames, dtype=int)
+    path[-1] = int(np.argmax(score))
+    for t in range(n_frames - 1, 0, -1):
+        path[t - 1] = backpointers[t, path[t]]
+    return path
+
+
+def merge_segments(labels, starts, ends):
+    """Run-length merges per-frame `labels` into [(start, end, label), ...] segments."""
+    labels = np.asarray(labels)
+    if len(labels) == 0:
+        return []
+    change = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+    first = np.concatenate([[0], change])
+    last = np.concatenate([change, [len(labels)]]) - 1
+    return [(float(starts[i]), float(ends[j]), str(labels[i])) for i, j in zip(first, last)]
+
+
+class ChordVocabulary:
+    """A set of chord templates, scored against chroma frames in one matrix product."""
+
+    def __init__(self, qualities=VOCABULARIES["majmin"]):
+        unknown = [q for q in qualities if q not in CHORD_QUALITIES]
+        if unknown:
+            raise ValueError(f"Unknown chord qualities: {', '.join(unknown)}")
+        labels, rows = [], []
+        # Root-major order (C Maj, C Min, C# Maj, ...): ties go to the earlier chord
+        for root in range(12):
+            for quality in qualities:
+                row = np.zeros(12, dtype=np.float32)
+                row[[(root + step) % 12 for step in CHORD_QUALITIES[quality]]] = 1.0
+                labels.append(f"{NOTE_NAMES[root]} {quality}")
+                rows.append(row / np.linalg.norm(row))
+        self.qualities = tuple(qualities)
+        self.labels = np.array(labels + [NO_CHORD])  # index -1 is "no chord"
+        self.templates = np.stack(rows)
+
+    @classmethod
+    def named(cls, name):
+        """The vocabulary registered under `name` in VOCABULARIES."""
+        if name not in VOCABULARIES:
+            raise ValueError(f"Unknown chord vocabulary: {name} (choose from {', '.join(VOCABULARIES)})")
+        return cls(VOCABULARIES[name])
+
+    def __len__(self):
+        return len(self.templates)
+
+    def score(self, chroma):
+        """(n_chords, frames) template scores of a (12, frames) chroma matrix."""
+        return self.templates @ np.asarray(chroma, dtype=np.float32)
+
+    def recognize(self, chroma, min_energy=0.0):
+        """
+        Best chord per chroma frame.
+
+        Args:
+            chroma: (12, frames) chroma (a single (12,) frame is accepted too).
+            min_energy: Frames whose chroma peak is below this get NO_CHORD.
+
+        Returns:
+            (labels, scores, indices): Arrays of length frames; indices are rows of `templates`
+            (-1 and score 0 for NO_CHORD frames).
+        """
+        chroma = np.asarray(chroma, dtype=np.float32)
+        if chroma.ndim == 1:
+            chroma = chroma[:, None]
+        scores = self.score(chroma)
+        indices = np.argmax(scores, axis=0)
+        best = scores[indices, np.arange(scores.shape[1])]
+        silent = chroma.max(axis=0) < min_energy
+        indices[silent] = -1
+        best[silent] = 0.0
+        return self.labels[indices], best, indices
+
+    def decode(self, chroma, min_energy=0.0, self_prob=0.8, emission_scale=15.0):
+        """
+        HMM-smoothed chord per chroma frame (or beat).
+
+        Args:
+            chroma: (12, frames) chroma, typically beat-synchronous.
+            min_energy: Frames whose chroma peak is below this can only be NO_CHORD (and the
+                others can't be).
+            self_prob: Probability of keeping the current chord from one frame to the next.
+            emission_scale: Sharpness of the emission model, log p(frame | chord) = scale * score.
+
+        Returns:
+            (labels, indices): Arrays of length frames (index -1 for NO_CHORD).
+        """
+        chroma = np.asarray(chroma, dtype=np.float32)
+        n_chords = len(self)
+        quiet = chroma.max(axis=0) < min_energy if chroma.shape[1] else np.zeros(0, dtype=bool)
+        # States 0..n_chords-1 are the chords, state n_chords is "no chord"
+        log_emission = np.empty((n_chords + 1, chroma.shape[1]))
+        log_emission[:n_chords] = emission_scale * self.score(chroma)
+        log_emission[:n_chords, quiet] = -np.inf
+        log_emission[n_chords] = np.where(quiet, 0.0, -np.inf)
+        with np.errstate(divide="ignore"):
+            log_transition = np.log(transition_matrix(n_chords + 1, self_prob))
+        path = viterbi(log_emission, log_transition)
+        indices = np.where(path == n_chords, -1, path)
+        return self.labels[indices], indices
@@ -0,0 +1,148 @@
+"""
+Ragam App: Decoded Audio Provider
+Decodes each (file, sample rate, channel layout, range) once and shares the PCM buffer.
+
+One analysis run reads the same file several times (key estimation, chord detection, pitch
+tracking), each with its own duration; the DSP stems read the same Demucs 'other' stem twice.
+load_audio() is a drop-in replacement for librosa.load() that serves all of these from one
+decoded float32 buffer:
+- Buffers are read-only numpy arrays; callers that need to modify them must copy first.
+- A request whose range lies inside an already decoded range is served as a slice (no decode).
+- Buffers are evicted least recently used once their total size exceeds DECODE_CACHE_MAX_BYTES.
+- Files are identified by path, size and mtime, so a rewritten file is never served stale.
+- Reads that will never repeat (e.g. transcription windows) pass cache=False and keep nothing.
+
+Decode time is accumulated in DECODE_STATS so callers can report it apart from compute time.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from config.config import DECODE_CACHE_MAX_BYTES
+
+# file identity + sr + mono -> [(offset, duration or None, to_eof, y, sr), ...] (see _entries)
+_buffers = OrderedDict()
+_cache_bytes = 0
+_lock = threading.Lock()
+_file_locks = {}
+
+DECODE_STATS = {"hits": 0, "misses": 0, "decode_sec": 0.0, "evictions": 0}
+
+
+def _decode(path, sr, mono, offset, duration):
+    """The actual decode. Kept separate so the cache logic can be tested without audio codecs."""
+    import librosa
+    return librosa.load(path, sr=sr, mono=mono, offset=offset, duration=duration)
+
+
+def _file_key(path, sr, mono):
+    st = os.stat(path)
+    return (str(Path(path).resolve()), st.st_size, st.st_mtime_ns, sr, mono)
+
+
+def _covers(entry, offset, duration):
+    """True if the decoded range of `entry` contains [offset, offset + duration)."""
+    e_offset, e_duration, to_eof = entry[0], entry[1], entry[2]
+    if offset < e_offset:
+        return False
+    if to_eof:
+        return True
+    return duration is not None and offset + duration <= e_offset + e_duration + 1e-9
+
+
+def _slice(entry, offset, duration):
+    e_offset, _, _, y, sr = entry
+    start = int(round((offset - e_offset) * sr))
+    stop = None if duration is None else start + int(round(duration * sr))
+    return y[..., start:stop], sr
+
+
+def _evict(max_bytes):
+    """Drops least recently used files' buffers until the total fits. Caller holds _lock."""
+    global _cache_bytes
+    while _cache_bytes > max_bytes and len(_buffers) > 1:
+        _, entries = _buffers.popitem(last=False)
+        _cache_bytes -= sum(e[3].nbytes for e in entries)
+        DECODE_STATS["evictions"] += 1
+
+
+def load_audio(path, sr=22050, mono=True, offset=0.0, duration=None, cache=True):
+    """
+    Returns (y, sr) like librosa.load(), served from the shared decode cache.
+
+    Args:
+        path: Audio file path.
+        sr: Target sample rate (None keeps the native rate).
+        mono: Downmix to mono.
+        offset: Start time in seconds.
+        duration: Length in seconds (None reads to the end of the file).
+        cache: False decodes without consulting or filling the cache.
+
+    Returns:
+        (np.ndarray, int): Read-only float32 samples and the sample rate.
+    """
+    path = str(path)
+    offset = float(offset or 0.0)
+    if not cache:
+        start = time.perf_counter()
+        y, out_sr = _decode(path, sr, mono, offset, duration)
+        with _lock:
+            DECODE_STATS["misses"] += 1
+            DECODE_STATS["decode_sec"] += time.perf_counter() - start
+        y.flags.writeable = False
+        return y, out_sr
+
+    key = _file_key(path, sr, mono)
+
+    with _lock:
+        file_lock = _file_locks.setdefault(key, threading.Lock())
+
+    # One decode per file at a time: concurrent callers wait and are then served from the cache
+    with file_lock:
+        with _lock:
+            for entry in _buffers.get(key, ()):
+                if _covers(entry, offset, duration):
+                    _buffers.move_to_end(key)
+                    DECODE_STATS["hits"] += 1
+                    return _slice(entry, offset, duration)
+
+        start = time.perf_counter()
+        y, out_sr = _decode(path, sr, mono, offset, duration)
+        elapsed = time.perf_counter() - start
+        y.flags.writeable = False
+        # A short read means the file ended inside the requested range (librosa truncates the
+        # requested length, so one sample short is still a full read)
+        to_eof = duration is None or y.shape[-1] < int(round(duration * out_sr)) - 1
+        entry = (offset, duration, to_eof, y, out_sr)
+
+        global _cache_bytes
+        with _lock:
+            DECODE_STATS["misses"] += 1
+            DECODE_STATS["decode_sec"] += elapsed
+            # The new range may supersede narrower ones decoded earlier
+            previous = _buffers.pop(key, [])
+            kept = [e for e in previous if not _covers(entry, e[0], None if e[2] else e[1])]
+            _buffers[key] = kept + [entry]
+            _cache_bytes += sum(e[3].nbytes for e in kept + [entry]) - sum(e[3].nbytes for e in previous)
+            _evict(DECODE_CACHE_MAX_BYTES)
+        return y, out_sr
+
+
+def get_decode_stats():
+    """Returns a copy of the hit/miss counters, total decode seconds, and the cached bytes."""
+    with _lock:
+        stats = dict(DECODE_STATS)
+        stats["cached_bytes"] = _cache_bytes
+    return stats
+
+
+def clear():
+    """Drops every cached buffer (counters are kept)."""
+    global _cache_bytes
+    with _lock:
+        _buffers.clear()
+        _file_locks.clear()
+        _cache_bytes = 0
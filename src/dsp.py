@@ -0,0 +1,146 @@
+"""
+Ragam App: Derived-Stem DSP Engine
+Shares the expensive part of harmonic/percussive separation (HPSS) between derived stems.
+
+librosa.effects.hpss(y, margin) is an STFT, two median filters over the magnitude, two soft masks
+and an inverse STFT. Only the masks depend on the margin, so the STFT and both median-filtered
+spectrograms of an input stem are computed once here and every margin-specific output
+(harmonic part of 'other' for flute, percussive part of 'other' and 'drums' for percussion)
+is derived from them. Outputs match librosa.effects.hpss with the default kernel and STFT settings.
+
+Intermediates are large (roughly 5x the decoded audio). A post-processing pass announces how many
+components it will take from each input (expect_uses), and an input's intermediates are freed as
+soon as its last one has been taken; otherwise only the most recent HPSS_CACHE_MAX_ENTRIES inputs
+are kept. Call clear() once a pass is finished.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import librosa
+from scipy.ndimage import median_filter
+
+from src.decode import load_audio
+
+HPSS_KERNEL_SIZE = 31       # librosa.decompose.hpss default
+HPSS_CACHE_MAX_ENTRIES = 2  # 'other' and 'drums' of the track being post-processed
+
+# (path, size, mtime_ns, sr) -> (stft, harm, perc, length, sr)
+_intermediates = OrderedDict()
+_lock = threading.Lock()
+_key_locks = {}
+_pending_uses = {}  # key -> components still to be taken (see expect_uses)
+
+HPSS_STATS = {"computed": 0, "reused": 0, "released": 0, "compute_sec": 0.0}
+
+
+def _key(path, sr):
+    st = os.stat(path)
+    # None and an explicit native rate decode the same samples, so they share one entry
+    return str(Path(path).resolve()), st.st_size, st.st_mtime_ns, sr or librosa.get_samplerate(str(path))
+
+
+def _compute(path, sr):
+    y, sr = load_audio(path, sr=sr)
+    stft = librosa.stft(y)
+    mag = np.abs(stft)
+    # Same kernels as librosa.decompose.hpss: along time for harmonic, along frequency for percussive
+    harm = median_filter(mag, size=(1, HPSS_KERNEL_SIZE), mode="reflect")
+    perc = median_filter(mag, size=(HPSS_KERNEL_SIZE, 1), mode="reflect")
+    return stft, harm, perc, len(y), sr
+
+
+def hpss_intermediates(path, sr=None):
+    """
+    Returns (stft, harm, perc, length, sr) for an audio file, computing them on first use.
+    `harm` / `perc` are the median-filtered magnitude spectrograms; treat all arrays as read-only.
+    """
+    key = _key(path, sr)
+    with _lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    with key_lock:
+        with _lock:
+            if key in _intermediates:
+                _intermediates.move_to_end(key)
+                HPSS_STATS["reused"] += 1
+                return _intermediates[key]
+
+        start = time.perf_counter()
+        result = _compute(path, sr)
+        with _lock:
+            HPSS_STATS["computed"] += 1
+            HPSS_STATS["compute_sec"] += time.perf_counter() - start
+            _intermediates[key] = result
+            while len(_intermediates) > HPSS_CACHE_MAX_ENTRIES:
+                _intermediates.popitem(last=False)
+        return result
+
+
+def hpss_component(path, component, margin=1.0, sr=None):
+    """
+    Harmonic or percussive part of an audio file, equivalent to
+    librosa.effects.hpss(y, margin=margin)[0 or 1] but sharing the STFT and median filters.
+
+    Args:
+        path: Audio file path.
+        component: 'harmonic' or 'percussive'.
+        margin: HPSS margin (>= 1); larger values give a cleaner but quieter component.
+        sr: Sample rate to decode at (None keeps the native rate).
+
+    Returns:
+        (np.ndarray, int): The component signal and its sample rate.
+    """
+    if component not in ("harmonic", "percussive"):
+        raise ValueError(f"Unknown HPSS component: {component}")
+    if margin < 1:
+        raise ValueError("Margins must be >= 1.0. A typical range is between 1 and 10.")
+
+    stft, harm, perc, length, out_sr = hpss_intermediates(path, sr=sr)
+    target, other = (harm, perc) if component == "harmonic" else (perc, harm)
+    mask = librosa.util.softmask(target, other * margin, power=2.0, split_zeros=(margin == 1))
+    del harm, perc, target, other
+    _used(_key(path, sr))
+    return librosa.istft(stft * mask, length=length), out_sr
+
+
+def expect_uses(uses):
+    """
+    Announces how many hpss_component() calls will read each input ({path: count}, native rate),
+    so its intermediates are freed right after the last one instead of when the pass ends.
+    """
+    with _lock:
+        for path, count in uses.items():
+            key = _key(path, None)
+            _pending_uses[key] = _pending_uses.get(key, 0) + count
+
+
+def _used(key):
+    """Counts one announced use of `key`; frees its intermediates after the last."""
+    with _lock:
+        if key not in _pending_uses:
+            return
+        _pending_uses[key] -= 1
+        if _pending_uses[key] <= 0:
+            del _pending_uses[key]
+            if _intermediates.pop(key, None) is not None:
+                HPSS_STATS["released"] += 1
+            _key_locks.pop(key, None)
+
+
+def get_hpss_stats():
+    """Returns a copy of the computed/reused/released counters and total intermediate compute seconds."""
+    with _lock:
+        return dict(HPSS_STATS)
+
+
+def clear():
+    """Frees all cached intermediates (counters are kept)."""
+    with _lock:
+        _intermediates.clear()
+        _key_locks.clear()
+        _pending_uses.clear()
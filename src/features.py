@@ -0,0 +1,179 @@
+"""
+Ragam App: Shared Analysis Features
+Computes the constant-Q transform (CQT) and chroma of a (track, range) once and serves every
+analysis step from them.
+
+Key estimation (60 s), raga matching (from the key's chroma) and the chord timeline (up to
+CHORD_TIMELINE_MAX_SEC) all need chroma of the same audio, and the CQT behind it is the most
+expensive analysis step; the app runs the longest range first so the others are slices of it. Features are
+computed with librosa.feature.chroma_cqt's defaults (hop 512, 7 octaves, 36 bins per octave, tuning
+estimated from the audio), so results match calling chroma_cqt directly. Like src.decode:
+- Arrays are read-only; callers that need to modify them must copy first.
+- A request whose range lies inside an already computed range is served as a frame slice. The
+  slice uses the longer range's tuning estimate, so it differs slightly from a direct computation
+  (and more in its last few frames, where the direct computation sees the end of the audio).
+- Entries are kept for the FEATURE_CACHE_MAX_ENTRIES most recently used tracks.
+- Chroma is also persisted per exact range in the analysis cache (src.analysis_cache), so a repeat
+  analysis in a later session loads it instead of computing the CQT (the CQT itself, ~20x larger,
+  stays in memory only). That includes ranges served as slices (e.g. the key's 60 s of the chord
+  timeline's range), so a later session gets the same chroma without the longer range in memory.
+
+Time spent per feature is accumulated in FEATURE_STATS so callers can report it.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import librosa
+
+from src import analysis_cache
+from src.decode import load_audio
+
+HOP_LENGTH = 512
+BINS_PER_OCTAVE = 36
+N_OCTAVES = 7
+FEATURE_CACHE_MAX_ENTRIES = 4
+
+# (path, size, mtime_ns, sr) -> [(offset, duration or None, to_eof, cqt or None, chroma), ...]
+_features = OrderedDict()
+_lock = threading.Lock()
+_key_locks = {}
+_persisted = {}  # key -> {(offset, duration), ...} ranges whose chroma is in the analysis cache
+
+FEATURE_STATS = {"hits": 0, "disk_hits": 0, "misses": 0, "cqt_sec": 0.0, "chroma_sec": 0.0}
+
+
+def _covers(entry, offset, duration):
+    """True if the analyzed range of `entry` contains [offset, offset + duration)."""
+    e_offset, e_duration, to_eof = entry[0], entry[1], entry[2]
+    if offset < e_offset:
+        return False
+    if to_eof:
+        return True
+    return duration is not None and offset + duration <= e_offset + e_duration + 1e-9
+
+
+def _slice(entry, offset, duration, sr):
+    """(cqt, chroma) frames of `entry` for [offset, offset + duration), as many as a direct computation gives."""
+    e_offset, _, _, cqt, chroma = entry
+    start = int(round((offset - e_offset) * sr / HOP_LENGTH))
+    stop = None if duration is None else start + 1 + int(round(duration * sr)) // HOP_LENGTH
+    return (None if cqt is None else cqt[:, start:stop]), chroma[:, start:stop]
+
+
+def _compute(y, sr):
+    start = time.perf_counter()
+    cqt = np.abs(librosa.cqt(
+        y=y, sr=sr, hop_length=HOP_LENGTH,
+        n_bins=N_OCTAVES * BINS_PER_OCTAVE, bins_per_octave=BINS_PER_OCTAVE,
+        tuning=None,  # estimated from the audio, as chroma_cqt does (cqt itself defaults to 0)
+    ))
+    cqt_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chroma = librosa.feature.chroma_cqt(C=cqt, sr=sr, hop_length=HOP_LENGTH, bins_per_octave=BINS_PER_OCTAVE)
+    chroma_sec = time.perf_counter() - start
+    cqt.flags.writeable = False
+    chroma.flags.writeable = False
+    return cqt, chroma, cqt_sec, chroma_sec
+
+
+def _insert(key, entry):
+    """Adds `entry` for `key`, dropping narrower ranges it supersedes. Caller holds _lock."""
+    kept = [e for e in _features.pop(key, []) if not _covers(entry, e[0], None if e[2] else e[1])]
+    _features[key] = kept + [entry]
+    _persisted.setdefault(key, set()).add((entry[0], entry[1]))
+    while len(_features) > FEATURE_CACHE_MAX_ENTRIES:
+        evicted, _ = _features.popitem(last=False)
+        _persisted.pop(evicted, None)
+
+
+def _get(path, offset, duration, sr, need_cqt):
+    st = os.stat(path)
+    key = (str(Path(path).resolve()), st.st_size, st.st_mtime_ns, sr)
+    offset = float(offset or 0.0)
+    with _lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    disk_params = {"offset": offset, "duration": duration, "sr": sr, "hop_length": HOP_LENGTH,
+                   "bins_per_octave": BINS_PER_OCTAVE, "n_octaves": N_OCTAVES}
+    with key_lock:
+        hit = None
+        with _lock:
+            for entry in _features.get(key, ()):
+                if _covers(entry, offset, duration) and (entry[3] is not None or not need_cqt):
+                    _features.move_to_end(key)
+                    FEATURE_STATS["hits"] += 1
+                    hit = _slice(entry, offset, duration, sr)
+                    persisted = _persisted.setdefault(key, set())
+                    store_slice = (offset, duration) not in persisted
+                    persisted.add((offset, duration))
+                    break
+        if hit is not None:
+            if store_slice:
+                # A later session asking for this range loads it rather than computing the CQT
+                chroma = hit[1]
+                to_eof = duration is None or chroma.shape[1] < 1 + int(round(duration * sr)) // HOP_LENGTH
+                analysis_cache.store(path, "chroma", disk_params, {"chroma": chroma, "to_eof": to_eof, "sr": sr})
+            return (*hit, sr)
+        if not need_cqt:
+            stored = analysis_cache.load(path, "chroma", disk_params)
+            if stored is not None:
+                chroma = stored["chroma"]
+                chroma.flags.writeable = False
+                with _lock:
+                    FEATURE_STATS["disk_hits"] += 1
+                    _insert(key, (offset, duration, bool(stored["to_eof"]), None, chroma))
+                return None, chroma, int(stored["sr"])
+
+        y, sr = load_audio(path, sr=sr, offset=offset, duration=duration)
+        cqt, chroma, cqt_sec, chroma_sec = _compute(y, sr)
+        # A short read means the file ended inside the requested range (see src.decode)
+        to_eof = duration is None or len(y) < int(round(duration * sr)) - 1
+        with _lock:
+            FEATURE_STATS["misses"] += 1
+            FEATURE_STATS["cqt_sec"] += cqt_sec
+            FEATURE_STATS["chroma_sec"] += chroma_sec
+            _insert(key, (offset, duration, to_eof, cqt, chroma))
+        analysis_cache.store(path, "chroma", disk_params, {"chroma": chroma, "to_eof": to_eof, "sr": sr})
+        return cqt, chroma, sr
+
+
+def get_features(path, offset=0.0, duration=None, sr=22050):
+    """
+    Returns the CQT magnitude and chroma of an audio file range, computing them on first use.
+
+    Args:
+        path: Audio file path.
+        offset: Start time in seconds.
+        duration: Length in seconds (None analyzes to the end of the file).
+        sr: Sample rate the audio is analyzed at.
+
+    Returns:
+        (cqt, chroma, sr): Read-only (n_bins, frames) and (12, frames) arrays, hop HOP_LENGTH.
+    """
+    return _get(path, offset, duration, sr, need_cqt=True)
+
+
+def get_chroma(path, offset=0.0, duration=None, sr=22050):
+    """Chroma (12, frames) of an audio file range, from memory, the analysis cache, or computed; see get_features()."""
+    _, chroma, sr = _get(path, offset, duration, sr, need_cqt=False)
+    return chroma, sr
+
+
+def get_feature_stats():
+    """Returns a copy of the hit/miss counters and total seconds spent per feature."""
+    with _lock:
+        return dict(FEATURE_STATS)
+
+
+def clear():
+    """Drops every cached feature (counters are kept)."""
+    with _lock:
+        _features.clear()
+        _key_locks.clear()
+        _persisted.clear()
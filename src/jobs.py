@@ -0,0 +1,348 @@
+"""
+Ragam App: Separation Job Queue
+Runs separate_audio() on a pool of worker processes so the Streamlit script thread never blocks.
+
+Flow:
+1. submit_separation(file_path) queues a job and returns its id immediately.
+2. Worker processes (each with the Demucs model preloaded) pick jobs up and report progress.
+3. The UI polls get_job(job_id) until the status is 'done' or 'failed', then collect_job(job_id)
+   hands over the result and drops the record.
+
+The pool lives for the lifetime of the server process and is shared by all sessions, so the
+number of concurrent separations (and the cores they use) is bounded by config, not by users.
+Submissions are single-flight: a second request for the same content hash + model joins the
+job already in flight instead of queueing a duplicate.
+"""
+
+import atexit
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config.config import DEMUCS_MODEL, SEPARATION_WORKERS, SEPARATION_THREADS_PER_WORKER
+
+# Job status values
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_jobs = {}                # job_id -> job record (dict)
+_inflight = {}            # (file_hash or file identity, model_name) -> job_id of the queued/running job
+_jobs_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+_progress_queue = None    # worker -> parent progress messages: (job_id, stage, fraction)
+_progress_thread = None
+
+# Finished jobs nobody collected (e.g. the browser tab was closed) are dropped after this long
+FINISHED_JOB_TTL_SEC = 3600
+
+# Single-flight counters. Lock figures are summed from the workers' per-run stats.
+JOB_STATS = {"submitted": 0, "dedup_hits": 0, "lock_acquisitions": 0, "lock_wait_sec": 0.0, "lock_dedup_hits": 0}
+
+# Set inside each worker process by _init_worker
+_worker_progress_queue = None
+
+
+def _threads_per_worker():
+    """Torch threads per worker: explicit config, or the cores split evenly across workers."""
+    if SEPARATION_THREADS_PER_WORKER > 0:
+        return SEPARATION_THREADS_PER_WORKER
+    return max(1, (os.cpu_count() or 1) // max(1, SEPARATION_WORKERS))
+
+
+def _init_worker(progress_queue, num_threads, model_names):
+    """Process-pool initializer: pins torch threads and preloads the Demucs models."""
+    global _worker_progress_queue
+    _worker_progress_queue = progress_queue
+
+    import torch
+    torch.set_num_threads(num_threads)
+
+    from src.audio_processor import get_separation_model
+    for model_name in model_names:
+        try:
+            get_separation_model(model_name)
+        except Exception as e:
+            # Not fatal: the first job will retry the load and surface the error
+            print(f"Jobs: Could not preload model '{model_name}': {e}")
+
+
+def _run_separation_job(job_id, file_path, model_name, chunked):
+    """Executed in a worker. Returns (stem paths as strings, separation stats)."""
+    from src.audio_processor import separate_audio, get_separation_stats
+
+    def report(stage, fraction):
+        if _worker_progress_queue is not None:
+            _worker_progress_queue.put((job_id, stage, fraction))
+
+    stems = separate_audio(file_path, model_name, chunked=chunked, progress_callback=report)
+    return {name: str(path) for name, path in stems.items()}, get_separation_stats()
+
+
+def _drain_progress(progress_queue):
+    """Parent-side thread copying worker progress messages into the job records."""
+    # A rebuilt worker tier brings its own queue and drain thread
+    while progress_queue is _progress_queue:
+        try:
+            job_id, stage, fraction = progress_queue.get(timeout=1.0)
+        except queue.Empty:
+            continue
+        except (EOFError, OSError):
+            return
+        with _jobs_lock:
+            job = _jobs.get(job_id)
+            if job is not None and job["status"] in (QUEUED, RUNNING):
+                if job["status"] == QUEUED:
+                    job["status"] = RUNNING
+                    job["started_at"] = time.time()
+                job["stage"] = stage
+                job["progress"] = fraction
+
+
+def _get_executor():
+    """Starts the worker tier on first use."""
+    with _executor_lock:
+        if _executor is None:
+            _start_executor()
+        return _executor
+
+
+def _start_executor():
+    """Creates the worker pool and its progress queue. Call with _executor_lock held."""
+    global _executor, _progress_queue, _progress_thread
+    if SEPARATION_WORKERS <= 0:
+        # In-process fallback (e.g. frozen Windows builds): one background thread, no preloading
+        _progress_queue = queue.Queue()
+        _executor = ThreadPoolExecutor(
+            max_workers=1,
+            initializer=_init_worker,
+            initargs=(_progress_queue, _threads_per_worker(), []),
+        )
+    else:
+        # 'spawn' avoids forking a process that already holds torch thread pools
+        ctx = multiprocessing.get_context("spawn")
+        _progress_queue = ctx.Queue()
+        _executor = ProcessPoolExecutor(
+            max_workers=SEPARATION_WORKERS,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(_progress_queue, _threads_per_worker(), [DEMUCS_MODEL]),
+        )
+    _progress_thread = threading.Thread(target=_drain_progress, args=(_progress_queue,), daemon=True)
+    _progress_thread.start()
+    print(f"Jobs: Started {max(SEPARATION_WORKERS, 1)} separation worker(s) x {_threads_per_worker()} thread(s)")
+
+
+def _discard_executor(executor):
+    """
+    Drops a broken worker pool (a worker died, e.g. OOM-killed) so the next submission starts a
+    fresh one. No-op if `executor` was already replaced.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not executor:
+            return
+        _executor = None
+    print("Jobs: Worker pool broke; it will be restarted for the next job")
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _fail_job(job_id, error):
+    """Marks a job failed and releases its single-flight slot. Call with _jobs_lock held."""
+    job = _jobs[job_id]
+    job["finished_at"] = time.time()
+    job["status"] = FAILED
+    job["error"] = str(error) or type(error).__name__
+    job["traceback"] = "".join(traceback.format_exception(error))
+    _release_inflight(job_id)
+
+
+def _release_inflight(job_id):
+    """Frees every single-flight key of a job. Call with _jobs_lock held."""
+    for key in [key for key, holder in _inflight.items() if holder == job_id]:
+        del _inflight[key]
+
+
+def _on_job_finished(job_id, future):
+    with _jobs_lock:
+        job = _jobs[job_id]
+        job["finished_at"] = time.time()
+        _release_inflight(job_id)
+        try:
+            job["result"], job["stats"] = future.result()
+            job["status"] = DONE
+            job["stage"] = "Done"
+            job["progress"] = 1.0
+            if "lock_wait_sec" in job["stats"]:
+                JOB_STATS["lock_acquisitions"] += 1
+                JOB_STATS["lock_wait_sec"] += job["stats"]["lock_wait_sec"]
+            if job["stats"].get("dedup_hit"):
+                JOB_STATS["lock_dedup_hits"] += 1
+        except CancelledError:
+            _fail_job(job_id, RuntimeError("The separation was cancelled (the worker pool shut down)"))
+        except Exception as e:
+            _fail_job(job_id, e)
+
+
+def _new_job_record(job_id, key, file_path, model_name, submitted_at):
+    return {
+        "id": job_id,
+        "key": key,
+        "joined": 0,
+        "file_path": str(file_path),
+        "model": model_name,
+        "status": QUEUED,
+        "stage": "Queued",
+        "progress": 0.0,
+        "submitted_at": submitted_at,
+        "started_at": None,
+        "finished_at": None,
+        "result": None,
+        "stats": None,
+        "error": None,
+        "traceback": None,
+        "collected": 0,
+    }
+
+
+def _prune_finished(now):
+    """Drops finished job records older than FINISHED_JOB_TTL_SEC. Call with _jobs_lock held."""
+    expired = [
+        job_id for job_id, job in _jobs.items()
+        if job["finished_at"] is not None and now - job["finished_at"] > FINISHED_JOB_TTL_SEC
+    ]
+    for job_id in expired:
+        del _jobs[job_id]
+
+
+def submit_separation(file_path, model_name=DEMUCS_MODEL, chunked=None):
+    """
+    Queues a separation of `file_path` on the worker pool. If the same audio content is already
+    being separated with the same model, the existing job id is returned instead (single-flight).
+
+    Returns:
+        str: The job id to pass to get_job().
+    """
+    from src.utils import get_memoized_file_hash
+    from src.audio_processor import find_cached_stems
+
+    # Hashing a fresh upload reads the whole file, so it is left to the worker. Until the content
+    # hash is known, jobs are single-flighted by file identity; the worker's track lock still
+    # dedups the same audio uploaded under another path. A job is registered under both keys
+    # once the hash is known, as the worker memoizes it while the first job is still running.
+    st = os.stat(file_path)
+    keys = [(f"{Path(file_path).resolve()}:{st.st_size}:{st.st_mtime_ns}", model_name)]
+    file_hash = get_memoized_file_hash(file_path)
+    cached = None
+    if file_hash is not None:
+        keys.append((file_hash, model_name))
+        # Cache hits never need a worker slot: answer them with an already finished job
+        cached = find_cached_stems(file_path, model_name)
+    key = keys[-1]
+    if cached is not None:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with _jobs_lock:
+            JOB_STATS["submitted"] += 1
+            _prune_finished(now)
+            _jobs[job_id] = _new_job_record(job_id, key, file_path, model_name, now)
+            _jobs[job_id].update({
+                "status": DONE, "stage": "Done", "progress": 1.0,
+                "started_at": now, "finished_at": time.time(),
+                "result": {name: str(path) for name, path in cached.items()},
+                "stats": {"model": model_name, "cache_hit": True},
+            })
+        return job_id
+
+    with _jobs_lock:
+        JOB_STATS["submitted"] += 1
+        _prune_finished(time.time())
+        existing = next((_inflight[k] for k in keys if k in _inflight), None)
+        if existing is not None:
+            JOB_STATS["dedup_hits"] += 1
+            _jobs[existing]["joined"] += 1
+            print(f"Jobs: Joined in-flight job {existing[:8]} for {Path(file_path).name}")
+            return existing
+
+        job_id = uuid.uuid4().hex
+        _inflight.update(dict.fromkeys(keys, job_id))
+        _jobs[job_id] = _new_job_record(job_id, key, file_path, model_name, time.time())
+
+    # A pool whose worker died refuses new work: restart it once and retry. Any other failure
+    # fails the job, so later uploads of this file don't join a job that will never run.
+    executor = _get_executor()
+    try:
+        try:
+            future = executor.submit(_run_separation_job, job_id, str(file_path), model_name, chunked)
+        except BrokenProcessPool:
+            _discard_executor(executor)
+            executor = _get_executor()
+            future = executor.submit(_run_separation_job, job_id, str(file_path), model_name, chunked)
+    except Exception as e:
+        with _jobs_lock:
+            _fail_job(job_id, e)
+        return job_id
+
+    def finished(f, executor=executor):
+        # The job that lost its worker fails; the pool is replaced for the next one
+        if not f.cancelled() and isinstance(f.exception(), BrokenProcessPool):
+            _discard_executor(executor)
+        _on_job_finished(job_id, f)
+    future.add_done_callback(finished)
+    return job_id
+
+
+def get_job(job_id):
+    """
+    Returns a snapshot of the job record, or None for an unknown id.
+    Keys: id, key, joined (number of deduplicated submissions), file_path, model, status, stage,
+    progress (0-1), submitted_at, started_at, finished_at, result ({stem_name: path} when done),
+    stats, error and traceback (str when failed).
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+
+def collect_job(job_id):
+    """
+    Like get_job(), but once the job has finished its record is released: after every submitter
+    (the original one plus each joined duplicate) has collected it, it is removed from the table.
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        snapshot = dict(job)
+        if job["status"] in (DONE, FAILED):
+            job["collected"] += 1
+            if job["collected"] > job["joined"]:
+                del _jobs[job_id]
+        return snapshot
+
+
+def get_job_stats():
+    """Returns a copy of the submission / single-flight counters."""
+    with _jobs_lock:
+        return dict(JOB_STATS)
+
+
+def shutdown_workers():
+    """Stops the worker tier. Registered with atexit; safe to call more than once."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown_workers)
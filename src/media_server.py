@@ -0,0 +1,337 @@
+"""
+Ragam App: Media File Server
+Serves cached audio (stems, previews, mixes) to the browser over plain HTTP, so the UI references
+files by URL instead of inlining them into every Streamlit rerun.
+
+Only used when MEDIA_BASE_URL is set, i.e. when the deployment routes that URL to this server
+(typically a reverse-proxied path on the app's own origin). Without it the app falls back to
+inline audio and st.download_button (see media_src()), which work wherever Streamlit does.
+
+- Runs once per process on a background thread (http.server, no extra dependency).
+- Nothing is served by path. media_url() grants one session one audio file under a random token,
+  and only granted files are served: other sessions' uploads and stems, manifests, temp files and
+  directories can't be reached, whatever the filename. Grants expire after GRANT_TTL_SEC unless
+  used again, and revoke_session() drops a session's grants at once.
+- A grant names the file's current version (size + mtime); a rewritten file needs a new URL, so a
+  URL always names the same bytes and the browser may cache it for good.
+- HTTP Range requests (seeking, progressive playback), ETag / Last-Modified revalidation.
+- ?download=<name> adds Content-Disposition: attachment, for download links.
+- CORS only for MEDIA_ALLOW_ORIGIN (the app's origin, when the server sits on another one).
+
+URL layout: <MEDIA_BASE_URL>/<token>/<file name>
+"""
+
+import base64
+import functools
+import mimetypes
+import os
+import re
+import secrets
+import threading
+import time
+import urllib.parse
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from config.config import MEDIA_SERVER_HOST, MEDIA_SERVER_PORT, MEDIA_BASE_URL, MEDIA_ALLOW_ORIGIN
+
+COPY_CHUNK_BYTES = 256 * 1024
+PORT_ATTEMPTS = 10  # without MEDIA_BASE_URL, the next ports are tried when the configured one is taken
+GRANT_TTL_SEC = 6 * 3600
+MEDIA_SUFFIXES = {".wav", ".mp3", ".opus", ".ogg", ".flac", ".m4a"}
+
+mimetypes.add_type("audio/ogg", ".opus")
+mimetypes.add_type("audio/flac", ".flac")
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+_roots = {}
+_grants = {}          # token -> {"path", "session", "size", "mtime_ns", "expires_at"}
+_session_tokens = {}  # (session, path, size, mtime_ns) -> token
+_server = None
+_base_url = None
+_lock = threading.Lock()
+
+
+def is_enabled():
+    """True when the deployment exposes the media server to the browser (MEDIA_BASE_URL is set)."""
+    return bool(MEDIA_BASE_URL)
+
+
+def _resolve(url_path):
+    """Maps a request path to its granted file, or None (unknown / expired token, changed or missing file)."""
+    parts = [p for p in urllib.parse.unquote(url_path).split("/") if p]
+    if len(parts) != 2:
+        return None
+    with _lock:
+        grant = _grants.get(parts[0])
+        if grant is None or grant["expires_at"] < time.time():
+            return None
+        grant["expires_at"] = time.time() + GRANT_TTL_SEC
+    path = grant["path"]
+    if parts[1] != path.name:
+        return None
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    if st.st_size != grant["size"] or st.st_mtime_ns != grant["mtime_ns"]:
+        return None
+    return path
+
+
+def _parse_range(header, size):
+    """(start, end) inclusive for a single 'bytes=' range, None to serve the whole file, or 'invalid'."""
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        # Multiple ranges / other units: answering with the full file is allowed
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return "invalid"
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return "invalid"
+    return start, end
+
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    server_version = "RagamMedia/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Playback issues many range requests; keep them out of the app log
+        pass
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        path = _resolve(url.path)
+        if path is None:
+            self._send_status(404, self._cors_headers())
+            return
+
+        st = path.stat()
+        size = st.st_size
+        etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+        headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+            "Accept-Ranges": "bytes",
+            # Private: the URL is a capability of one session, shared caches must not keep it
+            "Cache-Control": "private, max-age=31536000, immutable",
+            **self._cors_headers(),
+        }
+        if "download" in query:
+            filename = os.path.basename(query["download"][0]) or path.name
+            headers["Content-Disposition"] = (
+                f"attachment; filename=\"{filename.encode('ascii', 'replace').decode()}\"; "
+                f"filename*=UTF-8''{urllib.parse.quote(filename)}"
+            )
+
+        if self._not_modified(etag, st.st_mtime):
+            self._send_status(304, headers)
+            return
+
+        start, end, status = 0, size - 1, 200
+        if "Range" in self.headers and self.headers.get("If-Range", etag) == etag:
+            byte_range = _parse_range(self.headers["Range"], size)
+            if byte_range == "invalid":
+                self._send_status(416, {**headers, "Content-Range": f"bytes */{size}"})
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                status = 206
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        length = max(0, end - start + 1)
+        self.send_response(status)
+        self.send_header("Content-Type", mimetypes.guess_type(path.name)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if send_body:
+            self._copy(path, start, length)
+
+    def _cors_headers(self):
+        # The stem mixer fetches previews from the component iframe, on the app's origin
+        if MEDIA_ALLOW_ORIGIN and self.headers.get("Origin") == MEDIA_ALLOW_ORIGIN:
+            return {"Access-Control-Allow-Origin": MEDIA_ALLOW_ORIGIN, "Vary": "Origin"}
+        return {}
+
+    def _not_modified(self, etag, mtime):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _copy(self, path, start, length):
+        try:
+            with open(path, "rb") as f:
+                f.seek(start)
+                while length > 0:
+                    chunk = f.read(min(COPY_CHUNK_BYTES, length))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    length -= len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # The browser dropped the request (seek, tab closed)
+            pass
+
+    def _send_status(self, status, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def ensure_started(roots):
+    """
+    Starts the media server (once per process) and registers `roots` ({name: directory}), the
+    directories media_url() may grant files from. With MEDIA_BASE_URL set only the configured
+    port is bound (the proxy routes there; another process on it holds other grants), and a taken
+    port is an error.
+
+    Returns:
+        str: The base URL the browser reaches the server at.
+    """
+    global _server, _base_url
+    with _lock:
+        for name, directory in roots.items():
+            _roots[name] = Path(directory).resolve()
+        if _server is not None:
+            return _base_url
+
+        last_error = None
+        if MEDIA_SERVER_PORT == 0 or MEDIA_BASE_URL:
+            ports = [MEDIA_SERVER_PORT]
+        else:
+            ports = range(MEDIA_SERVER_PORT, MEDIA_SERVER_PORT + PORT_ATTEMPTS)
+        for port in ports:
+            try:
+                server = ThreadingHTTPServer((MEDIA_SERVER_HOST, port), MediaRequestHandler)
+                break
+            except OSError as e:
+                last_error = e
+        else:
+            hint = (f" ({MEDIA_BASE_URL} is routed to this port; stop the process holding it or change RAGAM_MEDIA_PORT"
+                    " and the proxy together)" if MEDIA_BASE_URL else "")
+            raise RuntimeError(f"Media server could not bind {MEDIA_SERVER_HOST}:{MEDIA_SERVER_PORT}: {last_error}{hint}")
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="media-server", daemon=True).start()
+
+        bound_port = server.server_address[1]
+        if MEDIA_BASE_URL:
+            _base_url = MEDIA_BASE_URL.rstrip("/")
+        else:
+            # Only reachable from this machine (tests, local runs); deployments set MEDIA_BASE_URL
+            host = "localhost" if MEDIA_SERVER_HOST in ("0.0.0.0", "127.0.0.1", "") else MEDIA_SERVER_HOST
+            _base_url = f"http://{host}:{bound_port}"
+        _server = server
+        print(f"Media: Serving {', '.join(sorted(_roots))} at {_base_url}")
+        return _base_url
+
+
+def _prune_grants(now):
+    """Drops expired grants. Call with _lock held."""
+    for token in [t for t, grant in _grants.items() if grant["expires_at"] < now]:
+        grant = _grants.pop(token)
+        _session_tokens.pop((grant["session"], str(grant["path"]), grant["size"], grant["mtime_ns"]), None)
+
+
+def media_url(path, session_id, download_name=None):
+    """
+    URL under which session `session_id` may fetch `path` from the media server.
+
+    Args:
+        path: Audio file under one of the registered roots (dotfiles and other file types are refused).
+        session_id: The browser session the URL is for; see revoke_session().
+        download_name: If given, the browser saves the file under this name instead of playing it.
+    """
+    if _base_url is None:
+        raise RuntimeError("Media server is not running")
+    path = Path(path).resolve()
+    rel_parts = next((path.relative_to(root).parts for root in _roots.values() if path.is_relative_to(root)), None)
+    if rel_parts is None:
+        raise ValueError(f"{path} is not under a served directory")
+    if path.suffix.lower() not in MEDIA_SUFFIXES or any(p.startswith(".") for p in rel_parts):
+        raise ValueError(f"{path.name} is not a servable media file")
+
+    st = path.stat()
+    key = (session_id, str(path), st.st_size, st.st_mtime_ns)
+    now = time.time()
+    with _lock:
+        token = _session_tokens.get(key)
+        if token is None:
+            _prune_grants(now)
+            token = secrets.token_urlsafe(24)
+            _session_tokens[key] = token
+            _grants[token] = {"path": path, "session": session_id, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        _grants[token]["expires_at"] = now + GRANT_TTL_SEC
+    url = f"{_base_url}/{token}/{urllib.parse.quote(path.name)}"
+    if download_name:
+        url += "?" + urllib.parse.urlencode({"download": download_name})
+    return url
+
+
+def revoke_session(session_id):
+    """Invalidates every URL granted to `session_id` (e.g. when it uploads a new track)."""
+    with _lock:
+        for token in [t for t, grant in _grants.items() if grant["session"] == session_id]:
+            grant = _grants.pop(token)
+            _session_tokens.pop((session_id, str(grant["path"]), grant["size"], grant["mtime_ns"]), None)
+
+
+@functools.lru_cache(maxsize=32)
+def _data_uri(path, mtime_ns):
+    """Base64 data URI of a file; memoized so reruns don't re-read and re-encode it."""
+    mime = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    with open(path, "rb") as f:
+        return f"data:{mime};base64,{base64.b64encode(f.read()).decode()}"
+
+
+def media_src(path, session_id):
+    """
+    What the browser should load `path` from: a media_url() when the server is enabled, else the
+    file inline as a data URI (meant for small previews).
+    """
+    if is_enabled():
+        return media_url(path, session_id)
+    path = Path(path)
+    return _data_uri(str(path), path.stat().st_mtime_ns)
+
+
+def stop():
+    """Shuts the server down and forgets the roots and grants (used by tests)."""
+    global _server, _base_url
+    with _lock:
+        if _server is not None:
+            _server.shutdown()
+            _server.server_close()
+        _server, _base_url = None, None
+        _roots.clear()
+        _grants.clear()
+        _session_tokens.clear()
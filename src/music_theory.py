@@ -12,6 +12,12 @@ Concepts:
 import numpy as np
 import librosa
 
+from src import analysis_cache
+from src.chords import ChordVocabulary, NOTE_NAMES, merge_segments
+from src.decode import load_audio
+from src.features import get_chroma, HOP_LENGTH
+from config.config import CHORD_VOCABULARY, CHORD_TIMELINE_MAX_SEC
+
 # --- CARNATIC SWARA MAPPING ---
 CARNATIC_SWARAS = {
     0: "S",   # Sa (Tonic)
@@ -968,11 +974,10 @@ RAGA_DB = {
     }
 }
 
-WESTERN_NOTES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+WESTERN_NOTES = NOTE_NAMES
 
 def estimate_key(audio_path, duration=60):
-    y, sr = librosa.load(audio_path, duration=duration)
-    chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
+    chroma, _ = get_chroma(audio_path, duration=duration)
     chroma_mean = np.mean(chroma, axis=1)
     tonic_idx = int(np.argmax(chroma_mean))
     return tonic_idx, WESTERN_NOTES[tonic_idx], chroma_mean
@@ -998,44 +1003,75 @@ def identify_raga(chroma_mean, tonic_idx):
             
     return best_match, captured_scale
 
+CHORD_MIN_ENERGY = 0.1  # frames whose chroma peak is below this are labelled "N/A"
+CHORD_SELF_PROB = 0.8  # chord timeline: probability of keeping the chord from one beat to the next
+_vocabularies = {}
+
+def get_chord_vocabulary(name=CHORD_VOCABULARY):
+    """The ChordVocabulary registered as `name` (templates are built once per process)."""
+    if name not in _vocabularies:
+        _vocabularies[name] = ChordVocabulary.named(name)
+    return _vocabularies[name]
+
 def get_chord_from_chroma(chroma_col):
-    templates = {}
-    for root in range(12):
-        maj = np.zeros(12)
-        maj[[root, (root+4)%12, (root+7)%12]] = 1
-        templates[f"{WESTERN_NOTES[root]} Maj"] = maj
-        
-        min_template = np.zeros(12)
-        min_template[[root, (root+3)%12, (root+7)%12]] = 1
-        templates[f"{WESTERN_NOTES[root]} Min"] = min_template
-        
-    best_chord = "N/A"
-    max_corr = -1
-    
-    for name, template in templates.items():
-        corr = np.dot(chroma_col, template)
-        if corr > max_corr:
-            max_corr = corr
-            best_chord = name
-            
-    return best_chord
+    labels, _, _ = get_chord_vocabulary().recognize(chroma_col)
+    return str(labels[0])
 
-def detect_chords_over_time(audio_path, duration=60):
-    y, sr = librosa.load(audio_path, duration=duration)
-    chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-    chroma = librosa.decompose.nn_filter(chroma, aggregate=np.median, metric="cosine")
-    
-    chords = []
-    times = librosa.frames_to_time(np.arange(chroma.shape[1]), sr=sr)
-    
-    for i in range(chroma.shape[1]):
-        column = chroma[:, i]
-        if np.max(column) < 0.1:
-            chords.append("N/A")
-        else:
-            chords.append(get_chord_from_chroma(column))
-            
-    return times, chords
+def detect_chords_over_time(audio_path, duration=60, vocabulary=CHORD_VOCABULARY):
+    """
+    Frame-wise chord labels of the first `duration` seconds, from the `vocabulary` chord set
+    (see src.chords.VOCABULARIES).
+    The chord sequence is kept in the analysis cache; on a miss the chroma is shared with key
+    estimation when the ranges overlap.
+
+    Returns:
+        (times, chords): Frame times in seconds and one chord label per frame.
+    """
+    def compute():
+        chroma, sr = get_chroma(audio_path, duration=duration)
+        chroma = librosa.decompose.nn_filter(chroma, aggregate=np.median, metric="cosine")
+        # All frames scored against all templates in one matrix product
+        labels, scores, _ = get_chord_vocabulary(vocabulary).recognize(chroma, min_energy=CHORD_MIN_ENERGY)
+        times = librosa.frames_to_time(np.arange(len(labels)), sr=sr, hop_length=HOP_LENGTH)
+        return {"times": times, "chords": labels, "scores": scores}
+
+    params = {"duration": duration, "method": "templates", "vocabulary": vocabulary,
+              "min_energy": CHORD_MIN_ENERGY, "hop_length": HOP_LENGTH}
+    stored = analysis_cache.cached(audio_path, "chords", params, compute)
+    return stored["times"], stored["chords"].tolist()
+
+def detect_chord_segments(audio_path, duration=CHORD_TIMELINE_MAX_SEC or None, vocabulary=CHORD_VOCABULARY):
+    """
+    Chord timeline of the first `duration` seconds (None = the whole track).
+    Chroma is aggregated per beat (median) and the beat labels are smoothed by a Viterbi pass
+    (ChordVocabulary.decode), so the cost grows linearly with the track's length, unlike the
+    frame-wise nn_filter of detect_chords_over_time(). Kept in the analysis cache.
+
+    Returns:
+        list of (start, end, chord): Consecutive segments in seconds, one per chord change.
+    """
+    def compute():
+        chroma, sr = get_chroma(audio_path, duration=duration)
+        # Same range and rate as the chroma, so this is served by the decode cache
+        y, sr = load_audio(audio_path, sr=sr, duration=duration)
+        _, beats = librosa.beat.beat_track(y=y, sr=sr, hop_length=HOP_LENGTH)
+        bounds = librosa.util.fix_frames(beats, x_min=0, x_max=chroma.shape[1])
+        beat_chroma = librosa.util.sync(chroma, bounds, aggregate=np.median, pad=False)
+        labels, _ = get_chord_vocabulary(vocabulary).decode(
+            beat_chroma, min_energy=CHORD_MIN_ENERGY, self_prob=CHORD_SELF_PROB
+        )
+        times = librosa.frames_to_time(bounds, sr=sr, hop_length=HOP_LENGTH)
+        segments = merge_segments(labels, times[:-1], times[1:])
+        return {
+            "starts": [s for s, _, _ in segments],
+            "ends": [e for _, e, _ in segments],
+            "chords": np.array([c for _, _, c in segments], dtype=str),
+        }
+
+    params = {"duration": duration, "method": "beat_viterbi", "vocabulary": vocabulary,
+              "min_energy": CHORD_MIN_ENERGY, "self_prob": CHORD_SELF_PROB, "hop_length": HOP_LENGTH}
+    stored = analysis_cache.cached(audio_path, "chord_segments", params, compute)
+    return [(float(s), float(e), str(c)) for s, e, c in zip(stored["starts"], stored["ends"], stored["chords"])]
 
 def note_to_swaras(midi_note, tonic_idx):
     interval = (midi_note - tonic_idx) % 12
@@ -0,0 +1,91 @@
+"""
+Ragam App: Note Segmentation
+Turns a frame-wise f0 track (e.g. pYIN) into (start, end, midi) note events, vectorized:
+- The whole f0 array is converted to fractional MIDI pitch in one call and rounded.
+- Note boundaries are found by run-length encoding the rounded pitch (unvoiced frames form runs of
+  their own), so the work per frame is a few array operations instead of a Python iteration.
+- Hysteresis: a run rounding to a neighbouring semitone extends the current note while every one of
+  its frames stays within 50 + `hysteresis_cents` cents of that note, so gamakas (oscillations
+  around a swara) and pitch drift don't fragment it. Only this step loops, once per run.
+- Events not longer than the minimum duration are dropped with a mask.
+
+NumPy only, so it runs on any f0 source.
+"""
+
+import numpy as np
+
+MIN_NOTE_SEC = 0.15  # shorter note events are treated as noise
+
+
+def hz_to_midi(f0):
+    """Fractional MIDI pitch of frequencies in Hz (same formula as librosa.hz_to_midi)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 12 * (np.log2(np.asarray(f0, dtype=np.float64)) - np.log2(440.0)) + 69
+
+
+def _runs(values):
+    """(starts, ends) frame indices of runs of equal `values` (ends exclusive)."""
+    change = np.flatnonzero(values[1:] != values[:-1]) + 1
+    return np.concatenate([[0], change]), np.concatenate([change, [len(values)]])
+
+
+def _apply_hysteresis(pitch, starts, ends, notes, band):
+    """Merges runs into the preceding note while all their frames stay within `band` semitones of it."""
+    # Each window also spans the unvoiced (NaN) frames after the run, which fmin/fmax ignore
+    run_min = np.fmin.reduceat(pitch, starts).tolist()
+    run_max = np.fmax.reduceat(pitch, starts).tolist()
+    keep = np.ones(len(starts), dtype=bool)
+    current, current_end = None, -1
+    for k, (start, end, note) in enumerate(zip(starts.tolist(), ends.tolist(), notes.tolist())):
+        if start == current_end and run_max[k] - current <= band and current - run_min[k] <= band:
+            keep[k] = False
+        else:
+            current = note
+        current_end = end
+    # A kept run's note lasts until the end of the last run merged into it
+    kept = np.flatnonzero(keep)
+    last_merged = np.concatenate([kept[1:] - 1, [len(starts) - 1]])
+    return starts[kept], ends[last_merged], notes[kept]
+
+
+def segment_notes(f0, voiced_flag, sr, hop_length=512, min_duration=MIN_NOTE_SEC, hysteresis_cents=0.0):
+    """
+    Aggregates consecutive voiced frames of the same MIDI pitch into note events.
+
+    Args:
+        f0: Frame-wise fundamental frequency in Hz (NaN when unvoiced).
+        voiced_flag: Frame-wise voicing decision.
+        sr: Sample rate the f0 track was computed at.
+        hop_length: Samples between f0 frames.
+        min_duration: Events not longer than this (seconds) are dropped.
+        hysteresis_cents: Extra tolerance before a pitch change starts a new note (0 = change at
+            every new rounded semitone).
+
+    Returns:
+        np.ndarray: (n, 3) float array of (start, end, midi) events, in seconds. A note ends at the
+        time of the frame after its last one (the last frame's own time at the end of the track).
+    """
+    f0 = np.asarray(f0, dtype=np.float64)
+    n_frames = len(f0)
+    if n_frames == 0:
+        return np.zeros((0, 3))
+    pitch = hz_to_midi(f0)
+    valid = np.asarray(voiced_flag, dtype=bool) & ~np.isnan(pitch)
+    # -1 marks unvoiced frames, so they form runs of their own
+    notes = np.where(valid, np.rint(np.where(valid, pitch, 0.0)), -1.0)
+
+    starts, ends = _runs(notes)
+    voiced_runs = notes[starts] >= 0
+    if hysteresis_cents > 0 and voiced_runs.any():
+        pitch = np.where(valid, pitch, np.nan)
+        v_starts, v_ends, v_notes = _apply_hysteresis(
+            pitch, starts[voiced_runs], ends[voiced_runs], notes[starts[voiced_runs]],
+            band=0.5 + hysteresis_cents / 100.0,
+        )
+    else:
+        v_starts, v_ends, v_notes = starts[voiced_runs], ends[voiced_runs], notes[starts[voiced_runs]]
+
+    times = np.arange(n_frames + 1) * hop_length / sr
+    times[-1] = times[-2]  # the trailing note ends at the last frame
+    events = np.stack([times[v_starts], times[v_ends], v_notes], axis=1)
+    return events[events[:, 1] - events[:, 0] > min_duration]
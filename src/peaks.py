@@ -0,0 +1,133 @@
+"""
+Ragam App: Waveform Peak Pyramids
+Precomputes min/max peaks of an audio file at several resolutions (like audiowaveform's .dat),
+so visualizers draw a waveform from a few KB of numbers instead of decoding the whole audio.
+
+Layout: <audio>.peaks.npz next to the audio file (inside its cache entry, so it is evicted with it)
+    min_<level>, max_<level>  int8 peaks (-127..127), level 0 = BASE_SAMPLES_PER_PEAK samples per
+                              peak, each further level halves the resolution
+    samplerate, frames        of the source audio
+    source_size, source_mtime_ns   the source file the peaks were computed from
+
+Peaks are computed block by block with vectorized NumPy (reshape + min/max), so memory stays
+bounded for long recordings.
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+BASE_SAMPLES_PER_PEAK = 256
+MIN_LEVEL_PEAKS = 256        # coarsest level still holds at least this many peaks
+TARGET_PEAKS = 1500          # default resolution sent to the visualizer (~ a wide screen)
+BLOCK_FRAMES = BASE_SAMPLES_PER_PEAK * 4096
+
+
+def peaks_path(audio_path):
+    audio_path = Path(audio_path)
+    return audio_path.with_name(f"{audio_path.stem}.peaks.npz")
+
+
+def _block_peaks(block):
+    """(frames, channels) block -> (mins, maxs), one pair per BASE_SAMPLES_PER_PEAK frames (all channels)."""
+    n_full = len(block) // BASE_SAMPLES_PER_PEAK * BASE_SAMPLES_PER_PEAK
+    parts = []
+    if n_full:
+        parts.append(block[:n_full].reshape(-1, BASE_SAMPLES_PER_PEAK * block.shape[1]))
+    mins = [p.min(axis=1) for p in parts]
+    maxs = [p.max(axis=1) for p in parts]
+    if n_full < len(block):
+        mins.append(block[n_full:].min(keepdims=True).ravel())
+        maxs.append(block[n_full:].max(keepdims=True).ravel())
+    return np.concatenate(mins), np.concatenate(maxs)
+
+
+def _base_peaks(audio_path):
+    """Level-0 peaks, streaming WAV/FLAC/OGG with soundfile; other formats are decoded in one go."""
+    mins, maxs = [], []
+    try:
+        with sf.SoundFile(str(audio_path)) as f:
+            samplerate, frames = f.samplerate, f.frames
+            # Whole peaks per block, so bucket boundaries don't depend on the block size
+            for block in f.blocks(blocksize=BLOCK_FRAMES, dtype="float32", always_2d=True):
+                lo, hi = _block_peaks(block)
+                mins.append(lo)
+                maxs.append(hi)
+    except RuntimeError:
+        # Not readable by libsndfile (e.g. MP3/M4A uploads)
+        from src.decode import load_audio
+        y, samplerate = load_audio(audio_path, sr=None, mono=False)
+        block = np.atleast_2d(y).T
+        frames = len(block)
+        lo, hi = _block_peaks(block)
+        mins, maxs = [lo], [hi]
+    if not mins:
+        return np.zeros(1, np.float32), np.zeros(1, np.float32), samplerate, frames
+    return np.concatenate(mins), np.concatenate(maxs), samplerate, frames
+
+
+def compute_peaks(audio_path):
+    """Computes and saves the peak pyramid of `audio_path`. Returns the path of the .peaks.npz file."""
+    audio_path = Path(audio_path)
+    st = audio_path.stat()
+    mins, maxs, samplerate, frames = _base_peaks(audio_path)
+
+    levels = {}
+    level = 0
+    while True:
+        levels[f"min_{level}"] = np.round(np.clip(mins, -1, 1) * 127).astype(np.int8)
+        levels[f"max_{level}"] = np.round(np.clip(maxs, -1, 1) * 127).astype(np.int8)
+        if len(mins) < 2 * MIN_LEVEL_PEAKS:
+            break
+        # Next level: pairs of peaks merged (an odd tail peak is paired with itself)
+        if len(mins) % 2:
+            mins, maxs = np.append(mins, mins[-1]), np.append(maxs, maxs[-1])
+        mins = mins.reshape(-1, 2).min(axis=1)
+        maxs = maxs.reshape(-1, 2).max(axis=1)
+        level += 1
+
+    out_path = peaks_path(audio_path)
+    tmp_path = out_path.with_name(f".{out_path.name}.{os.getpid()}.tmp.npz")
+    np.savez_compressed(
+        tmp_path, samplerate=samplerate, frames=frames,
+        source_size=st.st_size, source_mtime_ns=st.st_mtime_ns, **levels
+    )
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def ensure_peaks(audio_path):
+    """Returns the peaks file of `audio_path`, computing it if missing or older than the audio."""
+    audio_path = Path(audio_path)
+    out_path = peaks_path(audio_path)
+    try:
+        with np.load(out_path) as data:
+            st = audio_path.stat()
+            if int(data["source_size"]) == st.st_size and int(data["source_mtime_ns"]) == st.st_mtime_ns:
+                return out_path
+    except (OSError, KeyError, ValueError):
+        pass
+    return compute_peaks(audio_path)
+
+
+def get_peaks(audio_path, target_peaks=TARGET_PEAKS):
+    """
+    Peaks of `audio_path` at the coarsest level with at least `target_peaks` peaks.
+
+    Returns:
+        Tuple (peaks, duration_sec): peaks is a list of floats in -1..1, interleaved
+        [min0, max0, min1, max1, ...] (the layout wavesurfer.js draws directly).
+    """
+    with np.load(ensure_peaks(audio_path)) as data:
+        n_levels = sum(1 for k in data.files if k.startswith("min_"))
+        level = 0
+        while level + 1 < n_levels and len(data[f"min_{level + 1}"]) >= target_peaks:
+            level += 1
+        mins, maxs = data[f"min_{level}"], data[f"max_{level}"]
+        duration = float(data["frames"]) / float(data["samplerate"])
+    interleaved = np.empty(2 * len(mins), dtype=np.float32)
+    interleaved[0::2] = mins / 127.0
+    interleaved[1::2] = maxs / 127.0
+    return np.round(interleaved, 3).tolist(), duration
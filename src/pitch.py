@@ -0,0 +1,115 @@
+"""
+Ragam App: Fast Pitch Tracking
+A vectorized YIN f0 tracker, the fast alternative to librosa.pyin for melody transcription.
+
+YIN (de Cheveigné & Kawahara, 2002) picks, per frame, the first lag whose cumulative mean
+normalized difference (CMND) dips below a threshold. Here all frames of a batch are processed at
+once: the difference function comes from one FFT cross-correlation per batch, the CMND from a
+cumulative sum, and the lag choice from boolean masks, so there is no per-frame Python code.
+Batches of BATCH_FRAMES keep memory flat on long tracks.
+
+Speed / accuracy trade-off against pYIN:
+- YIN is ~20-50x faster: pYIN scores ~100 f0 candidates per frame and runs a Viterbi pass over
+  pitch bins x voicing states across the whole track.
+- Without that Viterbi smoothing, YIN makes more isolated octave errors and its voicing decision
+  is a per-frame threshold on the CMND (aperiodicity) rather than a probability, so breathy
+  onsets and reverb tails are voiced or unvoiced a little less reliably. The note segmenter's
+  minimum duration and hysteresis absorb most of these single-frame slips.
+
+Frame t describes time t * hop_length / sr with as many frames as librosa's centered framing, so
+f0 tracks of both trackers line up. NumPy only.
+"""
+
+import numpy as np
+
+YIN_THRESHOLD = 0.15  # CMND below which a lag counts as periodic (YIN's "absolute threshold")
+SILENCE_DB = -50.0    # frames this far below the loudest frame are unvoiced
+BATCH_FRAMES = 4096
+
+
+def _frames(y, frame_length, win_length, hop_length):
+    """
+    (1 + len(y) // hop_length, frame_length) view of zero-padded `y`, the frame count librosa's
+    centered framing gives. Frames start win_length / 2 before t * hop_length, so the difference
+    window (the first win_length samples, compared with the same window shifted by the lag) is
+    centered on the frame time for short lags.
+    """
+    padded = np.pad(y, (win_length // 2, frame_length))
+    return np.lib.stride_tricks.sliding_window_view(padded, frame_length)[:len(y) + 1:hop_length]
+
+
+def _cmnd(frames, win_length, max_period):
+    """(frames, max_period + 1) cumulative mean normalized difference of each frame."""
+    n_fft = 1 << int(np.ceil(np.log2(frames.shape[1] + win_length)))
+    # r[t, lag] = sum_j x[t, j] * x[t, j + lag], j < win_length: one FFT cross-correlation per batch
+    spectrum = np.fft.rfft(frames, n_fft, axis=1)
+    head = np.fft.rfft(frames[:, :win_length], n_fft, axis=1)
+    acf = np.fft.irfft(np.conj(head) * spectrum, n_fft, axis=1)[:, :max_period + 1]
+    # Energy of the window shifted by each lag, from a cumulative sum of squares
+    energy = np.cumsum(np.pad(frames ** 2, ((0, 0), (1, 0))), axis=1)
+    lags = np.arange(max_period + 1)
+    shifted = energy[:, lags + win_length] - energy[:, lags]
+    diff = np.maximum(shifted[:, :1] + shifted - 2 * acf, 0.0)
+
+    cmnd = np.ones_like(diff)
+    running = np.cumsum(diff[:, 1:], axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cmnd[:, 1:] = np.where(running > 0, diff[:, 1:] * lags[1:] / running, 1.0)
+    return cmnd
+
+
+def yin(y, sr, fmin, fmax, frame_length=2048, hop_length=512, threshold=YIN_THRESHOLD, silence_db=SILENCE_DB):
+    """
+    f0 track of a mono signal with YIN.
+
+    Args:
+        y: Mono audio.
+        sr: Sample rate.
+        fmin, fmax: Pitch search range in Hz (fmin needs sr / fmin < frame_length / 2).
+        frame_length: Analysis frame in samples; the difference window is half of it.
+        hop_length: Samples between frames.
+        threshold: CMND a lag must dip below to count as the period; frames where none does are unvoiced.
+        silence_db: Frames quieter than this (dB relative to the loudest frame) are unvoiced.
+
+    Returns:
+        (f0, voiced_flag, aperiodicity): f0 in Hz (NaN when unvoiced), voicing, and the CMND at the
+        chosen lag (0 = perfectly periodic), one value per frame.
+    """
+    y = np.asarray(y, dtype=np.float32)
+    win_length = frame_length // 2
+    min_period = max(1, int(np.floor(sr / fmax)))
+    max_period = int(np.ceil(sr / fmin))
+    if max_period >= win_length:
+        raise ValueError(f"fmin={fmin:.1f} Hz needs a frame_length above {2 * max_period} samples")
+
+    frames = _frames(y, frame_length, win_length, hop_length)
+    n_frames = len(frames)
+    f0 = np.full(n_frames, np.nan)
+    aperiodicity = np.ones(n_frames)
+    voiced = np.zeros(n_frames, dtype=bool)
+    rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+    if n_frames == 0 or rms.max() == 0:
+        return f0, voiced, aperiodicity
+    loud = 20 * np.log10(np.maximum(rms, 1e-12) / rms.max()) > silence_db
+
+    for start in range(0, n_frames, BATCH_FRAMES):
+        batch = slice(start, min(start + BATCH_FRAMES, n_frames))
+        cmnd = _cmnd(frames[batch].astype(np.float64), win_length, max_period)
+        # Local minima inside [min_period, max_period) that dip below the threshold; YIN takes the first
+        inner = cmnd[:, min_period:max_period]
+        trough = (inner <= cmnd[:, min_period + 1:max_period + 1]) & (inner < cmnd[:, min_period - 1:max_period - 1])
+        candidates = trough & (inner < threshold)
+        found = candidates.any(axis=1)
+        period = np.where(found, np.argmax(candidates, axis=1), np.argmin(inner, axis=1)) + min_period
+
+        rows = np.arange(len(period))
+        left, mid, right = cmnd[rows, period - 1], cmnd[rows, period], cmnd[rows, period + 1]
+        # Parabolic interpolation around the chosen lag for sub-sample periods
+        curvature = left - 2 * mid + right
+        shift = np.where(curvature > 0, 0.5 * (left - right) / np.where(curvature > 0, curvature, 1.0), 0.0)
+
+        is_voiced = found & loud[batch]
+        f0[batch] = np.where(is_voiced, sr / (period + np.clip(shift, -1, 1)), np.nan)
+        aperiodicity[batch] = mid
+        voiced[batch] = is_voiced
+    return f0, voiced, aperiodicity
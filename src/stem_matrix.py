@@ -0,0 +1,156 @@
+"""
+Ragam App: In-Memory Stem Matrix
+Keeps all stems of a track in one (n_stems, channels, samples) float32 array for interactive remixing.
+
+The matrix is built once from the stem dict returned by separate_audio() and stored as a cache
+entry (kind 'matrix', <CACHE_DIR>/matrices/<key>/stems.npy, sharing the LRU budget). It is then
+memory-mapped, so the OS page cache keeps it resident between remixes. A mix is a single
+weighted sum over the stem axis, with no file decoding:
+
+    mix[c, t] = sum_s weights[s, c] * matrix[s, c, t]
+
+Mono stems are stored duplicated on both channels, so pans behave as in mix_stems().
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from src import cache as stem_cache
+
+MATRIX_FILE = "stems.npy"
+MATRIX_CHANNELS = 2
+BUILD_BLOCK_FRAMES = 262144
+OPEN_MATRICES_MAX = 2  # matrices kept open per process (the tracks users are currently remixing)
+
+_open_matrices = OrderedDict()
+_lock = threading.Lock()
+
+
+def pan_gains(gain, pan):
+    """
+    (left, right) gains for a stem: `gain` with a constant-power pan (-1 left .. 1 right),
+    scaled so pan 0 leaves both channels at `gain`.
+    """
+    theta = (pan + 1.0) * np.pi / 4.0
+    return gain * np.sqrt(2.0) * np.array([np.cos(theta), np.sin(theta)], dtype=np.float32)
+
+
+class StemMatrix:
+    """A track's stems as one memory-mapped (n_stems, channels, samples) float32 array."""
+
+    def __init__(self, entry_dir):
+        manifest = stem_cache.read_manifest(entry_dir)
+        if manifest is None:
+            raise FileNotFoundError(f"No stem matrix in {entry_dir}")
+        self.entry_dir = Path(entry_dir)
+        self.names = list(manifest["params"]["names"])
+        self.sources = list(manifest["params"]["sources"])
+        self.samplerate = int(manifest["params"]["samplerate"])
+        self.data = np.load(self.entry_dir / MATRIX_FILE, mmap_mode="r")
+
+    @property
+    def frames(self):
+        return self.data.shape[-1]
+
+    def weights(self, gains, pans=None):
+        """(n_stems, channels) weight matrix; stems missing from `gains` are muted."""
+        pans = pans or {}
+        w = np.zeros((len(self.names), MATRIX_CHANNELS), dtype=np.float32)
+        for i, name in enumerate(self.names):
+            if gains.get(name):
+                w[i] = pan_gains(gains[name], pans.get(name, 0.0))
+        return w
+
+    def mix(self, gains, pans=None, normalize=True):
+        """
+        Mixes the stems.
+
+        Args:
+            gains: Dict stem name -> linear gain (stems not listed are left out).
+            pans: Optional dict stem name -> pan (-1 left .. 1 right).
+            normalize: Scale down to a 0 dB peak if the mix would clip (as mix_stems does).
+
+        Returns:
+            np.ndarray (samples, channels) float32, ready for soundfile.
+        """
+        w = self.weights(gains, pans)
+        active = np.flatnonzero(w.any(axis=1))
+        if active.size == 0:
+            return np.zeros((self.frames, MATRIX_CHANNELS), dtype=np.float32)
+        # Contiguous runs of the stem axis stay views of the memmap (no copy)
+        rows = slice(active[0], active[-1] + 1)
+        out = np.einsum("sc,sct->tc", w[rows], self.data[rows])
+        if normalize:
+            peak = float(np.max(np.abs(out)))
+            if peak > 1.0:
+                out *= 1.0 / peak
+        stem_cache.touch(self.entry_dir)
+        return out
+
+
+def _build(entry_dir, stems):
+    """Writes the matrix of `stems` ({name: path}) into `entry_dir`, reading each stem block by block."""
+    files = [sf.SoundFile(str(path)) for path in stems.values()]
+    try:
+        samplerate = files[0].samplerate
+        if any(f.samplerate != samplerate for f in files):
+            raise ValueError("Stems have different sample rates")
+        # Synchronize lengths by trimming to the shortest track
+        frames = min(f.frames for f in files)
+        entry_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = entry_dir / f".{MATRIX_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            data = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32,
+                                             shape=(len(files), MATRIX_CHANNELS, frames))
+            for i, f in enumerate(files):
+                done = 0
+                while done < frames:
+                    block = f.read(min(BUILD_BLOCK_FRAMES, frames - done), dtype="float32", always_2d=True)
+                    # Mono stems go on both channels
+                    data[i, :, done:done + len(block)] = block.T[:MATRIX_CHANNELS] if block.shape[1] > 1 else block.T
+                    done += len(block)
+            data.flush()
+            del data
+            os.replace(tmp_path, entry_dir / MATRIX_FILE)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+    finally:
+        for f in files:
+            f.close()
+    return samplerate, frames
+
+
+def get_stem_matrix(stems):
+    """
+    Returns the StemMatrix of `stems` (the {name: path} dict from separate_audio), building and
+    caching it on first use. The matrix is keyed on the stems' cache keys, so re-separated or
+    re-derived stems get a new matrix.
+    """
+    stems = {name: Path(path) for name, path in stems.items() if Path(path).exists()}
+    if not stems:
+        raise ValueError("No stems to build a matrix from")
+    names = sorted(stems)
+    params = {"names": names, "sources": [stem_cache.source_key(stems[n]) for n in names]}
+    key = stem_cache.make_key(params)
+
+    with _lock:
+        matrix = _open_matrices.get(key)
+        if matrix is not None and (matrix.entry_dir / MATRIX_FILE).exists():
+            _open_matrices.move_to_end(key)
+            return matrix
+
+        entry_dir = stem_cache.CACHE_ROOT / "matrices" / key[:16]
+        if not stem_cache.lookup(entry_dir, required_files=[MATRIX_FILE]):
+            samplerate, frames = _build(entry_dir, {n: stems[n] for n in names})
+            stem_cache.commit(entry_dir, key=key, kind="matrix",
+                              params={**params, "samplerate": samplerate, "frames": frames})
+        matrix = StemMatrix(entry_dir)
+        _open_matrices[key] = matrix
+        while len(_open_matrices) > OPEN_MATRICES_MAX:
+            _open_matrices.popitem(last=False)
+        return matrix
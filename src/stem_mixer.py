@@ -0,0 +1,60 @@
+"""
+Ragam App: Browser Stem Mixer Component
+Lets the browser mix each stem's compressed preview (see utils.create_preview_audio) with Web
+Audio (per-stem mute, gain, pan). The server is only involved when the user asks for a download:
+the component then returns the current settings, and the app renders the full-quality mix from
+the original stems.
+
+No audio is sent until the first Play. With the media server the rows carry session URLs the
+browser fetches then; without it, Play asks the app for the audio and the render answering that
+request carries it inline, once (component arguments are resent on every rerun, so audio is
+never left in them).
+
+The frontend is a single static page (src/components/stem_mixer/index.html), no build step.
+"""
+
+from pathlib import Path
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from src.cache import make_key
+from src import media_server
+from src.utils import create_preview_audio
+
+_COMPONENT_DIR = Path(__file__).parent / "components" / "stem_mixer"
+_stem_mixer = components.declare_component("stem_mixer", path=str(_COMPONENT_DIR))
+
+
+def stem_mixer(stems, session_id, key="stem_mixer"):
+    """
+    Renders the browser mixer for `stems` ({name: path}) in browser session `session_id`.
+
+    Returns:
+        None until the user clicks "Download mix", then a dict
+        {"action": "download", "nonce": int, "settings": {name: {"muted", "gain_db", "pan"}}}.
+        The nonce changes with every click.
+    """
+    stems = {name: Path(path) for name, path in stems.items()}
+    # The browser fetches the previews on the first Play, and again only when the stem set changes
+    version = make_key([[name, str(path), path.stat().st_mtime_ns] for name, path in sorted(stems.items())])
+
+    served = media_server.is_enabled()
+    audio, audio_nonce = None, None
+    request = st.session_state.get(key)
+    if (not served and request and request.get("action") == "load"
+            and request.get("nonce") != st.session_state.get(f"{key}_audio_nonce")):
+        # Answer the browser's request once; the next rerun sends the arguments without audio again
+        st.session_state[f"{key}_audio_nonce"] = audio_nonce = request["nonce"]
+        audio = {name: media_server.media_src(create_preview_audio(path), session_id) for name, path in stems.items()}
+
+    payload = [
+        {
+            "name": name,
+            "label": name.replace("_", " ").title(),
+            "src": media_server.media_url(create_preview_audio(path), session_id) if served else None,
+        }
+        for name, path in stems.items()
+    ]
+    value = _stem_mixer(stems=payload, version=version, audio=audio, audio_nonce=audio_nonce, key=key, default=None)
+    return value if value and value.get("action") == "download" else None
@@ -0,0 +1,196 @@
+"""
+Ragam App: Windowed Transcription
+Tracks f0 over a full-length track in overlapping windows on a pool of worker processes, so
+transcription isn't limited to what one core handles in an interactive wait.
+
+- The track is cut into windows of `window_sec` whose "cores" tile it frame by frame; each window
+  also reads `overlap_sec` of audio on both sides of its core as context (pYIN's Viterbi pass and
+  the centered analysis frames see real audio across the seam, not padding).
+- Workers decode and track their own window, so no audio crosses the process boundary; they
+  return one f0 / voicing value per frame. Windows never repeat, so they bypass the decode cache
+  (each long-lived worker would otherwise hold its own copy of up to DECODE_CACHE_MAX_BYTES).
+- Only the core frames of each window are kept, so the stitched track has exactly one value per
+  frame of the range, like a single pass. Notes are segmented once over the stitched track, so a
+  note crossing a seam is a single event, never duplicated or split.
+
+Processes (not threads) because pYIN spends much of its time in Python code that holds the GIL.
+The pool is started on first use with TRANSCRIPTION_WORKERS processes (one per core by default)
+and kept for the life of the app process; a call only limits how many of its windows are in flight.
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import librosa
+
+from src import pitch
+from src.decode import load_audio
+from config.config import TRANSCRIPTION_WINDOW_SEC, TRANSCRIPTION_OVERLAP_SEC, TRANSCRIPTION_WORKERS
+
+SR = 22050
+HOP_LENGTH = 512  # pyin's default (frame_length 2048 // 4), also used for yin
+PITCH_MODES = ("pyin", "yin")
+
+# Timings of the most recent windowed_track() call in this process
+TRANSCRIPTION_STATS = {}
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def track_f0(y, sr, mode, fmin, fmax):
+    """
+    f0 track of mono audio with the `mode` tracker ('pyin' or 'yin'), hop HOP_LENGTH.
+
+    Returns:
+        Dict with 'f0' (Hz, NaN when unvoiced), 'voiced_flag' and 'voiced_probs'
+        (for yin, 1 - aperiodicity).
+    """
+    if mode == "pyin":
+        f0, voiced_flag, voiced_probs = librosa.pyin(y, fmin=fmin, fmax=fmax, sr=sr, hop_length=HOP_LENGTH)
+    elif mode == "yin":
+        f0, voiced_flag, aperiodicity = pitch.yin(y, sr, fmin=fmin, fmax=fmax, hop_length=HOP_LENGTH)
+        voiced_probs = np.clip(1.0 - aperiodicity, 0.0, 1.0)
+    else:
+        raise ValueError(f"Unknown pitch tracker: {mode} (choose from {', '.join(PITCH_MODES)})")
+    return {"f0": f0.astype(np.float32), "voiced_flag": voiced_flag, "voiced_probs": voiced_probs.astype(np.float32)}
+
+
+def _track_window(path, offset, duration, mode, fmin, fmax):
+    """Worker: f0 track of [offset, offset + duration) of `path` (duration None = to the end)."""
+    y, sr = load_audio(path, sr=SR, offset=offset, duration=duration, cache=False)
+    return track_f0(y, sr, mode, fmin, fmax)
+
+
+def _workers(n_windows, workers=None):
+    """Worker processes for `n_windows`: TRANSCRIPTION_WORKERS (0 = one per core), never more than windows."""
+    workers = TRANSCRIPTION_WORKERS if workers is None else workers
+    workers = workers if workers > 0 else (os.cpu_count() or 1)
+    return max(1, min(workers, n_windows))
+
+
+def _get_pool():
+    """The shared worker pool and its size, started on first use with every configured worker."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None:
+            _pool_workers = _workers(float("inf"))
+            # 'spawn' avoids forking a process that already holds torch / BLAS thread pools
+            _pool = ProcessPoolExecutor(max_workers=_pool_workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool, _pool_workers
+
+
+def _run_windows(pool, jobs, limit):
+    """Tracks `jobs` on `pool` with at most `limit` of them in flight; results in job order."""
+    results = [None] * len(jobs)
+    waiting = iter(enumerate(jobs))
+    pending = {}
+    for index, job in waiting:
+        pending[pool.submit(_track_window, *job)] = index
+        if len(pending) >= limit:
+            break
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[pending.pop(future)] = future.result()
+            following = next(waiting, None)
+            if following is not None:
+                pending[pool.submit(_track_window, *following[1])] = following[0]
+    return results
+
+
+def shutdown_pool():
+    """Stops the worker processes (registered atexit)."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool, _pool_workers = None, 0
+
+
+atexit.register(shutdown_pool)
+
+
+def plan_windows(total_sec, window_sec, overlap_sec):
+    """
+    Windows covering [0, total_sec), in frames of HOP_LENGTH at SR.
+
+    Returns:
+        list of (core_start, core_end, load_start, load_end) frame indices; core_end and load_end
+        are None for the last window, which runs to the end of the range.
+    """
+    n_frames = 1 + int(round(total_sec * SR)) // HOP_LENGTH  # as a single centered pass gives
+    core = max(1, int(round(window_sec * SR / HOP_LENGTH)))
+    pad = int(np.ceil(overlap_sec * SR / HOP_LENGTH))
+    n_windows = max(1, -(-n_frames // core))
+    windows = []
+    for k in range(n_windows):
+        last = k == n_windows - 1
+        windows.append((
+            k * core, None if last else (k + 1) * core,
+            max(0, k * core - pad), None if last else (k + 1) * core + pad,
+        ))
+    return windows
+
+
+def windowed_track(path, mode, fmin, fmax, duration=None, window_sec=TRANSCRIPTION_WINDOW_SEC,
+                   overlap_sec=TRANSCRIPTION_OVERLAP_SEC, workers=None):
+    """
+    f0 track of the first `duration` seconds of `path` (None = the whole track), computed in
+    overlapping windows on the worker pool and stitched; see the module docstring.
+
+    Returns:
+        Dict with 'f0', 'voiced_flag', 'voiced_probs' (one value per frame, as track_f0()) and 'sr'.
+    """
+    if mode not in PITCH_MODES:
+        raise ValueError(f"Unknown pitch tracker: {mode} (choose from {', '.join(PITCH_MODES)})")
+    start = time.perf_counter()
+    total_sec = librosa.get_duration(path=str(path))
+    if duration is not None:
+        total_sec = min(total_sec, duration)
+    windows = plan_windows(total_sec, window_sec, overlap_sec)
+
+    jobs = []
+    for _, _, load_start, load_end in windows:
+        # A quarter sample past the frame's first sample: decoders truncate offset * sr, and the
+        # window's frames must land exactly on the single-pass frame grid
+        offset = (load_start * HOP_LENGTH + 0.25) / SR
+        # Nothing past the requested range is read, just as a single pass wouldn't
+        end = duration if load_end is None else load_end * HOP_LENGTH / SR
+        if duration is not None:
+            end = min(end, duration)
+        jobs.append((str(path), offset, None if end is None else end - offset, mode, fmin, fmax))
+
+    n_workers = _workers(len(windows), workers)
+    if n_workers > 1:
+        pool, pool_workers = _get_pool()
+        n_workers = min(n_workers, pool_workers)
+    if n_workers == 1:
+        tracks = [_track_window(*job) for job in jobs]
+    else:
+        tracks = _run_windows(pool, jobs, n_workers)
+
+    stitched = {}
+    for name in ("f0", "voiced_flag", "voiced_probs"):
+        stitched[name] = np.concatenate([
+            track[name][core_start - load_start:None if core_end is None else core_end - load_start]
+            for (core_start, core_end, load_start, _), track in zip(windows, tracks)
+        ])
+    stitched["sr"] = SR
+
+    TRANSCRIPTION_STATS.clear()
+    TRANSCRIPTION_STATS.update(windows=len(windows), workers=n_workers, total_sec=time.perf_counter() - start)
+    print(f"Transcription: {total_sec:.0f}s of audio in {len(windows)} window(s) on {n_workers} worker(s), "
+          f"{TRANSCRIPTION_STATS['total_sec']:.1f}s")
+    return stitched
+
+
+def get_transcription_stats():
+    """Returns a copy of the timings of the most recent windowed transcription in this process."""
+    return dict(TRANSCRIPTION_STATS)
@@ -4,18 +4,45 @@ Handles file I/O, directory management, and path resolution.
 """
 
 import os
+import json
+import hashlib
 import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from pydub import AudioSegment
+
+from config.config import PROJECT_ROOT, PREVIEW_FORMAT, PREVIEW_BITRATE_KBPS, PREVIEW_WORKERS
+from src import cache as stem_cache
+
+# psutil is optional; without it we fall back to /proc (Linux) or getrusage (macOS)
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
 # --- DIRECTORY STRUCTURE ---
 # data/
 # ├── uploads/    <- Original user files
 # └── outputs/    <- Stems, mixes, and analysis results
-DATA_DIR = Path("data")
+DATA_DIR = PROJECT_ROOT / "data"
 OUTPUT_DIR = DATA_DIR / "outputs"
 UPLOAD_DIR = DATA_DIR / "uploads"
 
+# --- CONTENT HASHING ---
+# MD5, as the cache folder names (<track>_<hash8>) have always used; 1 MB reads keep syscall
+# overhead negligible. Results are memoized on (path, size, mtime_ns) in a small JSON file shared
+# by the UI process and the separation workers; entries record the algorithm, so a memo written
+# with another one is ignored rather than trusted.
+HASH_ALGORITHM = "md5"
+HASH_CHUNK_SIZE = 1024 * 1024
+HASH_MEMO_PATH = DATA_DIR / "hash_memo.json"
+HASH_MEMO_MAX_ENTRIES = 5000
+_hash_memo = None
+_hash_memo_lock = threading.Lock()
+
 def setup_dirs():
     """
     Bootstraps the application by ensuring all required data directories exist.
@@ -48,9 +75,88 @@ def get_output_path(category_name, verification_tag=""):
     base.mkdir(parents=True, exist_ok=True)
     return base
 
+def _new_hasher():
+    return hashlib.new(HASH_ALGORITHM)
+
+def _memo_key(file_path):
+    return str(Path(file_path).resolve())
+
+def _load_hash_memo():
+    try:
+        with open(HASH_MEMO_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _remember_hash(file_path, digest):
+    """Records `digest` for the file's current (size, mtime_ns) and persists the memo."""
+    global _hash_memo
+    st = os.stat(file_path)
+    with _hash_memo_lock:
+        # Merge with what other processes wrote since we last loaded
+        memo = {**_load_hash_memo(), **(_hash_memo or {})}
+        memo[_memo_key(file_path)] = {
+            "size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": digest, "algorithm": HASH_ALGORITHM,
+        }
+        if len(memo) > HASH_MEMO_MAX_ENTRIES:
+            memo = dict(list(memo.items())[-HASH_MEMO_MAX_ENTRIES:])
+        _hash_memo = memo
+        try:
+            HASH_MEMO_PATH.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = HASH_MEMO_PATH.with_name(f".{HASH_MEMO_PATH.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(memo, f)
+            os.replace(tmp_path, HASH_MEMO_PATH)
+        except OSError as e:
+            print(f"Hash memo not saved: {e}")
+
+def get_memoized_file_hash(file_path):
+    """
+    Returns the memoized content hash if the file is unchanged since it was hashed, else None.
+    Never reads the file, so it is safe to call from the UI thread.
+    """
+    global _hash_memo
+    st = os.stat(file_path)
+    key = _memo_key(file_path)
+    with _hash_memo_lock:
+        for reload in (False, True):
+            if _hash_memo is None or reload:
+                _hash_memo = _load_hash_memo()
+            entry = _hash_memo.get(key)
+            if (entry and entry.get("algorithm") == HASH_ALGORITHM
+                    and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns):
+                return entry["hash"]
+    return None
+
+def get_file_hash(file_path):
+    """
+    Generates a unique MD5 hash for a file.
+    Used for caching separation results to prevent redundant processing.
+    Unchanged files (same path, size and mtime) are answered from the hash memo without reading them.
+    """
+    digest = get_memoized_file_hash(file_path)
+    if digest is not None:
+        return digest
+
+    hasher = _new_hasher()
+    with open(file_path, "rb") as f:
+        # Large reads into one reused buffer: few syscalls, no per-chunk allocation
+        buf = bytearray(HASH_CHUNK_SIZE)
+        view = memoryview(buf)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            hasher.update(view[:n])
+    digest = hasher.hexdigest()
+    _remember_hash(file_path, digest)
+    return digest
+
 def save_uploaded_file(uploaded_file):
     """
     Saves a file uploaded via Streamlit to the local 'uploads' directory.
+    The content hash is computed while the bytes are written and memoized,
+    so get_file_hash() on the saved file never reads it back from disk.
     
     Args:
         uploaded_file: The streamlit UploadedFile object.
@@ -61,34 +167,190 @@ def save_uploaded_file(uploaded_file):
     # Ensure filename is sanitized (Streamlit usually does this but we check)
     file_path = UPLOAD_DIR / uploaded_file.name
     
-    # Write stream to disk
+    # Write stream to disk, hashing each chunk on the way through
+    hasher = _new_hasher()
+    data = uploaded_file.getbuffer()
     with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+        for offset in range(0, len(data), HASH_CHUNK_SIZE):
+            chunk = data[offset:offset + HASH_CHUNK_SIZE]
+            hasher.update(chunk)
+            f.write(chunk)
+    _remember_hash(file_path, hasher.hexdigest())
         
     return file_path
 
+# --- PREVIEW ENCODING ---
+# UI previews are small mono files encoded by ffmpeg straight from the source file (ffmpeg streams
+# the PCM, nothing is loaded into Python). A bounded pool encodes them in parallel, started as soon
+# as stems are written; requests for a preview that is still encoding wait for it.
+PREVIEW_CODECS = {
+    "mp3": (".preview.mp3", ["-c:a", "libmp3lame"]),
+    # Opus in an Ogg container: about half the size of MP3 at the same quality (not played by older Safari)
+    "opus": (".preview.opus", ["-c:a", "libopus", "-vbr", "on", "-application", "audio"]),
+}
+PREVIEW_STATS = {"encoded": 0, "failed": 0, "encode_sec": 0.0}
+_preview_pool = None
+_preview_jobs = {}  # preview path -> Future of the encode in flight
+_preview_lock = threading.Lock()
+
+def preview_path(audio_path):
+    """Where the UI preview of `audio_path` lives (next to it, so it shares its cache entry)."""
+    return Path(audio_path).with_suffix(PREVIEW_CODECS[PREVIEW_FORMAT][0])
+
+def _preview_is_fresh(audio_path, out_path):
+    try:
+        return out_path.stat().st_mtime_ns >= Path(audio_path).stat().st_mtime_ns
+    except OSError:
+        return False
+
+def _encode_preview(audio_path, out_path):
+    """Encodes `audio_path` into a mono preview at `out_path` (written to a temp file, then moved into place)."""
+    start = time.perf_counter()
+    tmp_path = out_path.with_name(f".{out_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    cmd = [
+        shutil.which("ffmpeg") or "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+        "-i", str(audio_path), "-vn", "-ac", "1",
+        *PREVIEW_CODECS[PREVIEW_FORMAT][1], "-b:a", f"{PREVIEW_BITRATE_KBPS}k",
+        "-f", "mp3" if PREVIEW_FORMAT == "mp3" else "ogg", str(tmp_path),
+    ]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True)
+        os.replace(tmp_path, out_path)
+    except (OSError, subprocess.CalledProcessError) as e:
+        with _preview_lock:
+            PREVIEW_STATS["failed"] += 1
+        detail = e.stderr.decode(errors="replace").strip() if isinstance(e, subprocess.CalledProcessError) else e
+        raise RuntimeError(f"Preview encoding failed for {Path(audio_path).name}: {detail}")
+    finally:
+        Path(tmp_path).unlink(missing_ok=True)
+    with _preview_lock:
+        PREVIEW_STATS["encoded"] += 1
+        PREVIEW_STATS["encode_sec"] += time.perf_counter() - start
+    return out_path
+
+def submit_previews(audio_paths):
+    """
+    Starts encoding the previews of `audio_paths` on the shared pool (fresh previews are skipped,
+    previews already encoding are not started twice).
+    
+    Returns:
+        Dict audio path -> Future resolving to the preview path.
+    """
+    global _preview_pool
+    futures = {}
+    with _preview_lock:
+        if _preview_pool is None:
+            workers = PREVIEW_WORKERS or max(1, min(4, os.cpu_count() or 1))
+            _preview_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preview")
+        for audio_path in audio_paths:
+            out_path = preview_path(audio_path)
+            job = _preview_jobs.get(out_path)
+            if job is None or job.done():
+                if _preview_is_fresh(audio_path, out_path):
+                    continue
+                job = _preview_pool.submit(_encode_preview, Path(audio_path), out_path)
+                _preview_jobs[out_path] = job
+                # Forget finished jobs; the file on disk is the record from then on
+                job.add_done_callback(lambda f, key=out_path: _forget_preview_job(key, f))
+            futures[audio_path] = job
+    return futures
+
+def _forget_preview_job(key, future):
+    with _preview_lock:
+        if _preview_jobs.get(key) is future:
+            del _preview_jobs[key]
+
+def wait_for_previews(audio_paths):
+    """Blocks until the previews of `audio_paths` that are still encoding are done. Returns seconds waited."""
+    start = time.perf_counter()
+    with _preview_lock:
+        jobs = [_preview_jobs.get(preview_path(p)) for p in audio_paths]
+    for job in jobs:
+        if job is not None:
+            try:
+                job.result()
+            except RuntimeError as e:
+                print(e)
+    return time.perf_counter() - start
+
 def create_preview_audio(wav_path):
     """
-    Creates a highly compressed mono MP3 preview of a WAV file to be used in UI visualizers.
-    This prevents Streamlit WebSocket crashes caused by sending massive uncompressed audio streams.
+    Returns a highly compressed mono preview (MP3 or Opus, see PREVIEW_FORMAT) of an audio file to be
+    used in UI visualizers, encoding it first if needed. If the preview is already being encoded
+    (see submit_previews), waits for that encode instead of starting another.
     
     Args:
-        wav_path (Path or str): Absolute path to the original WAV file.
+        wav_path (Path or str): Path to the original audio file (any format ffmpeg reads).
         
     Returns:
-        Path: Absolute path to the compressed MP3 preview.
+        Path: Path to the compressed preview, or the original file if encoding failed.
     """
     wav_path = Path(wav_path)
-    mp3_path = wav_path.with_suffix('.preview.mp3')
+    out_path = preview_path(wav_path)
+    if _preview_is_fresh(wav_path, out_path):
+        return out_path
+    job = submit_previews([wav_path]).get(wav_path)
+    try:
+        result = job.result() if job is not None else out_path
+    except RuntimeError as e:
+        print(f"Error creating preview: {e}")
+        return wav_path # fallback to original if ffmpeg fails
+    # Previews live in their audio's cache entry (if any) and count toward its size
+    stem_cache.record_files(out_path.parent)
+    return result
+
+def current_rss_mb():
+    """
+    Returns the resident memory of this process in MB, or None if the platform gives no way to read it.
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # macOS has no /proc; ru_maxrss is the high-water mark (bytes on macOS, KB elsewhere)
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+    except ImportError:
+        return None
+
+class PeakMemoryMonitor:
+    """
+    Context manager that samples process RSS on a background thread and records the peak.
     
-    if not mp3_path.exists():
-        try:
-            audio = AudioSegment.from_wav(str(wav_path))
-            # Mix to mono and compress to 64k to save WebSocket UI payload
-            audio = audio.set_channels(1)
-            audio.export(str(mp3_path), format="mp3", bitrate="64k")
-        except Exception as e:
-            print(f"Error creating preview MP3: {e}")
-            return wav_path # fallback to original if ffmpeg fails
-            
-    return mp3_path
+    Usage:
+        with PeakMemoryMonitor() as mem:
+            heavy_work()
+        print(mem.peak_mb)  # None if RSS cannot be read on this platform
+    """
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+            self.peak_mb = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return False
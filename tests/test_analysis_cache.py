@@ -0,0 +1,69 @@
+"""Unit tests for the persistent analysis cache (content-hash keyed features in the shared budget)."""
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import numpy as np
+import pytest
+from src import analysis_cache, cache, utils
+
+
+@pytest.fixture
+def audio(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_ROOT", tmp_path / "cache")
+    monkeypatch.setattr(utils, "HASH_MEMO_PATH", tmp_path / "hash_memo.json")
+    monkeypatch.setattr(utils, "_hash_memo", None)
+    path = tmp_path / "vocals.wav"
+    path.write_bytes(b"RIFF" + bytes(range(256)) * 8)
+    return path
+
+
+def test_feature_is_computed_once_per_content_and_params(audio, tmp_path):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"f0": np.linspace(100, 200, 50, dtype=np.float32), "sr": 22050}
+
+    first = analysis_cache.cached(audio, "pyin_f0", {"duration": 60}, compute)
+    again = analysis_cache.cached(audio, "pyin_f0", {"duration": 60}, compute)
+    assert len(calls) == 1
+    assert np.array_equal(first["f0"], again["f0"]) and int(again["sr"]) == 22050
+
+    # Same content under another name shares the result; other parameters do not
+    copy = tmp_path / "copy.wav"
+    copy.write_bytes(audio.read_bytes())
+    analysis_cache.cached(copy, "pyin_f0", {"duration": 60}, compute)
+    assert len(calls) == 1
+    analysis_cache.cached(audio, "pyin_f0", {"duration": 30}, compute)
+    assert len(calls) == 2
+
+
+def test_labels_round_trip_without_pickles(audio):
+    chords = ["C Maj", "N/A", "A Min"]
+    analysis_cache.store(audio, "chords", {}, {"times": [0.0, 0.5, 1.0], "chords": np.array(chords, dtype=str)})
+    stored = analysis_cache.load(audio, "chords", {})
+    assert stored["chords"].tolist() == chords
+
+
+def test_entries_share_the_cache_budget(audio):
+    analysis_cache.store(audio, "chroma", {}, {"chroma": np.ones((12, 1000), dtype=np.float32)})
+    (entry_dir, manifest), = cache.list_entries()
+    assert manifest["kind"] == "features" and manifest["size_bytes"] > 0
+
+    cache.enforce_budget(max_bytes=0)
+    assert not entry_dir.exists()
+    assert analysis_cache.load(audio, "chroma", {}) is None
+
+
+def test_content_hash_is_md5_and_ignores_foreign_memo_entries(audio):
+    import hashlib, json
+    md5 = hashlib.md5(audio.read_bytes()).hexdigest()
+    assert utils.get_file_hash(audio) == md5  # stem folders are named after it
+
+    # A memo entry without the algorithm (or with another one) is never trusted
+    st = audio.stat()
+    utils.HASH_MEMO_PATH.write_text(json.dumps({str(audio.resolve()): {
+        "size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": "0" * 32,
+    }}))
+    utils._hash_memo = None
+    assert utils.get_memoized_file_hash(audio) is None
+    assert utils.get_file_hash(audio) == md5
@@ -0,0 +1,125 @@
+"""Unit tests for the content-addressed output cache (manifests + LRU eviction)."""
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import threading
+import time
+import pytest
+from src import cache
+
+
+def _make_entry(root, name, size, last_access):
+    entry = root / "htdemucs_6s" / name
+    entry.mkdir(parents=True)
+    (entry / "vocals.wav").write_bytes(b"\0" * size)
+    cache.commit(entry, key=name, kind="stems", params={"model": "htdemucs_6s"})
+    manifest = cache.read_manifest(entry)
+    manifest["last_access"] = last_access
+    cache._write_manifest(entry, manifest)
+    return entry
+
+
+def test_commit_writes_manifest_with_sizes(tmp_path):
+    entry = _make_entry(tmp_path, "song_abcd1234", 100, time.time())
+    manifest = cache.read_manifest(entry)
+    assert manifest["key"] == "song_abcd1234"
+    assert manifest["files"] == {"vocals.wav": 100}
+    assert manifest["size_bytes"] == 100
+
+
+def test_record_files_counts_files_added_after_commit(tmp_path):
+    entry = _make_entry(tmp_path, "song_abcd1234", 100, time.time())
+    (entry / "vocals.preview.mp3").write_bytes(b"\0" * 20)
+    (entry / ".vocals.preview.mp3.tmp").write_bytes(b"\0" * 5)
+    cache.record_files(entry)
+    manifest = cache.read_manifest(entry)
+    assert manifest["files"] == {"vocals.wav": 100, "vocals.preview.mp3": 20}
+    assert manifest["size_bytes"] == 120 and manifest["key"] == "song_abcd1234"
+    cache.record_files(tmp_path)  # no manifest: nothing to do
+    assert cache.read_manifest(tmp_path) is None
+
+
+def test_lookup_hit_refreshes_last_access(tmp_path):
+    entry = _make_entry(tmp_path, "song_abcd1234", 10, 1.0)
+    hits = cache.CACHE_STATS["hits"]
+    assert cache.lookup(entry, ["vocals.wav"]) is not None
+    assert cache.CACHE_STATS["hits"] == hits + 1
+    assert cache.read_manifest(entry)["last_access"] > 1.0
+
+
+def test_lookup_miss_when_file_missing(tmp_path):
+    entry = _make_entry(tmp_path, "song_abcd1234", 10, 1.0)
+    misses = cache.CACHE_STATS["misses"]
+    assert cache.lookup(entry, ["vocals.wav", "drums.wav"]) is None
+    assert cache.CACHE_STATS["misses"] == misses + 1
+
+
+def test_enforce_budget_evicts_least_recently_used(tmp_path):
+    old = _make_entry(tmp_path, "old_00000000", 100, 1.0)
+    new = _make_entry(tmp_path, "new_11111111", 100, 2.0)
+    evicted = cache.enforce_budget(max_bytes=150, root=tmp_path)
+    assert evicted == [old]
+    assert not old.exists() and new.exists()
+
+
+def test_enforce_budget_skips_locked_entries(tmp_path):
+    old = _make_entry(tmp_path, "old_00000000", 100, 1.0)
+    new = _make_entry(tmp_path, "new_11111111", 100, 2.0)
+    (old.parent / f"{old.name}.lock").touch()
+    cache.enforce_budget(max_bytes=150, root=tmp_path)
+    assert old.exists() and not new.exists()
+
+
+def test_stale_stages_only_flags_changed_stage(tmp_path):
+    entry = _make_entry(tmp_path, "song_abcd1234", 10, 1.0)
+    (entry / "flute.wav").write_bytes(b"\0")
+    plan = {
+        "demucs": {"key": "d1", "params": {}, "files": ["vocals.wav"]},
+        "flute": {"key": "f1", "params": {}, "files": ["flute.wav"]},
+    }
+    cache.commit(entry, key="k", kind="stems", stages={n: {"key": s["key"]} for n, s in plan.items()})
+    assert cache.stale_stages(entry, plan) == set()
+    plan["flute"]["key"] = "f2"
+    assert cache.stale_stages(entry, plan) == {"flute"}
+    assert cache.lookup(entry, stages=plan) is None
+
+
+def test_make_key_is_order_independent():
+    assert cache.make_key({"a": 1, "b": 2}) == cache.make_key({"b": 2, "a": 1})
+    assert cache.make_key({"a": 1}) != cache.make_key({"a": 2})
+
+
+def test_folder_without_manifest_is_adopted(tmp_path):
+    entry = tmp_path / "htdemucs_6s" / "song_abcd1234"
+    entry.mkdir(parents=True)
+    (entry / "vocals.wav").write_bytes(b"\0" * 100)
+    (entry / "flute_and_wind.wav").touch()  # empty placeholder
+    stages = {
+        "demucs": {"key": "k1", "params": {"model": "htdemucs_6s"}, "files": ["vocals.wav"]},
+        "flute_and_wind": {"key": "k2", "params": {}, "files": ["flute_and_wind.wav"]},
+    }
+    assert cache.stale_stages(entry, stages) == {"flute_and_wind"}
+    assert cache.adopt_legacy(entry, stages, key="hash", kind="stems")
+    manifest = cache.read_manifest(entry)
+    assert manifest["stages"] == {"demucs": {"key": "k1", "params": {"model": "htdemucs_6s"}}}
+    assert cache.stale_stages(entry, stages) == {"flute_and_wind"}
+    assert not cache.adopt_legacy(entry, stages, key="hash", kind="stems")  # already has a manifest
+
+
+def test_touch_never_drops_a_concurrent_commit(tmp_path, monkeypatch):
+    entry = _make_entry(tmp_path, "song_abcd1234", 100, time.time())
+    write = cache._write_manifest
+
+    def slow_write(entry_dir, manifest):
+        # The toucher holds a stale copy of the manifest while the commit lands
+        if threading.current_thread().name == "toucher":
+            time.sleep(0.2)
+        write(entry_dir, manifest)
+    monkeypatch.setattr(cache, "_write_manifest", slow_write)
+
+    toucher = threading.Thread(target=cache.touch, args=(entry,), name="toucher")
+    toucher.start()
+    time.sleep(0.05)
+    cache.commit(entry, key="song_abcd1234", kind="stems", stages={"demucs": {"key": "k1"}})
+    toucher.join()
+    assert cache.read_manifest(entry)["stages"] == {"demucs": {"key": "k1"}}
+    assert not any(p.name.endswith(".lock") for p in entry.iterdir())
@@ -0,0 +1,101 @@
+"""Unit tests for the vectorized chord engine (NumPy only)."""
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import numpy as np
+import pytest
+from src.chords import ChordVocabulary, CHORD_QUALITIES, NO_CHORD, NOTE_NAMES
+
+
+def _chroma(*pitch_classes, level=1.0):
+    col = np.zeros(12, dtype=np.float32)
+    col[list(pitch_classes)] = level
+    return col
+
+
+def test_majmin_labels_and_template_matrix():
+    vocab = ChordVocabulary()
+    assert len(vocab) == 24 and vocab.templates.shape == (24, 12)
+    assert np.allclose(np.linalg.norm(vocab.templates, axis=1), 1.0)
+    labels, scores, indices = vocab.recognize(np.stack([_chroma(0, 4, 7), _chroma(9, 0, 4), _chroma(7, 11, 2)], axis=1))
+    assert labels.tolist() == ["C Maj", "A Min", "G Maj"]
+    assert scores.shape == indices.shape == (3,)
+
+
+def test_matches_per_frame_loop():
+    # Reference: the former implementation, one dot product per template per frame
+    rng = np.random.default_rng(0)
+    chroma = rng.random((12, 500)).astype(np.float32)
+    vocab = ChordVocabulary()
+    expected = []
+    for frame in chroma.T:
+        best, best_score = None, -1
+        for root in range(12):
+            for quality in ("Maj", "Min"):
+                template = np.zeros(12)
+                template[[(root + i) % 12 for i in CHORD_QUALITIES[quality]]] = 1
+                if np.dot(frame, template) > best_score:
+                    best, best_score = f"{NOTE_NAMES[root]} {quality}", np.dot(frame, template)
+        expected.append(best)
+    assert vocab.recognize(chroma)[0].tolist() == expected
+
+
+def test_extended_vocabulary_prefers_exact_chords():
+    vocab = ChordVocabulary.named("full")
+    frames = np.stack([_chroma(7, 11, 2, 5), _chroma(2, 7, 9), _chroma(4, 11), _chroma(0, 4, 7)], axis=1)
+    # Normalized templates: a triad is not beaten by the 7th chords that contain it
+    assert vocab.recognize(frames)[0].tolist() == ["G Dom7", "D Sus4", "E Power", "C Maj"]
+
+
+def test_quiet_frames_are_no_chord():
+    labels, scores, indices = ChordVocabulary().recognize(
+        np.stack([_chroma(0, 4, 7, level=0.05), _chroma(0, 4, 7)], axis=1), min_energy=0.1
+    )
+    assert labels.tolist() == [NO_CHORD, "C Maj"]
+    assert indices[0] == -1 and scores[0] == 0.0
+
+
+def test_unknown_vocabulary_rejected():
+    with pytest.raises(ValueError):
+        ChordVocabulary.named("jazz")
+    with pytest.raises(ValueError):
+        ChordVocabulary(("Maj", "Add9"))
+
+
+def test_viterbi_matches_brute_force():
+    import itertools
+    from src.chords import viterbi, transition_matrix
+    rng = np.random.default_rng(1)
+    log_transition = np.log(transition_matrix(3, 0.7))
+    for _ in range(20):
+        log_emission = np.log(rng.random((3, 5)))
+        def path_score(path):
+            return log_emission[path[0], 0] + sum(
+                log_transition[path[t - 1], path[t]] + log_emission[path[t], t] for t in range(1, 5)
+            )
+        best = max(itertools.product(range(3), repeat=5), key=path_score)
+        assert viterbi(log_emission, log_transition).tolist() == list(best)
+
+
+def test_decode_smooths_isolated_frames():
+    vocab = ChordVocabulary()
+    c_major, a_minor = _chroma(0, 4, 7), _chroma(9, 0, 4)
+    # One noisy A minor beat inside a C major stretch, then a real change to A minor
+    chroma = np.stack([c_major] * 4 + [a_minor] + [c_major] * 4 + [a_minor] * 6, axis=1)
+    assert vocab.recognize(chroma)[0][4] == "A Min"
+    labels, indices = vocab.decode(chroma)
+    assert labels.tolist() == ["C Maj"] * 9 + ["A Min"] * 6
+    assert indices.shape == (15,)
+
+
+def test_decode_quiet_frames_and_segments():
+    from src.chords import merge_segments
+    vocab = ChordVocabulary()
+    chroma = np.stack([_chroma(0, 4, 7)] * 3 + [_chroma(0, 4, 7, level=0.01)] * 2 + [_chroma(7, 11, 2)] * 3, axis=1)
+    labels, indices = vocab.decode(chroma, min_energy=0.1)
+    assert labels.tolist() == ["C Maj"] * 3 + [NO_CHORD] * 2 + ["G Maj"] * 3
+    assert indices[3] == -1
+    bounds = np.arange(9) * 0.5
+    assert merge_segments(labels, bounds[:-1], bounds[1:]) == [
+        (0.0, 1.5, "C Maj"), (1.5, 2.5, NO_CHORD), (2.5, 4.0, "G Maj"),
+    ]
+    assert merge_segments([], [], []) == []
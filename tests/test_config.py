@@ -5,7 +5,13 @@ import pytest
 from config.config import (
     DEMUCS_MODEL, SUPPORTED_AUDIO_FORMATS, ANALYSIS_DURATION_SEC,
     STEM_NAMES, FLUTE_BANDPASS_LOW_HZ, FLUTE_BANDPASS_HIGH_HZ,
-    HARMONIC_MARGIN, MIN_RAGA_CONFIDENCE, OUTPUT_DPI
+    HARMONIC_MARGIN, MIN_RAGA_CONFIDENCE, OUTPUT_DPI,
+    SEPARATION_CHUNK_SEC, SEPARATION_CHUNK_OVERLAP_SEC,
+    SEPARATION_WORKERS, SEPARATION_THREADS_PER_WORKER,
+    PREVIEW_FORMAT, PREVIEW_BITRATE_KBPS, PREVIEW_WORKERS, CHORD_VOCABULARY,
+    CHORD_TIMELINE_MAX_SEC, NOTE_HYSTERESIS_CENTS, PITCH_TRACKER,
+    TRANSCRIPTION_WINDOW_SEC, TRANSCRIPTION_OVERLAP_SEC, TRANSCRIPTION_WORKERS,
+    CACHE_DIR, PROJECT_ROOT
 )
 
 
@@ -45,6 +51,48 @@ def test_min_raga_confidence_range():
 def test_output_dpi_positive():
     assert OUTPUT_DPI > 0
 
+def test_separation_chunk_overlap_shorter_than_window():
+    assert 0 <= SEPARATION_CHUNK_OVERLAP_SEC < SEPARATION_CHUNK_SEC
+
+def test_separation_worker_counts_non_negative():
+    assert SEPARATION_WORKERS >= 0
+    assert SEPARATION_THREADS_PER_WORKER >= 0
+
+def test_preview_settings_valid():
+    assert PREVIEW_FORMAT in ("mp3", "opus")
+    assert PREVIEW_BITRATE_KBPS > 0
+    assert PREVIEW_WORKERS >= 0
+
+def test_unknown_preview_format_is_rejected_at_import():
+    import subprocess
+    root = os.path.dirname(os.path.dirname(__file__))
+    env = {**os.environ, "RAGAM_PREVIEW_FORMAT": "aac"}
+    proc = subprocess.run([sys.executable, "-c", "import config.config"], cwd=root, env=env,
+                          capture_output=True, text=True)
+    assert proc.returncode != 0 and "RAGAM_PREVIEW_FORMAT" in proc.stderr
+
+def test_chord_vocabulary_known():
+    assert CHORD_VOCABULARY in ("majmin", "sevenths", "full")
+
+def test_chord_timeline_limit_non_negative():
+    assert CHORD_TIMELINE_MAX_SEC >= 0
+
+def test_note_hysteresis_non_negative():
+    assert NOTE_HYSTERESIS_CENTS >= 0
+
+def test_pitch_tracker_known():
+    assert PITCH_TRACKER in ("pyin", "yin")
+
+def test_transcription_windows_valid():
+    assert TRANSCRIPTION_WINDOW_SEC > 0
+    assert TRANSCRIPTION_OVERLAP_SEC >= 0
+    assert TRANSCRIPTION_WORKERS >= 0
+
+def test_cache_dir_independent_of_cwd():
+    from pathlib import Path
+    assert Path(CACHE_DIR).is_absolute()
+    assert (PROJECT_ROOT / "config" / "config.py").exists()
+
 
 # ── Music Theory Tests (conditional) ─────────────────────────────────────────
 
@@ -0,0 +1,105 @@
+"""Unit tests for the shared decoded-audio provider (decode once, serve subranges, LRU)."""
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import numpy as np
+import pytest
+from src import decode
+
+SR = 100
+FILE_SEC = 10
+
+
+@pytest.fixture
+def fake_decoder(monkeypatch):
+    """Replaces the real decode with a ramp signal (sample i == i) and counts calls."""
+    calls = []
+
+    def _fake(path, sr, mono, offset, duration):
+        calls.append((offset, duration))
+        start = int(round(offset * SR))
+        stop = FILE_SEC * SR if duration is None else min(FILE_SEC * SR, start + int(round(duration * SR)))
+        return np.arange(start, stop, dtype=np.float32), SR
+
+    decode.clear()
+    monkeypatch.setattr(decode, "_decode", _fake)
+    yield calls
+    decode.clear()
+
+
+@pytest.fixture
+def audio_file(tmp_path):
+    path = tmp_path / "song.wav"
+    path.write_bytes(b"RIFF")
+    return path
+
+
+def test_subrange_is_served_from_wider_decode(fake_decoder, audio_file):
+    y60, _ = decode.load_audio(audio_file, duration=6)
+    y30, _ = decode.load_audio(audio_file, duration=3)
+    y_mid, _ = decode.load_audio(audio_file, offset=1, duration=2)
+    assert len(fake_decoder) == 1
+    assert np.array_equal(y30, y60[:300])
+    assert y_mid[0] == 100 and len(y_mid) == 200
+
+
+def test_wider_request_decodes_again_and_supersedes(fake_decoder, audio_file):
+    decode.load_audio(audio_file, duration=3)
+    decode.load_audio(audio_file, duration=6)
+    decode.load_audio(audio_file, duration=2)
+    assert len(fake_decoder) == 2
+    assert decode.get_decode_stats()["cached_bytes"] == 600 * 4
+
+
+def test_short_file_counts_as_decoded_to_end(fake_decoder, audio_file):
+    decode.load_audio(audio_file, duration=60)
+    y, _ = decode.load_audio(audio_file)
+    assert len(fake_decoder) == 1
+    assert len(y) == FILE_SEC * SR
+
+
+def test_truncated_read_is_not_end_of_file(fake_decoder, audio_file, monkeypatch):
+    # librosa truncates duration * sr, so a mid-file read may come back one sample short
+    def _truncating(path, sr, mono, offset, duration):
+        fake_decoder.append((offset, duration))
+        start = int(round(offset * SR))
+        return np.arange(start, start + int(round(duration * SR)) - 1, dtype=np.float32), SR
+
+    monkeypatch.setattr(decode, "_decode", _truncating)
+    decode.load_audio(audio_file, offset=0, duration=2)
+    y, _ = decode.load_audio(audio_file, offset=3, duration=2)
+    assert len(fake_decoder) == 2 and y[0] == 300
+
+
+def test_buffers_are_read_only(fake_decoder, audio_file):
+    y, _ = decode.load_audio(audio_file, duration=1)
+    with pytest.raises(ValueError):
+        y[0] = 1.0
+
+
+def test_lru_eviction_by_bytes(fake_decoder, tmp_path, monkeypatch):
+    monkeypatch.setattr(decode, "DECODE_CACHE_MAX_BYTES", 1500 * 4)
+    files = []
+    for name in ("a.wav", "b.wav", "c.wav"):
+        files.append(tmp_path / name)
+        files[-1].write_bytes(name.encode())
+    for path in files:
+        decode.load_audio(path)
+    # Only the most recent file fits; a.wav has to be decoded again
+    decode.load_audio(files[0])
+    assert len(fake_decoder) == 4
+    assert decode.get_decode_stats()["cached_bytes"] <= 1500 * 4
+
+
+def test_rewritten_file_is_not_served_stale(fake_decoder, audio_file):
+    decode.load_audio(audio_file, duration=1)
+    os.utime(audio_file, ns=(1, 1))
+    decode.load_audio(audio_file, duration=1)
+    assert len(fake_decoder) == 2
+
+
+def test_uncached_read_keeps_nothing(fake_decoder, audio_file):
+    y, _ = decode.load_audio(audio_file, offset=1, duration=2, cache=False)
+    decode.load_audio(audio_file, offset=1, duration=2, cache=False)
+    assert len(fake_decoder) == 2
+    assert y[0] == 100 and not y.flags.writeable
+    assert decode.get_decode_stats()["cached_bytes"] == 0
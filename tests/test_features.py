@@ -0,0 +1,87 @@
+"""Tests for the shared CQT/chroma feature stage (needs librosa + soundfile; skipped in CI without them)."""
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import numpy as np
+import pytest
+
+try:
+    import librosa
+    import soundfile as sf
+    from src import cache, decode, features, utils
+    HAS_FEATURES = True
+except ImportError:
+    HAS_FEATURES = False
+
+pytestmark = pytest.mark.skipif(not HAS_FEATURES, reason="librosa/soundfile not installed")
+SR = 22050
+
+
+@pytest.fixture
+def track(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_ROOT", tmp_path / "cache")
+    monkeypatch.setattr(utils, "HASH_MEMO_PATH", tmp_path / "hash_memo.json")
+    t = np.arange(SR * 6) / SR
+    # A major triad, so the chroma has a clear shape
+    y = sum(0.2 * np.sin(2 * np.pi * f * t) for f in (440.0, 554.37, 659.25))
+    path = tmp_path / "vocals.wav"
+    sf.write(path, y.astype(np.float32), SR, subtype="FLOAT")
+    features.clear()
+    decode.clear()
+    yield path
+    features.clear()
+    decode.clear()
+
+
+def test_matches_librosa_chroma_cqt(track):
+    y, _ = librosa.load(track, sr=SR, duration=4)
+    expected = librosa.feature.chroma_cqt(y=y, sr=SR)
+    chroma, sr = features.get_chroma(track, duration=4)
+    assert sr == SR and chroma.shape == expected.shape
+    assert np.allclose(chroma, expected, atol=1e-6)
+    assert not chroma.flags.writeable
+
+
+def test_shorter_range_is_served_from_longer_one(track):
+    long_chroma, _ = features.get_chroma(track, duration=4)
+    before = features.get_feature_stats()
+    short_chroma, _ = features.get_chroma(track, duration=2)
+    after = features.get_feature_stats()
+
+    assert after["hits"] == before["hits"] + 1 and after["cqt_sec"] == before["cqt_sec"]
+    y, _ = librosa.load(track, sr=SR, duration=2)
+    assert short_chroma.shape == librosa.feature.chroma_cqt(y=y, sr=SR).shape
+    assert np.array_equal(short_chroma, long_chroma[:, :short_chroma.shape[1]])
+
+
+def test_longer_range_recomputes(track):
+    features.get_chroma(track, duration=2)
+    misses = features.get_feature_stats()["misses"]
+    chroma, _ = features.get_chroma(track, duration=4)
+    assert features.get_feature_stats()["misses"] == misses + 1
+    assert chroma.shape[1] == 1 + (4 * SR) // features.HOP_LENGTH
+
+
+def test_chroma_is_loaded_from_the_analysis_cache(track):
+    computed, _ = features.get_chroma(track, duration=4)
+    features.clear()
+    before = features.get_feature_stats()
+    loaded, sr = features.get_chroma(track, duration=4)
+    after = features.get_feature_stats()
+    assert after["disk_hits"] == before["disk_hits"] + 1 and after["misses"] == before["misses"]
+    assert sr == SR and np.array_equal(loaded, computed)
+    # A sub-range is then sliced from the loaded chroma; the CQT is recomputed only when asked for
+    short, _ = features.get_chroma(track, duration=2)
+    assert np.array_equal(short, computed[:, :short.shape[1]])
+    cqt, _, _ = features.get_features(track, duration=4)
+    assert cqt.shape[1] == computed.shape[1]
+
+
+def test_sliced_range_is_persisted_for_later_sessions(track):
+    features.get_chroma(track, duration=4)
+    sliced, _ = features.get_chroma(track, duration=2)
+    features.clear()  # a new session: nothing in memory
+    before = features.get_feature_stats()
+    loaded, _ = features.get_chroma(track, duration=2)
+    after = features.get_feature_stats()
+    assert after["disk_hits"] == before["disk_hits"] + 1 and after["misses"] == before["misses"]
+    assert np.array_equal(loaded, sliced)
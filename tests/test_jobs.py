@@ -0,0 +1,140 @@
+"""Unit tests for the separation job table (no workers are started)."""
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from src import jobs
+
+try:
+    from src import audio_processor
+    HAS_SEPARATION = True
+except ImportError:
+    HAS_SEPARATION = False
+
+needs_separation = pytest.mark.skipif(not HAS_SEPARATION, reason="audio_processor dependencies not installed")
+
+
+@pytest.fixture(autouse=True)
+def empty_job_table():
+    jobs._jobs.clear()
+    jobs._inflight.clear()
+    yield
+    jobs._jobs.clear()
+    jobs._inflight.clear()
+
+
+class _Executor:
+    """Stand-in worker pool: hands out pending futures, or raises `error` on submit."""
+    def __init__(self, error=None):
+        self.error = error
+        self.futures = []
+        self.shut_down = False
+
+    def submit(self, *args):
+        if self.error is not None:
+            raise self.error
+        self.futures.append(Future())
+        return self.futures[-1]
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+@pytest.fixture
+def executors(monkeypatch, tmp_path):
+    """Queue of stand-in pools handed out by each (re)start of the worker tier."""
+    pools = []
+
+    def start():
+        jobs._executor = pools.pop(0)
+    monkeypatch.setattr(jobs, "_start_executor", start)
+    monkeypatch.setattr(jobs, "_executor", None)
+    monkeypatch.setattr(audio_processor, "find_cached_stems", lambda path, model: None)
+    (tmp_path / "song.wav").write_bytes(b"RIFF")
+    yield pools
+
+
+def _add_job(job_id, joined=0):
+    jobs._jobs[job_id] = jobs._new_job_record(job_id, ("hash", "model"), "song.wav", "model", time.time())
+    jobs._jobs[job_id]["joined"] = joined
+    jobs._inflight[("hash", "model")] = job_id
+
+
+def _finish(job_id, result=None, error=None):
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result((result, {}))
+    jobs._on_job_finished(job_id, future)
+
+
+def test_failed_job_keeps_error_and_traceback():
+    _add_job("a")
+    _finish("a", error=RuntimeError("out of memory"))
+    job = jobs.get_job("a")
+    assert job["status"] == jobs.FAILED
+    assert job["error"] == "out of memory"
+    assert "RuntimeError: out of memory" in job["traceback"]
+
+
+def test_collect_releases_finished_job_after_every_submitter():
+    _add_job("a", joined=1)
+    assert jobs.collect_job("a")["status"] == jobs.QUEUED
+    assert "a" in jobs._jobs  # still running: polling never releases it
+
+    _finish("a", result={"vocals": "v.wav"})
+    assert jobs.collect_job("a")["result"] == {"vocals": "v.wav"}
+    assert "a" in jobs._jobs  # the joined session hasn't collected yet
+    assert jobs.collect_job("a")["status"] == jobs.DONE
+    assert "a" not in jobs._jobs
+
+
+def test_uncollected_finished_jobs_expire():
+    _add_job("old")
+    _add_job("running")
+    _finish("old", result={})
+    jobs._jobs["old"]["finished_at"] -= jobs.FINISHED_JOB_TTL_SEC + 1
+    jobs._prune_finished(time.time())
+    assert "old" not in jobs._jobs
+    assert "running" in jobs._jobs
+
+
+@needs_separation
+def test_failed_submit_fails_the_job_instead_of_leaving_it_queued(executors, tmp_path):
+    executors.append(_Executor(error=RuntimeError("cannot start workers")))
+    job_id = jobs.submit_separation(tmp_path / "song.wav", "model")
+    assert jobs.get_job(job_id)["status"] == jobs.FAILED
+    assert jobs.get_job(job_id)["error"] == "cannot start workers"
+    assert not jobs._inflight
+    # A new upload of the same file gets a new job rather than joining the failed one
+    executors.append(_Executor())
+    jobs._executor = None
+    assert jobs.submit_separation(tmp_path / "song.wav", "model") != job_id
+
+
+@needs_separation
+def test_broken_pool_is_rebuilt(executors, tmp_path):
+    broken, fresh = _Executor(error=BrokenProcessPool("a worker died")), _Executor()
+    executors.extend([broken, fresh])
+    job_id = jobs.submit_separation(tmp_path / "song.wav", "model")
+    assert broken.shut_down and jobs._executor is fresh
+    assert jobs.get_job(job_id)["status"] == jobs.QUEUED and len(fresh.futures) == 1
+
+    # A worker dying mid-job fails that job and retires the pool
+    fresh.futures[0].set_exception(BrokenProcessPool("a worker died"))
+    assert jobs.get_job(job_id)["status"] == jobs.FAILED
+    assert fresh.shut_down and jobs._executor is None and not jobs._inflight
+
+
+def test_cancelled_job_fails():
+    _add_job("a")
+    future = Future()
+    future.cancel()
+    jobs._on_job_finished("a", future)
+    assert jobs.get_job("a")["status"] == jobs.FAILED
+    assert not jobs._inflight
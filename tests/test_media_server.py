@@ -0,0 +1,119 @@
+"""Tests for the media file server (range requests, revalidation, per-session grants)."""
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import urllib.error
+import urllib.request
+import pytest
+from src import media_server
+
+PAYLOAD = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_server, "MEDIA_SERVER_HOST", "127.0.0.1")
+    monkeypatch.setattr(media_server, "MEDIA_SERVER_PORT", 0)
+    monkeypatch.setattr(media_server, "MEDIA_BASE_URL", "")
+    monkeypatch.setattr(media_server, "MEDIA_ALLOW_ORIGIN", "")
+    root = tmp_path / "outputs"
+    (root / "track").mkdir(parents=True)
+    (root / "track" / "vocals.wav").write_bytes(PAYLOAD)
+    (root / "track" / ".vocals.wav.tmp").write_bytes(b"partial")
+    (root / "track" / "manifest.json").write_text("{}")
+    (tmp_path / "secret.wav").write_bytes(b"not served")
+    media_server.ensure_started({"outputs": root})
+    yield root
+    media_server.stop()
+
+
+def _get(url, **headers):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as resp:
+            return resp.status, dict(resp.headers), resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), b""
+
+
+def test_full_and_range_requests(served):
+    url = media_server.media_url(served / "track" / "vocals.wav", "session-a")
+    status, headers, body = _get(url)
+    assert status == 200 and body == PAYLOAD
+    assert headers["Accept-Ranges"] == "bytes" and headers["Content-Type"].startswith("audio/")
+    # A URL names fixed bytes, so the browser may keep them; shared caches may not
+    assert "immutable" in headers["Cache-Control"] and "private" in headers["Cache-Control"]
+    assert "Access-Control-Allow-Origin" not in headers
+
+    status, headers, body = _get(url, Range="bytes=100-199")
+    assert status == 206 and body == PAYLOAD[100:200]
+    assert headers["Content-Range"] == f"bytes 100-199/{len(PAYLOAD)}"
+
+    status, _, body = _get(url, Range="bytes=-10")
+    assert status == 206 and body == PAYLOAD[-10:]
+
+    status, headers, _ = _get(url, Range=f"bytes={len(PAYLOAD)}-")
+    assert status == 416 and headers["Content-Range"] == f"bytes */{len(PAYLOAD)}"
+
+
+def test_etag_revalidation_and_download_header(served):
+    url = media_server.media_url(served / "track" / "vocals.wav", "session-a", download_name="Vocals.wav")
+    status, headers, _ = _get(url)
+    assert 'attachment; filename="Vocals.wav"' in headers["Content-Disposition"]
+
+    status, _, body = _get(url, **{"If-None-Match": headers["ETag"]})
+    assert status == 304 and body == b""
+
+
+def test_only_granted_files_are_served(served):
+    url = media_server.media_url(served / "track" / "vocals.wav", "session-a")
+    base, token = url.rsplit("/", 2)[:2]
+    for path in ["/outputs/track/vocals.wav", "/track/vocals.wav", f"/{token}/manifest.json",
+                 f"/{token}/../secret.wav", f"/{token}", "/" + "x" * 32 + "/vocals.wav"]:
+        assert _get(base + path)[0] == 404, path
+    # Manifests, temp files and anything outside the roots are never granted
+    for path in [served / "track" / "manifest.json", served / "track" / ".vocals.wav.tmp", served.parent / "secret.wav"]:
+        with pytest.raises(ValueError):
+            media_server.media_url(path, "session-a")
+
+
+def test_grants_are_per_session_and_version(served):
+    stem = served / "track" / "vocals.wav"
+    url_a = media_server.media_url(stem, "session-a")
+    url_b = media_server.media_url(stem, "session-b")
+    assert url_a != url_b and media_server.media_url(stem, "session-a") == url_a
+
+    media_server.revoke_session("session-a")
+    assert _get(url_a)[0] == 404
+    assert _get(url_b)[0] == 200
+
+    # A rewritten file needs a new URL: the old one never serves different bytes
+    os.utime(stem, ns=(stem.stat().st_atime_ns, stem.stat().st_mtime_ns + 10**9))
+    assert _get(url_b)[0] == 404
+    assert _get(media_server.media_url(stem, "session-b"))[0] == 200
+
+
+def test_cors_only_for_the_configured_origin(served, monkeypatch):
+    monkeypatch.setattr(media_server, "MEDIA_ALLOW_ORIGIN", "https://app.example")
+    url = media_server.media_url(served / "track" / "vocals.wav", "session-a")
+    _, headers, _ = _get(url, Origin="https://app.example")
+    assert headers["Access-Control-Allow-Origin"] == "https://app.example"
+    _, headers, _ = _get(url, Origin="https://elsewhere.example")
+    assert "Access-Control-Allow-Origin" not in headers
+
+
+def test_inline_fallback_without_base_url(served):
+    src = media_server.media_src(served / "track" / "vocals.wav", "session-a")
+    assert src.startswith("data:audio/")
+
+
+def test_configured_base_url_needs_its_own_port(monkeypatch):
+    import socket
+    with socket.socket() as taken:
+        taken.bind(("127.0.0.1", 0))
+        taken.listen()
+        monkeypatch.setattr(media_server, "MEDIA_SERVER_HOST", "127.0.0.1")
+        monkeypatch.setattr(media_server, "MEDIA_SERVER_PORT", taken.getsockname()[1])
+        monkeypatch.setattr(media_server, "MEDIA_BASE_URL", "https://app.example/media")
+        # Another port would get requests for URLs it never granted: fail instead
+        with pytest.raises(RuntimeError, match="could not bind"):
+            media_server.ensure_started({})
+        assert media_server._server is None
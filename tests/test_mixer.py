@@ -0,0 +1,93 @@
+"""Tests for the streaming stem mixer (needs the audio stack; skipped in CI without it)."""
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import numpy as np
+import pytest
+
+try:
+    import soundfile as sf
+    from src import cache
+    from src.audio_processor import mix_stems, get_custom_mix
+    from src.stem_matrix import get_stem_matrix
+    HAS_MIXER = True
+except ImportError:
+    HAS_MIXER = False
+
+pytestmark = pytest.mark.skipif(not HAS_MIXER, reason="audio_processor dependencies not installed")
+SR = 8000
+
+
+def _write(path, data):
+    sf.write(path, np.asarray(data, dtype=np.float32), SR, subtype="FLOAT")
+    return path
+
+
+def test_streamed_mix_matches_in_memory_sum(tmp_path):
+    rng = np.random.default_rng(0)
+    stems = [rng.uniform(-0.6, 0.6, (n, 2)) for n in (5000, 5300, 4900)]
+    paths = [_write(tmp_path / f"s{i}.wav", s) for i, s in enumerate(stems)]
+
+    out = mix_stems(paths, tmp_path / "mix.wav", block_frames=1024)
+    mixed, sr = sf.read(out)
+
+    expected = sum(s[:4900] for s in stems)
+    expected = expected / max(1.0, np.max(np.abs(expected)))
+    assert sr == SR and mixed.shape == (4900, 2)
+    assert np.allclose(mixed, expected, atol=1e-4)
+
+
+def test_mono_stem_is_panned_into_stereo_mix(tmp_path):
+    mono = _write(tmp_path / "mono.wav", np.full(100, 0.1))
+    stereo = _write(tmp_path / "stereo.wav", np.zeros((100, 2)))
+    mixed, _ = sf.read(mix_stems([mono, stereo], tmp_path / "mix.wav", pans=[-1.0, 0.0]))
+    assert mixed.shape == (100, 2)
+    assert np.allclose(mixed[:, 1], 0.0)
+    assert mixed[0, 0] > 0.1
+
+
+def test_gain_and_unreadable_stems(tmp_path):
+    mono = _write(tmp_path / "mono.wav", np.full(100, 0.5))
+    mixed, _ = sf.read(mix_stems([mono, tmp_path / "missing.wav"], tmp_path / "mix.wav", gains=[0.5, 1.0]))
+    assert np.allclose(mixed, 0.25, atol=1e-4)
+    assert mix_stems([tmp_path / "missing.wav"], tmp_path / "none.wav") is None
+
+
+def test_custom_mix_is_memoized_per_selection(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_ROOT", tmp_path / "cache")
+    a = _write(tmp_path / "a.wav", np.full(100, 0.1))
+    b = _write(tmp_path / "b.wav", np.full(100, 0.2))
+
+    first, hit = get_custom_mix([a, b])
+    assert not hit and first.exists()
+    again, hit = get_custom_mix([b, a])
+    assert hit and again == first
+    louder, hit = get_custom_mix([a, b], gains=[2.0, 1.0])
+    assert not hit and louder != first
+    assert cache.read_manifest(first.parent)["kind"] == "mix"
+
+
+def test_stem_matrix_mix_matches_streaming_mixer(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_ROOT", tmp_path / "cache")
+    rng = np.random.default_rng(1)
+    stems = {
+        "vocals": _write(tmp_path / "vocals.wav", rng.uniform(-0.5, 0.5, (3000, 2))),
+        "flute": _write(tmp_path / "flute.wav", rng.uniform(-0.5, 0.5, 3100)),
+        "bass": _write(tmp_path / "bass.wav", rng.uniform(-0.5, 0.5, (3000, 2))),
+    }
+    matrix = get_stem_matrix(stems)
+    assert matrix.data.shape == (3, 2, 3000)
+    assert get_stem_matrix(stems) is matrix
+
+    mixed = matrix.mix({"vocals": 0.5, "flute": 1.2}, {"flute": -0.4})
+    streamed, _ = sf.read(mix_stems([stems["vocals"], stems["flute"]], tmp_path / "mix.wav",
+                                    gains=[0.5, 1.2], pans=[0.0, -0.4]))
+    assert np.allclose(mixed, streamed, atol=1e-4)
+
+
+def test_failed_custom_mix_leaves_no_cache_entry(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_ROOT", tmp_path / "cache")
+    broken = tmp_path / "broken.wav"
+    broken.write_bytes(b"not audio")
+
+    assert get_custom_mix([broken]) == (None, False)
+    assert not list((tmp_path / "cache" / "mixes").iterdir())
@@ -0,0 +1,80 @@
+"""Unit tests for the vectorized note segmenter (NumPy only)."""
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import numpy as np
+from src.notes import segment_notes, hz_to_midi
+
+SR, HOP = 22050, 512
+FRAME_SEC = HOP / SR
+
+
+def _hz(midi):
+    return 440.0 * 2 ** ((np.asarray(midi, dtype=np.float64) - 69) / 12)
+
+
+def _reference(f0, voiced_flag, min_duration=0.15):
+    # The former per-frame loop
+    times = np.arange(len(f0)) * FRAME_SEC
+    events, current, start = [], None, 0.0
+    for i, (pitch, voiced) in enumerate(zip(f0, voiced_flag)):
+        if not voiced or np.isnan(pitch):
+            if current is not None:
+                events.append((start, times[i], current))
+                current = None
+            continue
+        midi = int(round(float(hz_to_midi(pitch))))
+        if current is None:
+            current, start = midi, times[i]
+        elif midi != current:
+            events.append((start, times[i], current))
+            current, start = midi, times[i]
+    if current is not None:
+        events.append((start, times[-1], current))
+    return [e for e in events if e[1] - e[0] > min_duration]
+
+
+def test_matches_per_frame_loop():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        n = int(rng.integers(1, 2000))
+        midi = 60 + np.cumsum(rng.integers(-1, 2, n) * (rng.random(n) < 0.05)) + rng.normal(0, 0.3, n)
+        f0 = _hz(midi)
+        voiced = rng.random(n) > 0.1
+        f0[~voiced & (rng.random(n) < 0.5)] = np.nan
+        events = segment_notes(f0, voiced, SR, hop_length=HOP)
+        expected = np.array(_reference(f0, voiced)).reshape(-1, 3)
+        assert events.shape == expected.shape and np.allclose(events, expected)
+
+
+def test_short_notes_dropped_and_unvoiced_gaps_split():
+    midi = [60] * 20 + [62] * 3 + [64] * 20
+    voiced = np.ones(len(midi), dtype=bool)
+    voiced[30] = False
+    events = segment_notes(_hz(midi), voiced, SR, hop_length=HOP)
+    # The 3-frame (~70 ms) D is noise; the gap splits the E in two
+    assert events[:, 2].tolist() == [60, 64, 64]
+    assert np.isclose(events[0, 1], 20 * FRAME_SEC)
+    assert np.isclose(events[1, 1], events[2, 0] - FRAME_SEC)
+
+
+def test_hysteresis_keeps_gamaka_as_one_note():
+    # A swara oscillating +-70 cents around D (62): rounds to 61/62/63 frame by frame
+    t = np.arange(200)
+    midi = 62 + 0.7 * np.sin(t / 3)
+    voiced = np.ones(len(t), dtype=bool)
+    # Without hysteresis it splits into fragments too short to survive the noise filter
+    assert len(segment_notes(_hz(midi), voiced, SR, hop_length=HOP)) == 0
+    events = segment_notes(_hz(midi), voiced, SR, hop_length=HOP, hysteresis_cents=30)
+    assert events[:, 2].tolist() == [62]
+    assert np.isclose(events[0, 1], (len(t) - 1) * FRAME_SEC)
+    # A real step to E still starts a new note
+    stepped = np.concatenate([midi, np.full(40, 64.0)])
+    events = segment_notes(_hz(stepped), np.ones(len(stepped), dtype=bool), SR, hop_length=HOP, hysteresis_cents=30)
+    assert events[:, 2].tolist() == [62, 64]
+    assert np.isclose(events[1, 0], 200 * FRAME_SEC)
+
+
+def test_empty_and_unvoiced_tracks():
+    assert segment_notes(np.array([]), np.array([], dtype=bool), SR).shape == (0, 3)
+    f0 = np.full(100, np.nan)
+    assert segment_notes(f0, np.zeros(100, dtype=bool), SR).shape == (0, 3)
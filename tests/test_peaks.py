@@ -0,0 +1,56 @@
+"""Tests for the waveform peak pyramids (needs soundfile; skipped in CI without it)."""
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import numpy as np
+import pytest
+
+try:
+    import soundfile as sf
+    from src import peaks
+    HAS_PEAKS = True
+except ImportError:
+    HAS_PEAKS = False
+
+pytestmark = pytest.mark.skipif(not HAS_PEAKS, reason="soundfile not installed")
+SR = 8000
+
+
+def _write(path, data):
+    sf.write(path, np.asarray(data, dtype=np.float32), SR, subtype="FLOAT")
+    return path
+
+
+def test_pyramid_matches_naive_min_max(tmp_path, monkeypatch):
+    # Small read blocks, so peaks are assembled across several blocks
+    monkeypatch.setattr(peaks, "BLOCK_FRAMES", peaks.BASE_SAMPLES_PER_PEAK * 3)
+    rng = np.random.default_rng(0)
+    y = rng.uniform(-0.9, 0.9, (peaks.BASE_SAMPLES_PER_PEAK * 600 + 77, 2))
+    path = _write(tmp_path / "vocals.wav", y)
+
+    with np.load(peaks.compute_peaks(path)) as data:
+        assert int(data["frames"]) == len(y) and int(data["samplerate"]) == SR
+        base_max = data["max_0"] / 127.0
+        level1_min = data["min_1"]
+        base_min = data["min_0"]
+
+    step = peaks.BASE_SAMPLES_PER_PEAK
+    expected = [y[i:i + step].max() for i in range(0, len(y), step)]
+    assert len(base_max) == len(expected) == 601
+    assert np.allclose(base_max, expected, atol=1 / 127)
+    # Each coarser level merges pairs of the finer one
+    assert len(level1_min) == 301
+    assert np.array_equal(level1_min[:300], base_min[:600].reshape(-1, 2).min(axis=1))
+
+
+def test_get_peaks_interleaves_and_recomputes_stale_files(tmp_path):
+    path = _write(tmp_path / "drums.wav", np.full(SR, 0.5))
+    values, duration = peaks.get_peaks(path, target_peaks=10)
+    assert duration == pytest.approx(1.0)
+    assert values[0::2] == values[1::2] and values[0] == pytest.approx(0.5, abs=0.01)
+
+    # Rewriting the audio makes the cached peaks stale
+    _write(path, np.full(2 * SR, -0.25))
+    os.utime(path, ns=(0, 1))
+    values, duration = peaks.get_peaks(path, target_peaks=10)
+    assert duration == pytest.approx(2.0)
+    assert values[0] == pytest.approx(-0.25, abs=0.01)
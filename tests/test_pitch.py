@@ -0,0 +1,56 @@
+"""Unit tests for the vectorized YIN pitch tracker (NumPy only)."""
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import numpy as np
+import pytest
+from src.pitch import yin
+
+SR = 22050
+FMIN, FMAX = 65.41, 2093.0  # C2..C7, as used for transcription
+
+
+def _tone(hz, seconds=1.0):
+    phase = 2 * np.pi * np.cumsum(np.broadcast_to(hz, int(seconds * SR))) / SR
+    return (np.sin(phase) + 0.5 * np.sin(2 * phase) + 0.3 * np.sin(3 * phase)).astype(np.float32)
+
+
+@pytest.mark.parametrize("hz", [82.4, 220.0, 587.3, 1500.0])
+def test_steady_tones_within_a_few_cents(hz):
+    f0, voiced, aperiodicity = yin(_tone(hz), SR, FMIN, FMAX)
+    inner = slice(4, -4)  # edge frames see the zero padding
+    assert voiced[inner].all()
+    assert np.max(np.abs(1200 * np.log2(f0[inner] / hz))) < 5
+    assert aperiodicity[inner].max() < 0.05
+
+
+def test_frames_align_with_librosa_and_silence_is_unvoiced():
+    y = np.concatenate([_tone(220.0), np.zeros(SR, dtype=np.float32), _tone(330.0)])
+    f0, voiced, _ = yin(y, SR, FMIN, FMAX)
+    # librosa's centered framing: 1 + len(y) // hop frames, frame t at t * hop
+    assert len(f0) == len(voiced) == 1 + len(y) // 512
+    times = np.arange(len(f0)) * 512 / SR
+    silent = (times > 1.1) & (times < 1.9)
+    assert not voiced[silent].any() and np.isnan(f0[silent]).all()
+    second = times > 2.1
+    assert np.nanmedian(f0[second]) == pytest.approx(330.0, rel=0.005)
+
+
+def test_vibrato_is_followed():
+    t = np.arange(3 * SR) / SR
+    hz = 220 * 2 ** (0.5 / 12 * np.sin(2 * np.pi * 5 * t))
+    f0, voiced, _ = yin(_tone(hz, 3.0), SR, FMIN, FMAX)
+    frames = np.arange(len(f0))[4:-4]
+    truth = np.interp(frames * 512 / SR, t, hz)
+    assert np.median(np.abs(1200 * np.log2(f0[frames] / truth))) < 10
+
+
+def test_noise_and_empty_input_are_unvoiced():
+    noise = np.random.default_rng(0).standard_normal(SR).astype(np.float32)
+    assert yin(noise, SR, FMIN, FMAX)[1].mean() < 0.2
+    f0, voiced, _ = yin(np.zeros(0, dtype=np.float32), SR, FMIN, FMAX)
+    assert len(f0) == 1 and not voiced.any()
+
+
+def test_fmin_too_low_for_frame_rejected():
+    with pytest.raises(ValueError):
+        yin(_tone(220.0), SR, fmin=20.0, fmax=FMAX)
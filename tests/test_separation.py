@@ -0,0 +1,280 @@
+"""Tests for chunked and single-flight separation, with a stand-in model (needs the audio stack)."""
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import shutil
+import threading
+import time
+
+import numpy as np
+import pytest
+
+try:
+    import soundfile as sf
+    import torch
+    from src import audio_processor
+    HAS_SEPARATION = True
+except ImportError:
+    HAS_SEPARATION = False
+
+pytestmark = pytest.mark.skipif(not HAS_SEPARATION, reason="audio_processor dependencies not installed")
+SR = 1000
+
+
+class _IdentityModel:
+    """Every 'source' is the input itself, so a correct stitch reproduces the input."""
+    samplerate = SR
+    audio_channels = 2
+    sources = ["vocals", "other"]
+
+
+@pytest.fixture
+def fake_separation(monkeypatch):
+    signal = np.random.default_rng(0).uniform(-0.5, 0.5, (2, 10 * SR)).astype(np.float32)
+
+    def decode(file_path, model, seek_time=None, duration=None):
+        start = int(round((seek_time or 0) * SR))
+        stop = signal.shape[-1] if duration is None else start + int(round(duration * SR))
+        return torch.from_numpy(signal[:, start:stop].copy())
+
+    monkeypatch.setattr(audio_processor, "get_separation_model", lambda name: (_IdentityModel(), 0.0, False))
+    monkeypatch.setattr(audio_processor, "_decode_for_model", decode)
+    monkeypatch.setattr(audio_processor, "_probe_duration", lambda path: signal.shape[-1] / SR)
+    monkeypatch.setattr(audio_processor, "_separate_tensor",
+                        lambda model, wav: np.stack([wav.numpy()] * len(model.sources)))
+    return signal
+
+
+@pytest.mark.parametrize("overlap_sec", [0.0, 0.5])
+def test_chunked_separation_reassembles_every_window(fake_separation, tmp_path, overlap_sec):
+    stats = audio_processor._run_demucs_chunked("song.wav", tmp_path, "fake", window_sec=3.0, overlap_sec=overlap_sec)
+    assert stats["windows"] >= 4
+    for name in _IdentityModel.sources:
+        stem, sr = sf.read(tmp_path / f"{name}.wav", dtype="float32")
+        assert sr == SR and stem.shape == fake_separation.T.shape
+        # PCM_16 output
+        assert np.allclose(stem, fake_separation.T, atol=1e-4)
+
+
+needs_ffmpeg = pytest.mark.skipif(not HAS_SEPARATION or not shutil.which("ffmpeg"), reason="needs ffmpeg")
+
+
+@needs_ffmpeg
+def test_separation_counts_previews_in_the_manifest(monkeypatch, tmp_path):
+    from src import cache, utils
+
+    class _Model(_IdentityModel):
+        samplerate = 8000
+
+    signal = np.random.default_rng(1).uniform(-0.5, 0.5, (2, 8000)).astype(np.float32)
+    monkeypatch.setattr(cache, "CACHE_ROOT", tmp_path / "cache")
+    monkeypatch.setattr(utils, "HASH_MEMO_PATH", tmp_path / "hash_memo.json")
+    monkeypatch.setattr(audio_processor, "get_separation_model", lambda name: (_Model(), 0.0, False))
+    monkeypatch.setattr(audio_processor, "_decode_for_model", lambda *args, **kwargs: torch.from_numpy(signal))
+    monkeypatch.setattr(audio_processor, "_probe_duration", lambda path: 1.0)
+    monkeypatch.setattr(audio_processor, "_separate_tensor",
+                        lambda model, wav: np.stack([wav.numpy()] * len(model.sources)))
+    song = tmp_path / "song.wav"
+    sf.write(song, signal.T, 8000)
+
+    stems = audio_processor.separate_audio(song, "fake", chunked=False)
+    assert set(stems) == {"vocals", "other"}
+    track_dir = stems["vocals"].parent
+    manifest = cache.read_manifest(track_dir)
+    for name in stems:
+        preview = utils.preview_path(stems[name])
+        assert preview.exists() and manifest["files"][preview.name] == preview.stat().st_size
+    assert manifest["size_bytes"] == sum(p.stat().st_size for p in track_dir.iterdir() if p.name != "manifest.json")
+
+
+def test_device_follows_the_demucs_cli_order(monkeypatch):
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: True)
+    monkeypatch.setattr(torch.backends.mps, "is_available", lambda: True)
+    assert audio_processor.get_separation_device() == "cuda"
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: False)
+    assert audio_processor.get_separation_device() == "mps"
+    monkeypatch.setattr(torch.backends.mps, "is_available", lambda: False)
+    assert audio_processor.get_separation_device() == "cpu"
+
+
+@pytest.fixture
+def slow_separation(monkeypatch, tmp_path):
+    """A stand-in model that counts its runs and blocks each one until `release` is set."""
+    from src import cache, utils
+
+    class _Model(_IdentityModel):
+        samplerate = 8000
+        sources = ["vocals", "drums", "bass", "piano", "guitar", "other"]  # a complete stem folder
+
+    signal = np.random.default_rng(2).uniform(-0.5, 0.5, (2, 8000)).astype(np.float32)
+    runs, started, release = [], threading.Event(), threading.Event()
+
+    def separate(model, wav):
+        runs.append(1)
+        started.set()
+        release.wait(10)
+        return np.stack([wav.numpy()] * len(model.sources))
+
+    monkeypatch.setattr(cache, "CACHE_ROOT", tmp_path / "cache")
+    monkeypatch.setattr(utils, "HASH_MEMO_PATH", tmp_path / "hash_memo.json")
+    monkeypatch.setattr(audio_processor, "get_separation_model", lambda name: (_Model(), 0.0, False))
+    monkeypatch.setattr(audio_processor, "_decode_for_model", lambda *args, **kwargs: torch.from_numpy(signal))
+    monkeypatch.setattr(audio_processor, "_probe_duration", lambda path: 1.0)
+    monkeypatch.setattr(audio_processor, "_separate_tensor", separate)
+    song = tmp_path / "song.wav"
+    sf.write(song, signal.T, 8000)
+    return song, runs, started, release
+
+
+@needs_ffmpeg
+def test_concurrent_separations_run_once(slow_separation):
+    song, runs, started, release = slow_separation
+    dedup_hits = audio_processor.get_single_flight_stats()["dedup_hits"]
+    results = []
+    first = threading.Thread(target=lambda: results.append(audio_processor.separate_audio(song, "fake", chunked=False)))
+    first.start()
+    assert started.wait(10)
+    # The second request finds the track lock held and waits for the first run
+    second = threading.Thread(target=lambda: results.append(audio_processor.separate_audio(song, "fake", chunked=False)))
+    second.start()
+    time.sleep(0.5)
+    release.set()
+    first.join(10)
+    second.join(10)
+
+    assert len(runs) == 1
+    assert audio_processor.get_single_flight_stats()["dedup_hits"] == dedup_hits + 1
+    assert len(results) == 2 and results[0] == results[1]
+
+
+@needs_ffmpeg
+def test_concurrent_submissions_join_one_job(slow_separation, monkeypatch):
+    from src import jobs
+    song, runs, started, release = slow_separation
+    # In-process worker thread, so the stand-in model applies
+    monkeypatch.setattr(jobs, "SEPARATION_WORKERS", 0)
+    monkeypatch.setattr(jobs, "_executor", None)
+    dedup_hits = jobs.get_job_stats()["dedup_hits"]
+    try:
+        job_id = jobs.submit_separation(song, "fake", chunked=False)
+        assert started.wait(10)
+        assert jobs.submit_separation(song, "fake", chunked=False) == job_id
+        release.set()
+        deadline = time.time() + 10
+        while jobs.get_job(job_id)["status"] not in (jobs.DONE, jobs.FAILED) and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        release.set()
+        jobs.shutdown_workers()
+    job = jobs.get_job(job_id)
+    assert job["status"] == jobs.DONE and job["joined"] == 1
+    assert jobs.get_job_stats()["dedup_hits"] == dedup_hits + 1
+    assert len(runs) == 1
+
+
+def test_stale_lock_is_taken_over(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio_processor, "SEPARATION_LOCK_STALE_SEC", 1.0)
+    track_dir = tmp_path / "track_abcd1234"
+    lock_path = tmp_path / "track_abcd1234.lock"
+    # Left behind by a crashed process: never refreshed
+    lock_path.write_text("99999")
+    os.utime(lock_path, (time.time() - 5, time.time() - 5))
+    with audio_processor._single_flight(track_dir) as waited:
+        assert waited < 1.0
+        assert lock_path.read_text() == str(os.getpid())
+    assert not lock_path.exists()
+
+
+def test_live_lock_blocks_and_heartbeats(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio_processor, "SEPARATION_LOCK_STALE_SEC", 0.4)
+    track_dir = tmp_path / "track_abcd1234"
+    lock_path = tmp_path / "track_abcd1234.lock"
+    with audio_processor._single_flight(track_dir):
+        acquired = lock_path.stat().st_mtime
+        time.sleep(1.0)
+        # Refreshed while held, so other processes never see it as stale
+        assert lock_path.stat().st_mtime > acquired
+        assert time.time() - lock_path.stat().st_mtime < 0.4
+
+        waits = []
+        def contender():
+            with audio_processor._single_flight(track_dir) as waited:
+                waits.append(waited)
+        thread = threading.Thread(target=contender)
+        thread.start()
+        time.sleep(0.5)
+        assert not waits
+    thread.join(5)
+    assert waits and waits[0] >= 0.5
+
+
+def test_baseline_stem_folder_is_adopted_not_recomputed(tmp_path, monkeypatch):
+    from src import cache, utils
+    monkeypatch.setattr(cache, "CACHE_ROOT", tmp_path / "cache")
+    monkeypatch.setattr(utils, "HASH_MEMO_PATH", tmp_path / "hash_memo.json")
+    song = tmp_path / "My Song.wav"
+    sf.write(song, np.zeros((800, 2), dtype=np.float32), 8000)
+    # The layout the app wrote before manifests existed, incl. an empty placeholder stem
+    track_dir = cache.CACHE_ROOT / "htdemucs_6s" / f"My_Song_{utils.get_file_hash(song)[:8]}"
+    track_dir.mkdir(parents=True)
+    for name in ["vocals", "drums", "bass", "piano", "guitar", "other", "flute_and_wind", "indian_percussion"]:
+        sf.write(track_dir / f"{name}.wav", np.zeros((800, 2), dtype=np.float32), 8000)
+    (track_dir / "acoustic_guitar.wav").touch()
+
+    stems = audio_processor.find_cached_stems(song, "htdemucs_6s")
+    assert stems is not None and set(stems) == {"vocals", "drums", "bass", "piano", "guitar", "other"}
+    manifest = cache.read_manifest(track_dir)
+    assert set(manifest["stages"]) == {"demucs", "flute_and_wind", "indian_percussion"}
+    status = audio_processor.get_derived_stem_status(song, "htdemucs_6s")
+    assert status["flute_and_wind"][0] == "ready" and status["indian_percussion"][0] == "ready"
+    assert status["acoustic_guitar"][0] == "on_demand"
+
+    # Separating finds everything in place: Demucs never runs
+    monkeypatch.setattr(audio_processor, "get_separation_model", lambda name: pytest.fail("Demucs ran"))
+    assert audio_processor.separate_audio(song, "htdemucs_6s", derived=["flute_and_wind"])["flute_and_wind"].exists()
+    assert audio_processor.get_separation_stats()["cache_hit"]
+
+
+@pytest.fixture
+def separated(slow_separation):
+    """A song whose Demucs stems (all six, no derived ones) are in the cache."""
+    song, runs, started, release = slow_separation
+    release.set()
+    audio_processor.separate_audio(song, "fake", chunked=False)
+    return song
+
+
+@needs_ffmpeg
+def test_derived_stems_are_produced_on_demand_and_cached(separated):
+    from src import dsp
+    status = audio_processor.get_derived_stem_status(separated, "fake")
+    assert {name: state for name, (state, _) in status.items()} == {
+        "flute_and_wind": "on_demand", "indian_percussion": "on_demand", "acoustic_guitar": "on_demand"}
+
+    path = audio_processor.materialize_derived_stem(separated, "flute_and_wind", "fake")
+    assert path == status["flute_and_wind"][1] and path.stat().st_size > 0
+    assert audio_processor.get_derived_stem_status(separated, "fake")["flute_and_wind"][0] == "ready"
+    computed = dsp.get_hpss_stats()["computed"]
+    assert audio_processor.materialize_derived_stem(separated, "flute_and_wind", "fake") == path
+    assert dsp.get_hpss_stats()["computed"] == computed  # served from the cache
+
+    with pytest.raises(ValueError):
+        audio_processor.materialize_derived_stem(separated, "sitar", "fake")
+
+
+@needs_ffmpeg
+def test_derived_stems_need_their_inputs(separated):
+    (audio_processor._track_layout(separated, "fake")[1] / "guitar.wav").unlink()
+    assert audio_processor.get_derived_stem_status(separated, "fake")["acoustic_guitar"][0] == "unavailable"
+    assert audio_processor.materialize_derived_stem(separated, "acoustic_guitar", "fake") is None
+
+
+@needs_ffmpeg
+def test_derived_stems_without_the_cache(separated, monkeypatch):
+    from src import cache
+    monkeypatch.setattr(audio_processor, "USE_CACHE", False)
+    monkeypatch.setattr(cache, "USE_CACHE", False)
+    status = audio_processor.get_derived_stem_status(separated, "fake")
+    assert all(state == "on_demand" for state, _ in status.values())
+    path = audio_processor.materialize_derived_stem(separated, "acoustic_guitar", "fake")
+    assert path is not None and path.stat().st_size > 0
+    assert audio_processor.get_derived_stem_status(separated, "fake")["acoustic_guitar"][0] == "ready"
@@ -0,0 +1,91 @@
+"""Tests for windowed (parallel) transcription: stitched f0 tracks and notes match a single pass."""
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+import numpy as np
+import pytest
+
+try:
+    import soundfile as sf
+    from src import decode, transcription
+    from src.notes import segment_notes
+    HAS_AUDIO = True
+except ImportError:
+    HAS_AUDIO = False
+
+pytestmark = pytest.mark.skipif(not HAS_AUDIO, reason="librosa / soundfile not installed")
+
+SR = 22050
+FMIN, FMAX = 65.41, 2093.0
+
+
+@pytest.fixture
+def melody(tmp_path):
+    """12 s of held notes with vibrato and short gaps; several notes cross the 2 s window seams."""
+    parts = []
+    for i, midi in enumerate([62, 64, 66, 67, 69, 71, 73, 74]):
+        t = np.arange(int((1.7 if i % 3 else 2.9) * SR)) / SR
+        hz = 440 * 2 ** ((midi - 69) / 12) * 2 ** (0.3 / 12 * np.sin(2 * np.pi * 6 * t))
+        phase = 2 * np.pi * np.cumsum(hz) / SR
+        parts += [np.sin(phase) + 0.4 * np.sin(2 * phase), np.zeros(int(0.1 * SR))]
+    path = tmp_path / "melody.wav"
+    sf.write(path, 0.5 * np.concatenate(parts), SR)
+    decode.clear()
+    yield path
+    decode.clear()
+
+
+def _single_pass(path, duration=None):
+    y, sr = decode.load_audio(path, sr=SR, duration=duration)
+    return transcription.track_f0(y, sr, "yin", FMIN, FMAX)
+
+
+def test_plan_windows_tiles_the_track():
+    windows = transcription.plan_windows(10.0, window_sec=3.0, overlap_sec=1.0)
+    assert len(windows) == 4
+    for (_, core_end, _, _), (core_start, _, load_start, _) in zip(windows, windows[1:]):
+        assert core_start == core_end and load_start < core_start
+    assert windows[0][2] == 0 and windows[-1][1] is None and windows[-1][3] is None
+
+
+@pytest.mark.parametrize("duration", [None, 7.3])
+def test_stitched_yin_matches_single_pass(melody, duration):
+    expected = _single_pass(melody, duration)
+    decode.clear()
+    stitched = transcription.windowed_track(melody, "yin", FMIN, FMAX, duration=duration,
+                                            window_sec=2.0, overlap_sec=0.5, workers=1)
+    assert len(stitched["f0"]) == len(expected["f0"])
+    assert np.array_equal(stitched["voiced_flag"], expected["voiced_flag"])
+    assert np.allclose(stitched["f0"], expected["f0"], equal_nan=True)
+    # Windows never repeat, so none of them is kept in the decode cache
+    assert decode.get_decode_stats()["cached_bytes"] == 0
+
+
+def test_notes_across_seams_are_neither_split_nor_duplicated(melody):
+    expected = _single_pass(melody)
+    stitched = transcription.windowed_track(melody, "yin", FMIN, FMAX, window_sec=2.0, overlap_sec=0.5, workers=1)
+    notes = segment_notes(stitched["f0"], stitched["voiced_flag"], SR, hop_length=transcription.HOP_LENGTH)
+    assert notes[:, 2].tolist() == [62, 64, 66, 67, 69, 71, 73, 74]
+    assert np.allclose(notes, segment_notes(expected["f0"], expected["voiced_flag"], SR,
+                                            hop_length=transcription.HOP_LENGTH))
+    # The 2.9 s notes are longer than a window
+    assert (notes[:, 1] - notes[:, 0]).max() > 2.0
+
+
+def test_process_pool_matches_in_process(melody, monkeypatch):
+    monkeypatch.setattr(transcription, "TRANSCRIPTION_WORKERS", 2)
+    transcription.shutdown_pool()
+    serial = transcription.windowed_track(melody, "yin", FMIN, FMAX, window_sec=4.0, overlap_sec=0.5, workers=1)
+    pooled = transcription.windowed_track(melody, "yin", FMIN, FMAX, window_sec=4.0, overlap_sec=0.5)
+    assert transcription.get_transcription_stats()["workers"] == 2
+    pool = transcription._get_pool()[0]
+    # A call that asks for fewer workers shares the pool instead of restarting it
+    limited = transcription.windowed_track(melody, "yin", FMIN, FMAX, window_sec=2.0, overlap_sec=0.5, workers=2)
+    assert transcription._get_pool()[0] is pool
+    transcription.shutdown_pool()
+    assert np.allclose(serial["f0"], pooled["f0"], equal_nan=True)
+    assert np.allclose(serial["f0"], limited["f0"], equal_nan=True)
+
+
+def test_unknown_mode_rejected(melody):
+    with pytest.raises(ValueError):
+        transcription.windowed_track(melody, "crepe", FMIN, FMAX)